@@ -0,0 +1,95 @@
+"""
+End-to-end benchmark of the extraction scripts against the local stand-in API
+(es_server.py).
+
+Runs `virksomhed_api_call.main` (panel mode) and `financial_statements_api_call.main`
+and reports, per extractor, pages/sec, docs/sec, bytes received and peak RSS,
+plus rows and rows/sec for every panel table.
+
+Usage:
+    python bench_extraction.py --docs 2000
+    python bench_extraction.py --docs 5000 --page-size 500 --latency 0.05 --json bench_extraction.json
+"""
+
+import argparse
+import tempfile
+import contextlib
+import io
+
+from bench_utils import measure, print_report, write_report
+from es_server import start_server, reset_counters
+
+import virksomhed_api_call
+import financial_statements_api_call
+
+
+def _record_server(record, server):
+    counters = server.state["counters"]
+    record["pages"] = counters["pages"]
+    record["docs"] = counters["hits"]
+    record["bytes"] = counters["bytes"]
+
+
+def run(docs=1000, page_size=500, latency=0.0, failure_rate=0.0, output_mode="panel", quiet=True):
+    server, base_url = start_server(
+        docs={"cvr-permanent/virksomhed": docs, "offentliggoerelser": docs},
+        latency=latency, failure_rate=failure_rate,
+    )
+    scroll_endpoint = f"{base_url}/_search/scroll"
+    results = {}
+    output = io.StringIO() if quiet else None
+
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            reset_counters(server)
+            with measure(results, f"virksomhed ({output_mode})") as record:
+                with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+                    tables = virksomhed_api_call.main(
+                        company_data_api_endpoint=f"{base_url}/cvr-permanent/virksomhed/_search",
+                        scroll_api_endpoint=scroll_endpoint,
+                        company_data_folder_path=folder,
+                        size=page_size,
+                        year=2024,
+                        output_mode=output_mode,
+                    )
+                _record_server(record, server)
+
+            if isinstance(tables, dict):
+                seconds = results[f"virksomhed ({output_mode})"]["seconds"]
+                results["virksomhed panel rows"] = {
+                    name: {"rows": len(df), "rows_per_sec": len(df) / seconds} for name, df in tables.items()
+                }
+
+            reset_counters(server)
+            with measure(results, "financial_statements") as record:
+                with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+                    df = financial_statements_api_call.main(
+                        financial_statments_api_endpoint=f"{base_url}/offentliggoerelser/_search",
+                        scroll_api_endpoint=scroll_endpoint,
+                        fs_folder_path=folder,
+                        size=page_size,
+                        year=2020,
+                    )
+                _record_server(record, server)
+                record["rows"] = 0 if df is None else len(df)
+    finally:
+        server.shutdown()
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='End-to-end benchmark of the CVR extraction scripts')
+    parser.add_argument('--docs', type=int, default=1000, help='Documents per index (default: 1000)')
+    parser.add_argument('--page-size', type=int, default=500, help='Scroll page size (default: 500)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Server latency per request in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--mode', choices=['panel', 'wide', 'nested'], default='panel', help='virksomhed output mode')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the extraction scripts')
+    parser.add_argument('--json', help='Also write the report as JSON to this path')
+    args = parser.parse_args()
+
+    results = run(args.docs, args.page_size, args.latency, args.failure_rate, args.mode, quiet=not args.verbose)
+    print_report(results, f"Extraction benchmark: {args.docs} documents per index, page size {args.page_size}")
+    if args.json:
+        write_report(results, args.json)
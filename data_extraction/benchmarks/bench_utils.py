@@ -0,0 +1,69 @@
+"""
+Shared helpers for the benchmark scripts: peak RSS measurement, stage timing
+and report printing.
+"""
+
+import os
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+# Counts that get a derived per-second rate
+RATE_KEYS = ("docs", "facts", "rows", "pages", "bytes")
+
+# Make the extraction scripts in ../src importable
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+if SRC_PATH not in sys.path:
+    sys.path.insert(0, SRC_PATH)
+
+from run_metrics import reset_peak_rss, peak_rss_mb  # noqa: E402
+
+
+@contextmanager
+def measure(results, stage, **counts):
+    """
+    Time a benchmark stage and record its peak RSS.
+
+    The yielded dict can be filled with counts (docs, facts, rows, ...) inside
+    the block; per-second rates are derived for the RATE_KEYS counts when it exits.
+    """
+    reset_peak_rss()
+    record = dict(counts)
+    start = time.perf_counter()
+    yield record
+    elapsed = time.perf_counter() - start
+    record["seconds"] = elapsed
+    for key in RATE_KEYS:
+        if key in record:
+            record[f"{key}_per_sec"] = record[key] / elapsed if elapsed else float("inf")
+    record["peak_rss_mb"] = peak_rss_mb()
+    results[stage] = record
+
+
+def _format(value):
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    if isinstance(value, int) and not isinstance(value, bool):
+        return f"{value:,}"
+    return str(value)
+
+
+def print_report(results, title):
+    print(f"\n{'='*60}")
+    print(title)
+    print(f"{'='*60}")
+    for stage, record in results.items():
+        print(f"\n{stage}")
+        for key, value in record.items():
+            if isinstance(value, dict):
+                formatted = "  ".join(f"{k} {_format(v)}" for k, v in value.items())
+            else:
+                formatted = _format(value)
+            print(f"  {key:<28} {formatted}")
+
+
+def write_report(results, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nReport written to {path}")
@@ -0,0 +1,84 @@
+"""
+Benchmarks for the XBRL path of individual_statements_api_call.py against the
+local stand-in server, so parser and pivot changes can be checked for
+regressions without the live endpoints.
+
+Stages:
+1. fetch_xml                - download only
+2. parse_xml_content        - parse the downloaded documents (no network)
+3. process_urls_async       - fetch and parse together
+4. transform_to_wide_format - pivot the combined long frame
+
+Each stage reports docs/sec, facts/sec and peak RSS.
+
+Usage:
+    python bench_xbrl.py --docs 500 --size mixed
+    python bench_xbrl.py --docs 200 --size large --latency 0.02 --json bench_xbrl.json
+"""
+
+import asyncio
+import argparse
+import httpx
+import pandas as pd
+
+from bench_utils import measure, print_report, write_report
+from xbrl_fixtures import corpus_keys, corpus_url
+from xbrl_server import start_server
+
+import individual_statements_api_call as xbrl
+
+
+async def fetch_all(urls, max_in_flight):
+    semaphore = asyncio.Semaphore(max_in_flight)
+    async with httpx.AsyncClient() as client:
+        async def bounded_fetch(url):
+            async with semaphore:
+                return await xbrl.fetch_xml(client, url)
+        return await asyncio.gather(*[bounded_fetch(url) for url in urls])
+
+
+def run(docs=200, size="mixed", year=2020, latency=0.0, max_in_flight=50):
+    server, base_url = start_server(latency=latency)
+    keys = corpus_keys(docs, year, size)
+    urls = [corpus_url(base_url, cvr, key_year, key_size) for cvr, key_year, key_size in keys]
+    results = {}
+
+    try:
+        with measure(results, "fetch_xml", docs=len(urls)) as record:
+            fetched = asyncio.run(fetch_all(urls, max_in_flight))
+            contents = [content for _, content in fetched if content]
+            record["bytes"] = sum(len(content) for content in contents)
+
+        with measure(results, "parse_xml_content", docs=len(contents)) as record:
+            frames = [xbrl.parse_xml_content(content) for content in contents]
+            record["facts"] = sum(len(df) for df in frames)
+
+        with measure(results, "process_urls_async", docs=len(urls)) as record:
+            df_long = asyncio.run(xbrl.process_urls_async(urls))
+            record["facts"] = len(df_long)
+
+        with measure(results, "transform_to_wide_format", facts=len(df_long)) as record:
+            df_wide = xbrl.transform_to_wide_format(pd.concat(frames, ignore_index=True), year)
+            record["companies"] = len(df_wide)
+            record["columns"] = len(df_wide.columns)
+    finally:
+        server.shutdown()
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the XBRL fetch/parse/pivot path')
+    parser.add_argument('--docs', type=int, default=200, help='Number of documents (default: 200)')
+    parser.add_argument('--size', choices=['small', 'typical', 'large', 'mixed'], default='mixed',
+                        help='Document size (default: mixed)')
+    parser.add_argument('--year', type=int, default=2020)
+    parser.add_argument('--latency', type=float, default=0.0, help='Server latency per request in seconds')
+    parser.add_argument('--max-in-flight', type=int, default=50, help='Concurrent downloads for fetch_xml')
+    parser.add_argument('--json', help='Also write the report as JSON to this path')
+    args = parser.parse_args()
+
+    results = run(args.docs, args.size, args.year, args.latency, args.max_in_flight)
+    print_report(results, f"XBRL benchmark: {args.docs} {args.size} documents")
+    if args.json:
+        write_report(results, args.json)
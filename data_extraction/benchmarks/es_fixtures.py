@@ -0,0 +1,261 @@
+"""
+Synthetic CVR Elasticsearch documents for local benchmarking.
+
+Generates `Vrvirksomhed` (cvr-permanent/virksomhed), `VrproduktionsEnhed`
+(cvr-permanent/produktionsenhed) and `offentliggoerelser` hits with the nesting
+depth of the real API: temporal lists with `periode` blocks, addresses with
+`kommune`, employment series, and `deltagerRelation` with organisations ->
+medlemsData -> attributter -> vaerdier.
+
+Documents are deterministic for a given (index, doc number), so a benchmark
+run can be repeated exactly.
+"""
+
+import random
+from datetime import date, timedelta
+
+STATUSES = ["NORMAL", "UNDER FRIVILLIG LIKVIDATION", "OPLØST EFTER FRIVILLIG LIKVIDATION", "UNDER KONKURS"]
+LEGAL_FORMS = [(80, "APS", "Anpartsselskab"), (60, "A/S", "Aktieselskab"), (10, "ENK", "Enkeltmandsvirksomhed"),
+               (30, "I/S", "Interessentskab")]
+BRANCHES = [("620100", "Computerprogrammering"), ("702200", "Virksomhedsrådgivning og anden rådgivning om driftsledelse"),
+            ("949900", "Andre organisationer og foreninger i.a.n."), ("682040", "Udlejning af erhvervsejendomme"),
+            ("471120", "Supermarkeder"), ("412000", "Opførelse af bygninger")]
+KOMMUNER = [(101, "KØBENHAVN"), (751, "AARHUS"), (461, "ODENSE"), (851, "AALBORG"), (147, "FREDERIKSBERG")]
+ROLES = [("EJERREGISTER", "EJERANDEL_PROCENT"), ("LEDELSESORGAN", "FUNKTION"), ("REGISTER", "VALGFORM")]
+
+
+def _day(rng, start_year, end_year):
+    start = date(start_year, 1, 1)
+    return start + timedelta(days=rng.randrange((date(end_year, 12, 31) - start).days + 1))
+
+
+def _periods(rng, founded, last_year, count):
+    """Split the company's lifetime into `count` consecutive validity periods."""
+    cuts = sorted(day for day in {_day(rng, founded.year, last_year) for _ in range(count - 1)} if day > founded)
+    starts = [founded] + cuts
+    periods = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] - timedelta(days=1) if i + 1 < len(starts) else None
+        periods.append({"gyldigFra": start.isoformat(), "gyldigTil": end.isoformat() if end else None})
+    return periods
+
+
+def _updated(rng, period, last_year):
+    year = int((period["gyldigTil"] or f"{last_year}")[:4])
+    return f"{min(year, last_year)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:15:00.000+02:00"
+
+
+def _address(rng, period, last_year):
+    kommune_kode, kommune_navn = rng.choice(KOMMUNER)
+    return {
+        "landekode": "DK", "fritekst": None, "vejkode": rng.randint(1, 9999),
+        "vejnavn": f"Vej{rng.randint(1, 500)}", "husnummerFra": rng.randint(1, 200), "husnummerTil": None,
+        "bogstavFra": None, "bogstavTil": None, "etage": rng.choice([None, "1", "st"]), "sidedoer": None,
+        "conavn": None, "postboks": None, "postnummer": rng.randint(1000, 9990),
+        "postdistrikt": kommune_navn.title(), "bynavn": None, "adresseId": f"0a3f50{rng.randint(10**9, 10**10)}",
+        "sidstValideret": _updated(rng, period, last_year),
+        "kommune": {"kommuneKode": kommune_kode, "kommuneNavn": kommune_navn,
+                    "periode": {"gyldigFra": None, "gyldigTil": None}, "sidstOpdateret": None},
+        "periode": period, "sidstOpdateret": _updated(rng, period, last_year),
+    }
+
+
+def _employment(rng, founded, last_year, granularity):
+    rows = []
+    for year in range(max(founded.year, last_year - 10), last_year + 1):
+        steps = {"aar": [None], "kvartal": [1, 2, 3, 4], "maaned": list(range(1, 13))}[granularity]
+        for step in steps:
+            employees = rng.randint(0, 40)
+            row = {"aar": year, "antalInklusivEjere": employees + 1, "antalAarsvaerk": employees,
+                   "antalAnsatte": employees, "intervalKodeAntalInklusivEjere": "ANTAL_2_4",
+                   "intervalKodeAntalAarsvaerk": "ANTAL_1_1", "intervalKodeAntalAnsatte": "ANTAL_2_4",
+                   "sidstOpdateret": f"{year + 1}-03-01T00:00:00.000+01:00"}
+            if granularity == "kvartal":
+                row["kvartal"] = step
+            if granularity == "maaned":
+                row["maaned"] = step
+            rows.append(row)
+    return rows
+
+
+def _deltager_relation(rng, doc_number, founded, last_year):
+    """Participants are persons or, 30% of the time, other generated companies (so ownership chains exist)."""
+    relations = []
+    for _ in range(rng.randint(1, 6)):
+        organisationer = []
+        for hovedtype, attribute_type in rng.sample(ROLES, rng.randint(1, 2)):
+            period = _periods(rng, founded, last_year, 1)[0]
+            value = str(rng.choice([0.1, 0.25, 0.5, 1.0])) if attribute_type == "EJERANDEL_PROCENT" else "DIREKTØR"
+            organisationer.append({
+                "enhedsNummerOrganisation": rng.randint(10**9, 10**10),
+                "hovedtype": hovedtype,
+                "organisationsNavn": [{"navn": hovedtype.title(), "periode": period}],
+                "medlemsData": [{"attributter": [{
+                    "type": attribute_type, "vaerditype": "string", "sekvensnr": 0,
+                    "vaerdier": [{"vaerdi": value, "periode": period, "sidstOpdateret": _updated(rng, period, last_year)}],
+                    "periode": period, "sidstOpdateret": _updated(rng, period, last_year),
+                }]}],
+                "periode": period, "sidstOpdateret": _updated(rng, period, last_year),
+            })
+        is_company = rng.random() < 0.3
+        owner_doc = rng.randrange(doc_number + 1, doc_number + 1000)
+        relations.append({
+            "deltager": {"enhedsNummer": 4000000000 + owner_doc if is_company else rng.randint(4500000000, 4999999999),
+                         "enhedstype": "VIRKSOMHED" if is_company else "PERSON",
+                         "forretningsnoegle": 10000000 + owner_doc if is_company else None,
+                         "navne": [{"navn": f"Deltager {rng.randint(1, 10**6)}", "periode": _periods(rng, founded, last_year, 1)[0]}],
+                         "sidstOpdateret": f"{last_year}-01-01T00:00:00.000+01:00"},
+            "kontorsteder": [],
+            "organisationer": organisationer,
+        })
+    return relations
+
+
+def generate_virksomhed(doc_number, last_year=2024):
+    """Generate one cvr-permanent/virksomhed hit."""
+    rng = random.Random(f"virksomhed-{doc_number}")
+    cvr = 10000000 + doc_number
+    founded = _day(rng, 1950, last_year)
+
+    def temporal(count, make):
+        return [make(period) for period in _periods(rng, founded, last_year, count)]
+
+    navne = temporal(rng.randint(1, 3), lambda p: {"navn": f"Virksomhed {doc_number} ApS", "periode": p,
+                                                   "sidstOpdateret": _updated(rng, p, last_year)})
+    adresser = temporal(rng.randint(1, 4), lambda p: _address(rng, p, last_year))
+    branches = {field: temporal(rng.randint(1, 2), lambda p: dict(zip(["branchekode", "branchetekst"], rng.choice(BRANCHES)),
+                                                                   periode=p, sidstOpdateret=_updated(rng, p, last_year)))
+                for field in ["hovedbranche", "bibranche1", "bibranche2", "bibranche3"]}
+    status = temporal(rng.randint(1, 2), lambda p: {"status": rng.choice(STATUSES), "periode": p,
+                                                     "sidstOpdateret": _updated(rng, p, last_year)})
+    form_code, form_short, form_long = rng.choice(LEGAL_FORMS)
+    forms = temporal(1, lambda p: {"virksomhedsformkode": form_code, "kortBeskrivelse": form_short,
+                                   "langBeskrivelse": form_long, "ansvarligDataleverandoer": "E&S",
+                                   "periode": p, "sidstOpdateret": _updated(rng, p, last_year)})
+    contact = lambda p: {"kontaktoplysning": f"{rng.randint(10**7, 10**8)}", "hemmelig": False,
+                         "periode": p, "sidstOpdateret": _updated(rng, p, last_year)}
+    attributter = [{"sekvensnr": 0, "type": attribute_type, "vaerditype": "string",
+                    "vaerdier": temporal(1, lambda p: {"vaerdi": value, "periode": p,
+                                                        "sidstOpdateret": _updated(rng, p, last_year)}),
+                    "periode": _periods(rng, founded, last_year, 1)[0], "sidstOpdateret": f"{last_year}-01-01T00:00:00.000+01:00"}
+                   for attribute_type, value in [("KAPITAL", "40000.0"), ("KAPITALVALUTA", "DKK"),
+                                                 ("REGNSKABSÅR_START", "--01-01"), ("REGNSKABSÅR_SLUT", "--12-31"),
+                                                 ("FORMÅL", "Selskabets formål er at drive virksomhed.")]]
+    sidst_opdateret = f"{last_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T08:00:00.000+01:00"
+
+    source = {"Vrvirksomhed": {
+        "cvrNummer": cvr, "enhedsNummer": 4000000000 + doc_number, "enhedstype": "VIRKSOMHED",
+        "reklamebeskyttet": rng.random() < 0.2, "brancheAnsvarskode": None, "dataAdgang": 0,
+        "fejlRegistreret": False, "fejlVedIndlaesning": False, "fejlBeskrivelse": None,
+        "samtId": rng.randint(10**6, 10**7), "virkningsAktoer": "System",
+        "sidstIndlaest": sidst_opdateret, "sidstOpdateret": sidst_opdateret, "naermesteFremtidigeDato": None,
+        "navne": navne, "binavne": temporal(rng.randint(0, 2) or 1, lambda p: {"navn": f"Binavn {doc_number}", "periode": p,
+                                                                             "sidstOpdateret": _updated(rng, p, last_year)}),
+        "beliggenhedsadresse": adresser, "postadresse": adresser[-1:],
+        **branches,
+        "aarsbeskaeftigelse": _employment(rng, founded, last_year, "aar"),
+        "kvartalsbeskaeftigelse": _employment(rng, founded, last_year, "kvartal"),
+        "maanedsbeskaeftigelse": _employment(rng, founded, last_year, "maaned"),
+        "virksomhedsstatus": status, "virksomhedsform": forms,
+        "livsforloeb": temporal(1, lambda p: {"periode": p, "sidstOpdateret": _updated(rng, p, last_year)}),
+        "deltagerRelation": _deltager_relation(rng, doc_number, founded, last_year),
+        "attributter": attributter,
+        "regNummer": [], "telefonNummer": temporal(1, contact), "telefaxNummer": [],
+        "elektroniskPost": temporal(1, contact), "hjemmeside": [],
+        "virksomhedMetadata": {
+            "nyesteNavn": navne[-1], "nyesteBeliggenhedsadresse": adresser[-1],
+            "nyesteHovedbranche": branches["hovedbranche"][-1], "nyesteVirksomhedsform": forms[-1],
+            "nyesteStatus": {"statuskode": 1, "statustekst": status[-1]["status"], "kreditoplysningkode": None,
+                             "kreditoplysningtekst": None, "periode": status[-1]["periode"], "sidstOpdateret": None},
+            "sammensatStatus": "Normal", "stiftelsesDato": founded.isoformat(),
+            "virkningsDato": founded.isoformat(), "antalPenheder": rng.randint(1, 5),
+        },
+    }}
+    return {"_index": "cvr-permanent-virksomhed", "_type": "_doc", "_id": str(4000000000 + doc_number),
+            "_score": None, "_source": source}
+
+
+def generate_produktionsenhed(doc_number, last_year=2024):
+    """
+    Generate one cvr-permanent/produktionsenhed hit.
+
+    P-units belong to the generated companies (about three per company) and may have
+    moved between companies, so virksomhedsrelation has one or two periods.
+    """
+    rng = random.Random(f"produktionsenhed-{doc_number}")
+    founded = _day(rng, 1970, last_year)
+    cvr_numbers = [10000000 + doc_number // 3]
+    if rng.random() < 0.1:
+        cvr_numbers.insert(0, 10000000 + rng.randrange(10**6))
+
+    def temporal(count, make):
+        return [make(period) for period in _periods(rng, founded, last_year, count)]
+
+    navne = temporal(rng.randint(1, 2), lambda p: {"navn": f"Produktionsenhed {doc_number}", "periode": p,
+                                                   "sidstOpdateret": _updated(rng, p, last_year)})
+    adresser = temporal(rng.randint(1, 3), lambda p: _address(rng, p, last_year))
+    branches = {field: temporal(rng.randint(1, 2), lambda p: dict(zip(["branchekode", "branchetekst"], rng.choice(BRANCHES)),
+                                                                   periode=p, sidstOpdateret=_updated(rng, p, last_year)))
+                for field in ["hovedbranche", "bibranche1", "bibranche2", "bibranche3"]}
+    relations = [{"cvrNummer": cvr, "periode": period, "sidstOpdateret": _updated(rng, period, last_year)}
+                 for cvr, period in zip(cvr_numbers, _periods(rng, founded, last_year, len(cvr_numbers)))]
+    contact = lambda p: {"kontaktoplysning": f"{rng.randint(10**7, 10**8)}", "hemmelig": False,
+                         "periode": p, "sidstOpdateret": _updated(rng, p, last_year)}
+    sidst_opdateret = f"{last_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T08:00:00.000+01:00"
+    aarsbeskaeftigelse = _employment(rng, founded, last_year, "aar")
+
+    source = {"VrproduktionsEnhed": {
+        "pNummer": 1000000000 + doc_number, "enhedsNummer": 4100000000 + doc_number, "enhedstype": "PRODUKTIONSENHED",
+        "reklamebeskyttet": rng.random() < 0.2, "dataAdgang": 0, "fejlRegistreret": False,
+        "fejlVedIndlaesning": False, "fejlBeskrivelse": None, "samtId": rng.randint(10**6, 10**7),
+        "virkningsAktoer": "System", "sidstIndlaest": sidst_opdateret, "sidstOpdateret": sidst_opdateret,
+        "naermesteFremtidigeDato": None,
+        "navne": navne, "beliggenhedsadresse": adresser, "postadresse": adresser[-1:],
+        **branches,
+        "aarsbeskaeftigelse": aarsbeskaeftigelse,
+        "kvartalsbeskaeftigelse": _employment(rng, founded, last_year, "kvartal"),
+        "livsforloeb": temporal(1, lambda p: {"periode": p, "sidstOpdateret": _updated(rng, p, last_year)}),
+        "virksomhedsrelation": relations,
+        "telefonNummer": temporal(1, contact), "telefaxNummer": [], "elektroniskPost": temporal(1, contact),
+        "hjemmeside": [], "deltagerRelation": [], "attributter": [],
+        "produktionsEnhedMetadata": {
+            "nyesteNavn": navne[-1], "nyesteBeliggenhedsadresse": adresser[-1],
+            "nyesteHovedbranche": branches["hovedbranche"][-1], "nyesteCvrNummerRelation": cvr_numbers[-1],
+            "nyesteKontaktoplysninger": [f"{rng.randint(10**7, 10**8)}"],
+            "nyesteAarsbeskaeftigelse": aarsbeskaeftigelse[-1] if aarsbeskaeftigelse else None,
+            "sammensatStatus": "Aktiv",
+        },
+    }}
+    return {"_index": "cvr-permanent-produktionsenhed", "_type": "_doc", "_id": str(4100000000 + doc_number),
+            "_score": None, "_source": source}
+
+
+def generate_offentliggoerelse(doc_number, last_year=2024):
+    """Generate one offentliggoerelser (published financial statement) hit."""
+    rng = random.Random(f"offentliggoerelse-{doc_number}")
+    year = rng.randint(2012, last_year)
+    cvr = 10000000 + rng.randint(0, 10**6)
+    base_url = f"http://regnskaber.virk.dk/{rng.randint(10**7, 10**8)}/{doc_number}"
+    source = {
+        "cvrNummer": cvr,
+        "indlaesningsId": None,
+        "sagsNummer": f"X{doc_number}",
+        "offentliggoerelsestype": "regnskab",
+        "offentliggoerelsesTidspunkt": f"{year + 1}-05-{rng.randint(1, 28):02d}T10:00:00.000Z",
+        "omgoerelse": rng.random() < 0.02,
+        "regnskab": {"regnskabsperiode": {"startDato": f"{year}-01-01", "slutDato": f"{year}-12-31"}},
+        "dokumenter": [
+            {"dokumentUrl": f"{base_url}/aarsrapport.xml", "dokumentMimeType": "application/xml", "dokumentType": "AARSRAPPORT"},
+            {"dokumentUrl": f"{base_url}/aarsrapport.pdf", "dokumentMimeType": "application/pdf", "dokumentType": "AARSRAPPORT"},
+            {"dokumentUrl": f"{base_url}/aarsrapport.xhtml", "dokumentMimeType": "application/xhtml+xml", "dokumentType": "AARSRAPPORT"},
+        ],
+    }
+    return {"_index": "offentliggoerelser", "_type": "_doc", "_id": str(doc_number), "_score": None, "_source": source}
+
+
+# Index path (as in the API URL) -> document generator
+INDEX_GENERATORS = {
+    "cvr-permanent/virksomhed": generate_virksomhed,
+    "cvr-permanent/produktionsenhed": generate_produktionsenhed,
+    "offentliggoerelser": generate_offentliggoerelse,
+}
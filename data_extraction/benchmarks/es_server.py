@@ -0,0 +1,223 @@
+"""
+Local stand-in for the CVR Elasticsearch distribution API.
+
+Implements the subset of Elasticsearch the extraction scripts use:
+
+- POST {index}/_search[?scroll=5m]   size, sort, track_total_hits, slice, search_after
+- POST /_search/scroll                continue a scroll
+- DELETE /_search/scroll              clear scrolls ({"scroll_id": [...]} body)
+
+Documents come from es_fixtures.py. The query clause is not evaluated: every
+search sees the whole generated index. Latency and failure rate are
+configurable, and the server counts pages and bytes served so benchmarks can
+report throughput.
+
+Usage:
+    python es_server.py --port 9200 --docs 5000 --latency 0.05
+
+    # or from Python
+    server, base_url = start_server(docs={"cvr-permanent/virksomhed": 5000})
+    ...
+    server.shutdown()
+"""
+
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from es_fixtures import INDEX_GENERATORS
+
+# Elasticsearch reports at most this many hits unless track_total_hits is true
+DEFAULT_TRACK_TOTAL_HITS = 10000
+
+
+class EsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method):
+        state = self.server.state
+        body = self._read_body()
+        if state["latency"]:
+            time.sleep(state["latency"])
+
+        url = urlparse(self.path)
+        path = url.path.strip("/")
+
+        if path == "_search/scroll" and method == "DELETE":
+            self._clear_scroll(body)
+            return
+        if state["failure_rate"] and random.random() < state["failure_rate"]:
+            self._count("failures")
+            self._send_json(503, {"error": "simulated failure", "status": 503})
+            return
+        if path == "_search/scroll":
+            self._continue_scroll(body)
+            return
+        if path.endswith("/_search"):
+            index = path[:-len("/_search")]
+            if index in INDEX_GENERATORS:
+                self._search(index, body, parse_qs(url.query).get("scroll", [None])[0])
+                return
+        self._send_json(404, {"error": f"no handler for {method} /{path}", "status": 404})
+
+    # --- Endpoints ---
+    def _search(self, index, body, scroll):
+        state = self.server.state
+        doc_numbers = range(state["docs"].get(index, 0))
+        if "slice" in body:
+            slice_id, slice_max = body["slice"]["id"], body["slice"]["max"]
+            doc_numbers = [n for n in doc_numbers if n % slice_max == slice_id]
+        doc_numbers = list(doc_numbers)
+
+        start = 0
+        if body.get("search_after"):
+            after = body["search_after"][0]
+            start = next((i for i, n in enumerate(doc_numbers) if n > after), len(doc_numbers))
+
+        context = {"index": index, "doc_numbers": doc_numbers, "position": start,
+                   "size": body.get("size", 10), "sort": "sort" in body,
+                   "track_total_hits": body.get("track_total_hits", False)}
+        response = self._page(context)
+        if scroll:
+            scroll_id = uuid.uuid4().hex
+            with state["lock"]:
+                state["scrolls"][scroll_id] = context
+            response["_scroll_id"] = scroll_id
+        self._send_json(200, response)
+
+    def _continue_scroll(self, body):
+        state = self.server.state
+        with state["lock"]:
+            context = state["scrolls"].get(body.get("scroll_id"))
+        if context is None:
+            self._send_json(404, {"error": "search_context_missing_exception", "status": 404})
+            return
+        response = self._page(context)
+        response["_scroll_id"] = body["scroll_id"]
+        self._send_json(200, response)
+
+    def _clear_scroll(self, body):
+        state = self.server.state
+        scroll_ids = body.get("scroll_id", [])
+        if isinstance(scroll_ids, str):
+            scroll_ids = [scroll_ids]
+        with state["lock"]:
+            freed = sum(state["scrolls"].pop(scroll_id, None) is not None for scroll_id in scroll_ids)
+            state["counters"]["scrolls_cleared"] += freed
+        self._send_json(200, {"succeeded": True, "num_freed": freed})
+
+    # --- Helpers ---
+    def _page(self, context):
+        generate = INDEX_GENERATORS[context["index"]]
+        doc_numbers = context["doc_numbers"]
+        position = context["position"]
+        page_numbers = doc_numbers[position:position + context["size"]]
+        context["position"] = position + len(page_numbers)
+
+        hits = []
+        for n in page_numbers:
+            hit = generate(n)
+            if context["sort"]:
+                hit["sort"] = [n]
+            hits.append(hit)
+
+        total = len(doc_numbers)
+        if context["track_total_hits"] is True:
+            total_hits = {"value": total, "relation": "eq"}
+        else:
+            total_hits = {"value": min(total, DEFAULT_TRACK_TOTAL_HITS),
+                          "relation": "gte" if total > DEFAULT_TRACK_TOTAL_HITS else "eq"}
+        self._count("pages")
+        self._count("hits", len(hits))
+        return {"took": 1, "timed_out": False, "hits": {"total": total_hits, "max_score": None, "hits": hits}}
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _count(self, key, amount=1):
+        with self.server.state["lock"]:
+            self.server.state["counters"][key] += amount
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._count("bytes", len(body))
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host="127.0.0.1", port=0, docs=None, latency=0.0, failure_rate=0.0):
+    """
+    Start the stand-in API in a background thread.
+
+    Args:
+        port: 0 picks a free port
+        docs: Number of documents per index path, e.g. {"cvr-permanent/virksomhed": 5000}
+        latency: Seconds to sleep before answering each request
+        failure_rate: Fraction of search/scroll requests answered with 503
+
+    Returns:
+        (server, base_url). server.state["counters"] holds pages, hits, bytes,
+        failures and scrolls_cleared; call server.shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), EsHandler)
+    server.daemon_threads = True
+    server.state = {
+        "docs": docs or {index: 1000 for index in INDEX_GENERATORS},
+        "latency": latency,
+        "failure_rate": failure_rate,
+        "scrolls": {},
+        "lock": threading.Lock(),
+        "counters": {"pages": 0, "hits": 0, "bytes": 0, "failures": 0, "scrolls_cleared": 0},
+    }
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def reset_counters(server):
+    with server.state["lock"]:
+        for key in server.state["counters"]:
+            server.state["counters"][key] = 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve a local stand-in for the CVR Elasticsearch API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9200)
+    parser.add_argument('--docs', type=int, default=1000, help='Documents per index (default: 1000)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of latency per request')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.host, args.port, {index: args.docs for index in INDEX_GENERATORS},
+                                    args.latency, args.failure_rate)
+    print(f"Serving {', '.join(f'{base_url}/{index}/_search' for index in INDEX_GENERATORS)}")
+    print(f"Scroll endpoint: {base_url}/_search/scroll")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,262 @@
+"""
+Synthetic Danish XBRL instance documents for local benchmarking.
+
+The live XBRL endpoints are shut down, so this module generates realistic
+stand-ins: annual reports in the `gsd` (general submission data), `fsa`
+(financial statements) and `cmn` (common dimensions) namespaces, with current
+and prior-year duration/instant contexts, DKK/pure/shares units and, for the
+large consolidated size, consolidated and solo scenarios plus segment contexts.
+
+Documents are deterministic for a given (cvr, year, size), so the same corpus
+can be regenerated on any machine.
+
+Usage:
+    # Write 200 typical documents and a matching metadata file
+    python xbrl_fixtures.py --out ./xbrl_corpus --count 200 --size typical --year 2020
+"""
+
+import os
+import random
+import argparse
+import pandas as pd
+from functools import lru_cache
+
+NAMESPACES = {
+    "xbrli": "http://www.xbrl.org/2003/instance",
+    "link": "http://www.xbrl.org/2003/linkbase",
+    "xlink": "http://www.w3.org/1999/xlink",
+    "xbrldi": "http://xbrl.org/2006/xbrldi",
+    "iso4217": "http://www.xbrl.org/2003/iso4217",
+    "gsd": "http://xbrl.dcca.dk/gsd",
+    "fsa": "http://xbrl.dcca.dk/fsa",
+    "cmn": "http://xbrl.dcca.dk/cmn",
+}
+
+# Document shape per size: number of extra note tags, segment contexts, consolidated scope
+SIZES = {
+    "small": {"extra_tags": 15, "segments": 0, "consolidated": False},
+    "typical": {"extra_tags": 200, "segments": 2, "consolidated": False},
+    "large": {"extra_tags": 1200, "segments": 10, "consolidated": True},
+}
+
+GSD_TEXT_TAGS = [
+    "NameOfReportingEntity",
+    "AddressOfReportingEntityStreetName",
+    "AddressOfReportingEntityPostCodeIdentifier",
+    "AddressOfReportingEntityDistrictName",
+    "InformationOnTypeOfSubmittedReport",
+    "NameAndSurnameOfChairmanOfGeneralMeeting",
+    "IdentificationNumberCvrOfAuditFirm",
+    "NameOfAuditFirm",
+]
+
+GSD_DATE_TAGS = [
+    "ReportingPeriodStartDate",
+    "ReportingPeriodEndDate",
+    "DateOfGeneralMeeting",
+    "DateOfApprovalOfAnnualReport",
+]
+
+# (tag, scale) for monetary duration facts
+FSA_INCOME_TAGS = [
+    ("Revenue", 10_000_000),
+    ("GrossProfitLoss", 4_000_000),
+    ("EmployeeBenefitsExpense", 2_500_000),
+    ("DepreciationAmortisationExpenseAndImpairmentLossesOfPropertyPlantAndEquipmentAndIntangibleAssetsRecognisedInProfitOrLoss", 300_000),
+    ("ProfitLossFromOrdinaryOperatingActivities", 900_000),
+    ("OtherFinanceIncome", 50_000),
+    ("OtherFinanceExpenses", 80_000),
+    ("ProfitLossFromOrdinaryActivitiesBeforeTax", 850_000),
+    ("TaxExpenseOnOrdinaryActivities", 190_000),
+    ("ProfitLoss", 660_000),
+    ("ProposedDividendRecognisedInEquity", 200_000),
+]
+
+# (tag, scale) for monetary instant facts
+FSA_BALANCE_TAGS = [
+    ("PropertyPlantAndEquipment", 3_000_000),
+    ("NoncurrentAssets", 3_500_000),
+    ("Inventories", 800_000),
+    ("ShorttermTradeReceivables", 1_200_000),
+    ("CashAndCashEquivalents", 700_000),
+    ("CurrentAssets", 2_700_000),
+    ("Assets", 6_200_000),
+    ("ContributedCapital", 50_000),
+    ("RetainedEarnings", 2_000_000),
+    ("Equity", 2_050_000),
+    ("Provisions", 150_000),
+    ("LongtermLiabilitiesOtherThanProvisions", 1_500_000),
+    ("ShorttermLiabilitiesOtherThanProvisions", 2_500_000),
+    ("LiabilitiesOtherThanProvisions", 4_000_000),
+    ("LiabilitiesAndEquity", 6_200_000),
+]
+
+FSA_PURE_TAGS = ["AverageNumberOfEmployees"]
+
+
+def _header():
+    declarations = " ".join(f'xmlns:{prefix}="{uri}"' for prefix, uri in NAMESPACES.items())
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<xbrli:xbrl {declarations}>\n'
+        '<link:schemaRef xlink:type="simple" '
+        'xlink:href="http://archprod.service.eogs.dk/taxonomy/20200101/entryDanishGAAPBalanceSheetAccountFormIncomeStatementByNatureIncludingManagementsReviewStatisticsAndTax20200101.xsd"/>\n'
+    )
+
+
+def _context(context_id, cvr, period, scenario=None):
+    scenario_xml = f"<xbrli:scenario>{scenario}</xbrli:scenario>" if scenario else ""
+    return (
+        f'<xbrli:context id="{context_id}">'
+        f'<xbrli:entity><xbrli:identifier scheme="http://www.dcca.dk/cvr">{cvr}</xbrli:identifier></xbrli:entity>'
+        f'<xbrli:period>{period}</xbrli:period>{scenario_xml}</xbrli:context>\n'
+    )
+
+
+def _duration(year):
+    return f"<xbrli:startDate>{year}-01-01</xbrli:startDate><xbrli:endDate>{year}-12-31</xbrli:endDate>"
+
+
+def _instant(year):
+    return f"<xbrli:instant>{year}-12-31</xbrli:instant>"
+
+
+def _fact(prefix, tag, context_id, value, unit=None, decimals=None):
+    unit_attr = f' unitRef="{unit}"' if unit else ""
+    decimals_attr = f' decimals="{decimals}"' if decimals is not None else ""
+    return f'<{prefix}:{tag} contextRef="{context_id}"{unit_attr}{decimals_attr}>{value}</{prefix}:{tag}>\n'
+
+
+@lru_cache(maxsize=4096)
+def generate_instance(cvr, year, size="typical"):
+    """
+    Generate one XBRL instance document.
+
+    Args:
+        cvr: CVR number of the reporting entity (str or int)
+        year: Reporting year; prior-year comparatives use year - 1
+        size: "small", "typical" or "large" (consolidated group report)
+
+    Returns:
+        The document as UTF-8 bytes
+    """
+    shape = SIZES[size]
+    rng = random.Random(f"{cvr}-{year}-{size}")
+    cvr = str(cvr)
+    scale = rng.uniform(0.2, 5.0) * (20 if shape["consolidated"] else 1)
+
+    parts = [_header()]
+
+    # Contexts: scope x (current, prior) x (duration, instant), plus segment breakdowns
+    scopes = ["consolidated", "solo"] if shape["consolidated"] else [None]
+    duration_contexts, instant_contexts = [], []
+    for scope in scopes:
+        scenario = None
+        if scope:
+            member = "ConsolidatedMember" if scope == "consolidated" else "SoloMember"
+            scenario = f'<xbrldi:explicitMember dimension="cmn:ConsolidatedSoloDimension">cmn:{member}</xbrldi:explicitMember>'
+        suffix = f"_{scope}" if scope else ""
+        for label, period_year in [("c", year), ("p", year - 1)]:
+            duration_id, instant_id = f"{label}d{suffix}", f"{label}i{suffix}"
+            parts.append(_context(duration_id, cvr, _duration(period_year), scenario))
+            parts.append(_context(instant_id, cvr, _instant(period_year), scenario))
+            duration_contexts.append(duration_id)
+            instant_contexts.append(instant_id)
+
+    segment_contexts = []
+    for segment in range(shape["segments"]):
+        context_id = f"seg{segment}"
+        scenario = (f'<xbrldi:explicitMember dimension="fsa:SegmentsAxis">'
+                    f'fsa:Segment{segment}Member</xbrldi:explicitMember>')
+        parts.append(_context(context_id, cvr, _duration(year), scenario))
+        segment_contexts.append(context_id)
+
+    # Units
+    parts.append('<xbrli:unit id="DKK"><xbrli:measure>iso4217:DKK</xbrli:measure></xbrli:unit>\n')
+    parts.append('<xbrli:unit id="pure"><xbrli:measure>xbrli:pure</xbrli:measure></xbrli:unit>\n')
+    parts.append('<xbrli:unit id="shares"><xbrli:measure>xbrli:shares</xbrli:measure></xbrli:unit>\n')
+
+    # General submission data (text and dates, current duration context)
+    current = duration_contexts[0]
+    parts.append(_fact("gsd", "IdentificationNumberCvrOfReportingEntity", current, cvr))
+    for tag in GSD_TEXT_TAGS:
+        parts.append(_fact("gsd", tag, current, f"{tag} {rng.randint(1, 999)}"))
+    for tag in GSD_DATE_TAGS:
+        parts.append(_fact("gsd", tag, current, f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"))
+
+    # Income statement and balance sheet for every scope and both years
+    for context_id in duration_contexts:
+        for tag, tag_scale in FSA_INCOME_TAGS:
+            parts.append(_fact("fsa", tag, context_id, round(tag_scale * scale * rng.uniform(0.7, 1.3)), "DKK", 0))
+        for tag in FSA_PURE_TAGS:
+            parts.append(_fact("fsa", tag, context_id, round(rng.uniform(1, 80) * scale, 2), "pure", 2))
+    for context_id in instant_contexts:
+        for tag, tag_scale in FSA_BALANCE_TAGS:
+            parts.append(_fact("fsa", tag, context_id, round(tag_scale * scale * rng.uniform(0.7, 1.3)), "DKK", -3))
+        parts.append(_fact("fsa", "ShareCapitalNumberOfShares", context_id, rng.randint(1, 500) * 1000, "shares", 0))
+
+    # Notes: extra monetary and text disclosures spread over contexts
+    note_contexts = duration_contexts + instant_contexts + segment_contexts
+    for n in range(shape["extra_tags"]):
+        context_id = note_contexts[n % len(note_contexts)]
+        if n % 5 == 4:
+            parts.append(_fact("fsa", f"DisclosureOfNote{n}", context_id, f"Note text {n} " * rng.randint(1, 20)))
+        else:
+            parts.append(_fact("fsa", f"NoteAmount{n}", context_id, round(rng.uniform(1e3, 1e6) * scale), "DKK", 0))
+
+    parts.append("</xbrli:xbrl>\n")
+    return "".join(parts).encode("utf-8")
+
+
+def corpus_keys(count, year=2020, size="typical", first_cvr=10000000):
+    """Return (cvr, year, size) keys for a corpus; size "mixed" cycles 70% typical, 25% small, 5% large."""
+    if size == "mixed":
+        cycle = ["typical"] * 14 + ["small"] * 5 + ["large"]
+        return [(str(first_cvr + i), year, cycle[i % len(cycle)]) for i in range(count)]
+    return [(str(first_cvr + i), year, size) for i in range(count)]
+
+
+def corpus_url(base_url, cvr, year, size):
+    """URL of one generated document on the local stand-in server (see xbrl_server.py)."""
+    return f"{base_url}/xbrl/{size}/{cvr}_{year}.xml"
+
+
+def write_metadata(path, base_url, keys):
+    """Write a financial_statements-style metadata file pointing at the stand-in server."""
+    df = pd.DataFrame({
+        "regnskabsperiode_slutDato": [f"{year}-12-31" for _, year, _ in keys],
+        "AARSRAPPORT_xml": [corpus_url(base_url, cvr, year, size) for cvr, year, size in keys],
+    })
+    df.to_parquet(path, index=False)
+    return path
+
+
+def write_corpus(out_dir, keys):
+    """Write documents to out_dir/{size}/{cvr}_{year}.xml and return the number of bytes written."""
+    total_bytes = 0
+    for cvr, year, size in keys:
+        folder = os.path.join(out_dir, "xbrl", size)
+        os.makedirs(folder, exist_ok=True)
+        content = generate_instance(cvr, year, size)
+        with open(os.path.join(folder, f"{cvr}_{year}.xml"), "wb") as f:
+            f.write(content)
+        total_bytes += len(content)
+    return total_bytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate synthetic Danish XBRL instance documents')
+    parser.add_argument('--out', required=True, help='Output folder')
+    parser.add_argument('--count', type=int, default=100, help='Number of documents (default: 100)')
+    parser.add_argument('--size', choices=list(SIZES) + ['mixed'], default='mixed',
+                        help='Document size (default: mixed)')
+    parser.add_argument('--year', type=int, default=2020, help='Reporting year (default: 2020)')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000',
+                        help='Server base URL written to the metadata file (default: http://127.0.0.1:8000)')
+    args = parser.parse_args()
+
+    keys = corpus_keys(args.count, args.year, args.size)
+    total_bytes = write_corpus(args.out, keys)
+    metadata_path = write_metadata(os.path.join(args.out, "financial_statements.parquet"), args.base_url, keys)
+    print(f"Wrote {len(keys)} documents ({total_bytes / 1e6:.1f} MB) to {args.out}")
+    print(f"Metadata: {metadata_path}")
@@ -0,0 +1,92 @@
+"""
+Local HTTP stand-in for the (shut down) XBRL document endpoints.
+
+Serves the documents of xbrl_fixtures.py at /xbrl/{size}/{cvr}_{year}.xml,
+generated on the fly, with optional per-request latency and failure rate.
+
+Usage:
+    python xbrl_server.py --port 8000 --latency 0.05
+
+    # or from Python
+    server, base_url = start_server()
+    ...
+    server.shutdown()
+"""
+
+import re
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from xbrl_fixtures import SIZES, generate_instance
+
+PATH_PATTERN = re.compile(r"^/xbrl/(?P<size>\w+)/(?P<cvr>\d+)_(?P<year>\d{4})\.xml$")
+
+
+class XbrlHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        settings = self.server.settings
+        if settings["latency"]:
+            time.sleep(settings["latency"])
+
+        match = PATH_PATTERN.match(self.path)
+        if match is None or match["size"] not in SIZES:
+            self._send(404, b"Not found")
+            return
+        if settings["failure_rate"] and random.random() < settings["failure_rate"]:
+            self._send(503, b"Service unavailable")
+            return
+
+        body = generate_instance(match["cvr"], int(match["year"]), match["size"])
+        self._send(200, body, "application/xml")
+
+    def _send(self, status, body, content_type="text/plain"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host="127.0.0.1", port=0, latency=0.0, failure_rate=0.0):
+    """
+    Start the stand-in server in a background thread.
+
+    Args:
+        port: 0 picks a free port
+        latency: Seconds to sleep before answering each request
+        failure_rate: Fraction of requests answered with 503
+
+    Returns:
+        (server, base_url); call server.shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), XbrlHandler)
+    server.daemon_threads = True
+    server.settings = {"latency": latency, "failure_rate": failure_rate}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve synthetic XBRL documents locally')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of latency per request')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    args = parser.parse_args()
+
+    server, base_url = start_server(args.host, args.port, args.latency, args.failure_rate)
+    print(f"Serving synthetic XBRL documents at {base_url}/xbrl/{{size}}/{{cvr}}_{{year}}.xml")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,114 @@
+"""
+Catalog of the hive-partitioned dataset written by dataset_writer.py.
+
+Every table opens as a lazy pyarrow dataset over all its years, with the table's common
+schema, so older partitions are cast at scan time. Filters on year prune whole
+partitions and other filters are pushed down to the parquet row group statistics; only
+the selected columns are read. With DuckDB installed (`pip install duckdb`), every
+table can also be registered as a view.
+
+Usage:
+    python catalog.py --root /data/cvr_dataset                       # list the tables and years
+    python catalog.py --root /data/cvr_dataset --sql "SELECT year, count(*) FROM virksomhed_main GROUP BY year"
+
+    catalog = Catalog(root)
+    catalog.to_pandas("virksomhed_virksomhedsstatus", columns=["cvrNummer", "status"],
+                      filter=(ds.field("year") >= 2020) & (ds.field("status") == "NORMAL"))
+    con = catalog.duckdb()
+    con.sql("SELECT * FROM virksomhed_navne WHERE cvrNummer = 12345678").df()
+"""
+
+import os
+import glob
+import argparse
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from dataset_writer import DATASET_ROOT, PARTITION_COLUMN, PARTITION_TYPE, table_path, table_schema
+
+
+class Catalog:
+    """
+    Tables of a dataset root.
+
+    Args:
+        root: Dataset root folder ({root}/table={table}/year={year}/)
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def tables(self):
+        """Names of the tables in the dataset."""
+        return sorted(os.path.basename(path)[len("table="):] for path in glob.glob(os.path.join(self.root, "table=*")))
+
+    def years(self, table):
+        """Years (partitions) of a table."""
+        prefix = f"{PARTITION_COLUMN}="
+        return sorted(int(os.path.basename(path)[len(prefix):])
+                      for path in glob.glob(os.path.join(table_path(self.root, table), f"{prefix}*")))
+
+    def schema(self, table):
+        """Common schema of a table, including the year partition column."""
+        schema = table_schema(self.root, table)
+        if schema is None:
+            raise KeyError(f"No table {table!r} in {self.root}; tables: {self.tables()}")
+        return schema.append(pa.field(PARTITION_COLUMN, PARTITION_TYPE))
+
+    def dataset(self, table):
+        """Lazy pyarrow dataset over every year of a table."""
+        return ds.dataset(
+            table_path(self.root, table),
+            schema=self.schema(table),
+            format="parquet",
+            partitioning=ds.partitioning(pa.schema([(PARTITION_COLUMN, PARTITION_TYPE)]), flavor="hive"),
+        )
+
+    def to_table(self, table, columns=None, filter=None):
+        """Read a table (only the given columns and the rows matching the filter expression)."""
+        return self.dataset(table).to_table(columns=columns, filter=filter)
+
+    def to_pandas(self, table, columns=None, filter=None):
+        return self.to_table(table, columns=columns, filter=filter).to_pandas()
+
+    def duckdb(self, connection=None):
+        """
+        Register every table as a DuckDB view (year is the partition column).
+
+        Args:
+            connection: Optional DuckDB connection (default: a new in-memory connection)
+
+        Returns:
+            The DuckDB connection
+        """
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError("DuckDB views require `pip install duckdb`")
+
+        connection = connection or duckdb.connect()
+        for table in self.tables():
+            files = os.path.join(table_path(self.root, table), f"{PARTITION_COLUMN}=*", "*.parquet").replace("'", "''")
+            # DuckDB reads table= from the parent folder as a partition column too
+            connection.execute(
+                f'CREATE OR REPLACE VIEW "{table}" AS SELECT * EXCLUDE ("table") FROM read_parquet(\'{files}\', '
+                f'hive_partitioning = true, hive_types = {{\'{PARTITION_COLUMN}\': SMALLINT}}, union_by_name = true)'
+            )
+        return connection
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='List or query the hive-partitioned CVR dataset')
+    parser.add_argument('--root', default=DATASET_ROOT, help='Dataset root folder (default: $DATASET_ROOT)')
+    parser.add_argument('--sql', help='Run a DuckDB query over the table views and print the result')
+    args = parser.parse_args()
+
+    if not args.root:
+        parser.error('--root (or DATASET_ROOT) is required')
+    catalog = Catalog(args.root)
+    if args.sql:
+        print(catalog.duckdb().sql(args.sql).df().to_string(index=False))
+    else:
+        for table in catalog.tables():
+            schema = catalog.schema(table)
+            print(f"{table:<45} {len(schema) - 1:>4} columns  years {catalog.years(table)}")
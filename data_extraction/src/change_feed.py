@@ -0,0 +1,296 @@
+"""
+Change feed between two extractions of the virksomhed panel tables.
+
+Both extractions must cover the same selection of companies: two pulls of the same
+year's query (e.g. virksomhed_2024 pulled last month and today), or two full pulls. The
+yearly files of different years hold different populations (the companies last updated
+in that year, filtered on sidstOpdateret), so comparing virksomhed_2023 with
+virksomhed_2024 reports every company not updated in 2024 as deleted.
+
+One pass over every row group of both extractions hashes each row (see
+history_archive.row_hashes) and keeps only (enhedsNummer, row hash, row number),
+24 bytes per row. The row hashes of each company are summed into one row-set hash
+per table, so a company whose rows did not change, in any order, has the same hash in
+both extractions. Only the companies whose hashes differ are drilled into: their rows
+are matched by hash and only the row groups holding changed rows are read back.
+
+Per table, the feed holds the rows that differ, with
+    change: insert (new company), update (changed company) or delete (company gone)
+    side:   new (row added) or old (row removed)
+and changes.parquet lists every changed company per table.
+
+Load metadata that changes on every extraction without a change in the register
+(e.g. the search score and Vrvirksomhed_sidstIndlaest) is ignored, see IGNORE_COLUMNS.
+
+The normalized deltagerRelation tables (normalize_relations=True) are linked by keys
+numbered within each run (organisationKey, deltagerKey), which are left out of the
+hashes. Their rows are compared on what the keys point to instead (see relation_joins):
+an organisation row with the columns of its participant, and an attribute row (e.g. an
+ownership share) with the company, organisation and participant of its organisation
+row. deltagerRelation_deltager has no company of its own; a change of a participant
+shows in the organisation rows of its companies.
+
+Rows without an enhedsNummer cannot be assigned to a company and are not compared;
+their number is printed per table.
+
+Usage:
+    python change_feed.py --old-folder /data/cvr_prev --new-folder /data/cvr --old virksomhed_2024 --new virksomhed_2024 \\
+        --out-dir changes_2024
+    python change_feed.py --old-folder /data/cvr_prev --new-folder /data/cvr --old virksomhed_2024 --new virksomhed_2024 \\
+        --out-dir changes --tables virksomhedsstatus beliggenhedsadresse hovedbranche deltagerRelation
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from cvr_index import panel_files
+from history_archive import row_hashes
+from schemas import SCHEMAS, to_frame
+
+load_dotenv()
+
+COMPANY_DATA_FOLDER_PATH = os.getenv("COMPANY_DATA_FOLDER_PATH")
+
+# Company key columns of the panel tables (main, the other tables, translated files)
+ENTITY_COLUMNS = ['enhedsNummer', 'Vrvirksomhed_enhedsNummer', 'unit_number']
+# Columns left out of the row hashes
+IGNORE_COLUMNS = ['_score', '_index', '_type', 'Vrvirksomhed_sidstIndlaest']
+# Keys numbered within one run (normalized deltagerRelation tables), also left out of the hashes
+RUN_LOCAL_COLUMNS = ['organisationKey', 'deltagerKey']
+CHANGES_FILENAME = "changes.parquet"
+# Rows hashed at a time (the small row groups of the panel files are read in batches)
+HASH_BATCH_ROWS = 500_000
+
+
+def entity_column(names):
+    return next((name for name in ENTITY_COLUMNS if name in names), None)
+
+
+def _batches(sizes, batch_rows=HASH_BATCH_ROWS):
+    """Split row groups (given their sizes) into consecutive batches of about batch_rows rows."""
+    batch, rows = [], 0
+    for row_group, size in enumerate(sizes):
+        batch.append(row_group)
+        rows += size
+        if rows >= batch_rows:
+            yield batch
+            batch, rows = [], 0
+    if batch:
+        yield batch
+
+
+def relation_joins(files):
+    """
+    Joins that replace the run-local keys of the normalized deltagerRelation tables.
+
+    Args:
+        files: Dictionary of table -> path of one extraction
+
+    Returns:
+        Dictionary of table -> function adding the columns the keys of a DataFrame of that
+        table point to (the rows and their order are kept)
+    """
+    if 'deltagerRelation_organisation' not in files:
+        return {}
+    schema = SCHEMAS['deltagerRelation_deltager']
+    participants = to_frame(pq.read_table(files['deltagerRelation_deltager']) if 'deltagerRelation_deltager' in files
+                            else schema.empty_table())
+    organisations = to_frame(pq.read_table(files['deltagerRelation_organisation'],
+                                           columns=['organisationKey', 'enhedsNummer', 'deltagerKey',
+                                                    'organisationHovedtype', 'organisationNavn']))
+    organisations = organisations.merge(participants, on='deltagerKey', how='left')
+    return {
+        'deltagerRelation_organisation':
+            lambda df: df.merge(participants, on='deltagerKey', how='left', validate='many_to_one'),
+        'deltagerRelation_attribut':
+            lambda df: df.merge(organisations, on='organisationKey', how='left', validate='many_to_one'),
+    }
+
+
+class FileHashes:
+    """
+    Row hashes of one panel file, computed in batches of row groups.
+
+    Args:
+        path: Parquet file (None for a table missing from the extraction)
+        ignore: Columns left out of the hashes
+        join: Optional function adding columns to each batch before hashing (see relation_joins)
+    """
+
+    def __init__(self, path, ignore=IGNORE_COLUMNS, join=None):
+        self.path = path
+        self.join = join
+        self.offsets = np.zeros(1, dtype=np.int64)
+        entities, hashes = [], []
+        parquet_file = pq.ParquetFile(path) if path else None
+        if parquet_file is None:
+            self.column = None
+        elif join is None:
+            self.column = entity_column(parquet_file.schema_arrow.names)
+        else:
+            self.column = entity_column(join(to_frame(parquet_file.schema_arrow.empty_table())).columns)
+        if self.column is not None:
+            columns = [name for name in parquet_file.schema_arrow.names if name not in ignore]
+            sizes = [parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)]
+            self.offsets = np.cumsum([0] + sizes)
+            for row_groups in _batches(sizes):
+                df = parquet_file.read_row_groups(row_groups, columns=columns).to_pandas()
+                if join is not None:
+                    df = join(df)
+                entities.append(pd.to_numeric(df[self.column], errors='coerce').fillna(-1).to_numpy(dtype=np.int64))
+                hashes.append(row_hashes(df.drop(columns=RUN_LOCAL_COLUMNS, errors='ignore')))
+        self.entities = np.concatenate(entities) if entities else np.empty(0, dtype=np.int64)
+        self.hashes = np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+
+    def entity_hashes(self):
+        """Sorted unique companies and the sum of their row hashes."""
+        order = np.argsort(self.entities, kind='stable')
+        entities, starts = np.unique(self.entities[order], return_index=True)
+        with np.errstate(over='ignore'):
+            sums = np.add.reduceat(self.hashes[order], starts) if len(starts) else np.empty(0, dtype=np.uint64)
+        return entities, sums
+
+    def read_rows(self, rows):
+        """Read the given (global) row numbers, touching only the row groups that hold them."""
+        rows = np.sort(rows)
+        groups = np.searchsorted(self.offsets, rows, side='right') - 1
+        parquet_file = pq.ParquetFile(self.path)
+        parts = []
+        for group in np.unique(groups):
+            local = rows[groups == group] - self.offsets[group]
+            parts.append(parquet_file.read_row_group(int(group)).take(pa.array(local)).replace_schema_metadata(None))
+        table = pa.concat_tables(parts, promote_options="permissive")
+        if self.join is not None:
+            table = pa.Table.from_pandas(self.join(to_frame(table)), preserve_index=False).replace_schema_metadata(None)
+        return table
+
+
+def _row_keys(entities, hashes, rows):
+    """(entity, hash, occurrence) keys of rows, so repeated identical rows are matched one to one."""
+    keys = pd.DataFrame({"entity": entities, "hash": hashes, "row": rows})
+    keys["occurrence"] = keys.groupby(["entity", "hash"]).cumcount()
+    return keys
+
+
+def diff_table(old, new):
+    """
+    Compare one table of two extractions.
+
+    Args:
+        old, new: FileHashes of the table in the old and new extraction
+
+    Returns:
+        DataFrame of the changed companies (entity, change) and a pyarrow Table of the
+        changed rows with change and side columns (None if nothing changed)
+    """
+    old_entities, old_sums = old.entity_hashes()
+    new_entities, new_sums = new.entity_hashes()
+    common, old_index, new_index = np.intersect1d(old_entities, new_entities, assume_unique=True, return_indices=True)
+    changes = pd.concat([
+        pd.DataFrame({"entity": np.setdiff1d(new_entities, old_entities, assume_unique=True), "change": "insert"}),
+        pd.DataFrame({"entity": common[old_sums[old_index] != new_sums[new_index]], "change": "update"}),
+        pd.DataFrame({"entity": np.setdiff1d(old_entities, new_entities, assume_unique=True), "change": "delete"}),
+    ], ignore_index=True)
+    changes = changes[changes.entity >= 0]
+    if changes.empty:
+        return changes, None
+
+    # Drill into the changed companies only: match their rows by hash
+    sides = []
+    for side, hashes in [("old", old), ("new", new)]:
+        rows = np.flatnonzero(np.isin(hashes.entities, changes.entity.to_numpy()))
+        sides.append(_row_keys(hashes.entities[rows], hashes.hashes[rows], rows))
+    matched = sides[0].merge(sides[1], on=["entity", "hash", "occurrence"], suffixes=("_old", "_new"))
+
+    parts = []
+    change_of = changes.set_index("entity").change
+    for side, keys, hashes in [("new", sides[1], new), ("old", sides[0], old)]:
+        rows = np.setdiff1d(keys.row.to_numpy(), matched[f"row_{side}"].to_numpy())
+        if len(rows) == 0:
+            continue
+        table = hashes.read_rows(rows)
+        entities = pd.to_numeric(table[hashes.column].to_pandas(), errors='coerce').to_numpy()
+        table = table.append_column("change", pa.array(change_of.reindex(entities).to_numpy(), type=pa.string()))
+        parts.append(table.append_column("side", pa.array([side] * len(table), type=pa.string())))
+    return changes, pa.concat_tables(parts, promote_options="permissive") if parts else None
+
+
+def change_feed(old_prefix, new_prefix, out_dir, old_folder=COMPANY_DATA_FOLDER_PATH, new_folder=None,
+                tables=None, ignore=IGNORE_COLUMNS):
+    """
+    Write the change feed between two extractions.
+
+    Args:
+        old_prefix, new_prefix: Panel file prefixes of two pulls of the same selection (e.g.
+            virksomhed_2024 in two folders)
+        out_dir: Output folder ({table}.parquet per changed table and changes.parquet)
+        old_folder, new_folder: Folders of the two extractions (new_folder defaults to old_folder)
+        tables: Optional list of tables (default: every table of either extraction)
+        ignore: Columns left out of the comparison
+
+    Returns:
+        DataFrame of the changed companies (table, enhedsNummer, change)
+    """
+    new_folder = new_folder or old_folder
+    old_files = {table: path for path, table, _ in panel_files(old_folder, old_prefix)}
+    new_files = {table: path for path, table, _ in panel_files(new_folder, new_prefix)}
+    os.makedirs(out_dir, exist_ok=True)
+
+    old_joins, new_joins = relation_joins(old_files), relation_joins(new_files)
+
+    summary = []
+    for table in sorted(set(old_files) | set(new_files)):
+        if tables is not None and table not in tables:
+            continue
+        start = time.perf_counter()
+        old = FileHashes(old_files.get(table), ignore, old_joins.get(table))
+        new = FileHashes(new_files.get(table), ignore, new_joins.get(table))
+        if old.column is None and new.column is None:
+            print(f"  {table}: skipped (no enhedsNummer column"
+                  f"{'; compared in deltagerRelation_organisation' if table == 'deltagerRelation_deltager' else ''})")
+            continue
+        changes, rows = diff_table(old, new)
+        out_path = os.path.join(out_dir, f"{table}.parquet")
+        if rows is not None:
+            pq.write_table(rows, out_path)
+        elif os.path.exists(out_path):
+            os.remove(out_path)
+        counts = changes.change.value_counts()
+        print(f"  {table}: {counts.get('insert', 0)} inserted, {counts.get('update', 0)} updated, "
+              f"{counts.get('delete', 0)} deleted companies, {0 if rows is None else len(rows)} rows "
+              f"({time.perf_counter() - start:.1f}s)")
+        unkeyed = {side: int((hashes.entities < 0).sum()) for side, hashes in [("old", old), ("new", new)]}
+        if any(unkeyed.values()):
+            print(f"    {unkeyed['old']} old and {unkeyed['new']} new rows without {old.column or new.column} "
+                  f"not compared")
+        summary.append(changes.assign(table=table))
+
+    summary = pd.concat(summary, ignore_index=True) if summary else pd.DataFrame(columns=["entity", "change", "table"])
+    summary = summary.rename(columns={"entity": "enhedsNummer"})[["table", "enhedsNummer", "change"]]
+    summary.to_parquet(os.path.join(out_dir, CHANGES_FILENAME), index=False)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Insert/update/delete change feed between two extractions')
+    parser.add_argument('--old', required=True, help='Panel file prefix of the old extraction (e.g. virksomhed_2024)')
+    parser.add_argument('--new', required=True,
+                        help='Panel file prefix of the new extraction, a pull of the same selection (e.g. virksomhed_2024 '
+                             'in --new-folder)')
+    parser.add_argument('--old-folder', default=COMPANY_DATA_FOLDER_PATH, help='Folder of the old extraction')
+    parser.add_argument('--new-folder', help='Folder of the new extraction (default: --old-folder)')
+    parser.add_argument('--tables', nargs='+', help='Only these tables')
+    parser.add_argument('--out-dir', required=True, help='Output folder of the change feed')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = change_feed(args.old, args.new, args.out_dir, old_folder=args.old_folder, new_folder=args.new_folder,
+                          tables=args.tables)
+    print(f"{summary.enhedsNummer.nunique()} companies changed in {summary.table.nunique()} tables "
+          f"({time.perf_counter() - start:.1f}s), written to {args.out_dir}")
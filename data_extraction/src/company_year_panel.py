@@ -0,0 +1,335 @@
+"""
+Company-year panel: one row per cvrNummer and year, combining
+
+    - employment from aarsbeskaeftigelse (antalAnsatte, antalAarsvaerk, antalInklusivEjere)
+    - hovedbranche, virksomhedsstatus and virksomhedsform as of 31 December of the year
+    - the latest financial statement with a period ending in the year (financial_statements_{year})
+    - the XBRL tags of the year (companies_all_tags_{year})
+
+Every part is reduced to unique (cvrNummer, year) rows, packed into one sorted
+int64 key per row, and joined by a merge join (np.searchsorted of the sorted union
+of keys into each part). Parts are cached as parquet files named by a hash of their
+input files and parameters, so a rebuild after one table changes only recomputes
+the parts that read it (e.g. a new financial_statements_2021 rebuilds one part).
+
+Usage:
+    python company_year_panel.py --panel-year 2024 --years 2015 2024 --out company_year_panel.parquet
+"""
+
+import os
+import re
+import json
+import glob
+import time
+import hashlib
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from snapshot import SnapshotEngine, SNAPSHOT_TABLES
+from schemas import unify_schemas, conform
+
+load_dotenv()
+
+COMPANY_DATA_FOLDER_PATH = os.getenv("COMPANY_DATA_FOLDER_PATH")
+FS_FOLDER_PATH = os.getenv("FS_FOLDER_PATH")  # "FS=financial_statements"
+EFS_FOLDER_PATH = os.getenv("EFS_FOLDER_PATH")  # "EFS=expanded_financial_statements"
+COMPANY_FILENAME = "virksomhed"
+FS_FILENAME = "financial_statements"
+EFS_FILENAME = "companies_all_tags"
+OUTPUT_FILENAME = "company_year_panel"
+
+EMPLOYMENT_COLUMNS = ['antalAnsatte', 'antalAarsvaerk', 'antalInklusivEjere']
+PANEL_SNAPSHOT_TABLES = ['hovedbranche', 'virksomhedsstatus', 'virksomhedsform']
+# financial_statements column -> panel column
+FINANCIAL_COLUMNS = {
+    'sagsNummer': 'regnskab_sagsNummer',
+    'regnskab_regnskabsperiode_startDato': 'regnskab_startDato',
+    'regnskab_regnskabsperiode_slutDato': 'regnskab_slutDato',
+    'offentliggoerelsesTidspunkt': 'regnskab_offentliggjort',
+    'omgoerelse': 'regnskab_omgoerelse',
+    'AARSRAPPORT_xml': 'regnskab_xml',
+}
+# Years take the low 4 decimal digits of the join key
+YEAR_FACTOR = 10000
+
+
+def panel_keys(cvr_numre, years):
+    """Join keys cvrNummer * 10000 + year, ordering rows by (cvrNummer, year)."""
+    return np.asarray(cvr_numre, dtype=np.int64) * YEAR_FACTOR + np.asarray(years, dtype=np.int64)
+
+
+def keyed_part(df, value_columns):
+    """
+    Reduce a DataFrame with cvrNummer and year to a part table sorted by join key.
+
+    Rows without a usable cvrNummer or year are dropped; for duplicate keys the last row wins.
+    """
+    df = df.assign(cvrNummer=pd.to_numeric(df['cvrNummer'], errors='coerce'),
+                   year=pd.to_numeric(df['year'], errors='coerce'))
+    df = df.dropna(subset=['cvrNummer', 'year'])
+    df = df.drop_duplicates(['cvrNummer', 'year'], keep='last')
+    df = df.astype({'cvrNummer': 'int64', 'year': 'int32'}).sort_values(['cvrNummer', 'year'])
+    return pa.Table.from_pandas(df[['cvrNummer', 'year', *value_columns]], preserve_index=False)
+
+
+# --- Parts ---
+def employment_part(path, years):
+    """Yearly employment per company; the most recently updated figure wins."""
+    df = pd.read_parquet(path, columns=['cvrNummer', 'aar', *EMPLOYMENT_COLUMNS, 'sidstOpdateret'])
+    df = df.rename(columns={'aar': 'year'})
+    df = df[df['year'].isin(years)].sort_values('sidstOpdateret', kind='stable')
+    return keyed_part(df, EMPLOYMENT_COLUMNS)
+
+
+def snapshot_part(folder, prefix, years):
+    """hovedbranche, virksomhedsstatus and virksomhedsform of every company on 31 December of each year."""
+    tables = {name: SNAPSHOT_TABLES[name] for name in PANEL_SNAPSHOT_TABLES}
+    engine = SnapshotEngine.from_panel(folder, prefix, tables=tables)
+    snapshot = engine.snapshot([f"{year}-12-31" for year in years])
+    value_columns = [column for columns in tables.values() for column in columns.values()
+                     if column in snapshot.columns]
+    snapshot = snapshot[snapshot[value_columns].notna().any(axis=1)]
+    snapshot = snapshot.assign(year=snapshot['date'].dt.year)
+    return keyed_part(snapshot, value_columns)
+
+
+def financials_part(path, year):
+    """
+    The financial statement of every company whose accounting period ends in the year.
+
+    financial_statements_{year} also holds periods that only start in the year; those are
+    left to the next year's file. Corrections (omgoerelse) and late filings are resolved
+    by keeping the most recently published statement.
+    """
+    columns = [column for column in pq.read_schema(path).names if column in FINANCIAL_COLUMNS or column == 'cvrNummer']
+    df = pd.read_parquet(path, columns=columns)
+    df['year'] = pd.to_numeric(df['regnskab_regnskabsperiode_slutDato'].str[:4], errors='coerce')
+    df = df[df['year'] == year]
+    if 'offentliggoerelsesTidspunkt' in df.columns:
+        df = df.sort_values('offentliggoerelsesTidspunkt', kind='stable')
+    df = df.assign(regnskab_antal=df.groupby('cvrNummer')['cvrNummer'].transform('size').astype('int32'))
+    df = df.rename(columns=FINANCIAL_COLUMNS)
+    value_columns = [FINANCIAL_COLUMNS[column] for column in columns if column in FINANCIAL_COLUMNS]
+    return keyed_part(df, [*value_columns, 'regnskab_antal'])
+
+
+def xbrl_part(path, year, tags=None):
+    """XBRL tags of the year from the wide companies_all_tags_{year} file (optionally only `tags`)."""
+    names = pq.read_schema(path).names
+    tag_columns = [name for name in names if name not in ('identifier', 'Year') and (tags is None or name in tags)]
+    df = pd.read_parquet(path, columns=['identifier', *tag_columns])
+    df = df.rename(columns={'identifier': 'cvrNummer'}).assign(year=year)
+    return keyed_part(df, tag_columns)
+
+
+# --- Cache ---
+class PartCache:
+    """
+    Parquet cache of panel parts keyed by the content hashes of their input files.
+
+    File hashes are memoized in file_hashes.json by (size, mtime), so unchanged
+    inputs are not re-read on every build.
+
+    Args:
+        cache_dir: Folder of the cached parts
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self.memo_path = os.path.join(cache_dir, "file_hashes.json")
+        self.memo = {}
+        if os.path.exists(self.memo_path):
+            with open(self.memo_path, encoding="utf-8") as f:
+                self.memo = json.load(f)
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.memo.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["sha256"]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        self.memo[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+        with open(self.memo_path, "w", encoding="utf-8") as f:
+            json.dump(self.memo, f, indent=2)
+        return self.memo[key]["sha256"]
+
+    def get(self, name, inputs, params, build):
+        """
+        Cached part, or build() it and cache the result.
+
+        Args:
+            name: Part name, unique per part (e.g. financials_2020)
+            inputs: Input file paths the part reads
+            params: JSON-serializable parameters the part depends on
+            build: Function returning the part as a pyarrow.Table
+
+        Returns:
+            pyarrow.Table
+        """
+        key = json.dumps({
+            "part": name,
+            "inputs": {os.path.basename(path): self.file_hash(path) for path in inputs},
+            "params": params,
+        }, sort_keys=True, default=str)
+        path = os.path.join(self.cache_dir, f"{name}_{hashlib.sha256(key.encode()).hexdigest()[:16]}.parquet")
+        if os.path.exists(path):
+            print(f"  {name}: cached")
+            return pq.read_table(path)
+
+        start = time.perf_counter()
+        table = build()
+        # Earlier versions of this part are stale now
+        for stale in glob.glob(os.path.join(self.cache_dir, f"{name}_" + "?" * 16 + ".parquet")):
+            os.remove(stale)
+        pq.write_table(table, path)
+        print(f"  {name}: built {table.num_rows} rows in {time.perf_counter() - start:.1f}s")
+        return table
+
+
+# --- Join ---
+def merge_join(parts):
+    """
+    Full outer join of part tables on (cvrNummer, year).
+
+    Every part is sorted by key with unique keys, so each one aligns to the sorted
+    union of keys with one np.searchsorted. Columns that appear in several parts
+    are prefixed with the part name.
+
+    Args:
+        parts: Dictionary of part name -> pyarrow.Table with cvrNummer, year and value columns
+
+    Returns:
+        pyarrow.Table sorted by cvrNummer, year
+    """
+    part_keys = {name: panel_keys(table['cvrNummer'].to_numpy(), table['year'].to_numpy())
+                 for name, table in parts.items()}
+    keys = np.unique(np.concatenate([np.empty(0, dtype=np.int64), *part_keys.values()]))
+    columns = {
+        'cvrNummer': pa.array(keys // YEAR_FACTOR),
+        'year': pa.array((keys % YEAR_FACTOR).astype(np.int32)),
+    }
+    for name, table in parts.items():
+        n = len(part_keys[name])
+        positions = np.minimum(np.searchsorted(part_keys[name], keys), max(n - 1, 0))
+        found = part_keys[name][positions] == keys if n else np.zeros(len(keys), dtype=bool)
+        values = table.drop_columns(['cvrNummer', 'year']).take(pa.array(positions, mask=~found))
+        for column in values.column_names:
+            columns[f"{name}_{column}" if column in columns else column] = values[column]
+    return pa.table(columns)
+
+
+def latest_panel_prefix(folder):
+    """Prefix of the newest virksomhed panel in the folder (virksomhed_{year}, or virksomhed if unsuffixed)."""
+    years = sorted(int(match.group(1)) for path in glob.glob(os.path.join(folder, f"{COMPANY_FILENAME}_*_main.parquet"))
+                   if (match := re.fullmatch(rf"{COMPANY_FILENAME}_(\d{{4}})_main\.parquet", os.path.basename(path))))
+    return f"{COMPANY_FILENAME}_{years[-1]}" if years else COMPANY_FILENAME
+
+
+def concat_parts(tables):
+    """
+    Concatenate the yearly parts of one source.
+
+    The XBRL tags are typed per year, so a tag can be numeric one year and text the next;
+    such columns become strings (see schemas.unify_schemas).
+    """
+    schema = unify_schemas([table.schema for table in tables])
+    return pa.concat_tables([conform(table, schema) for table in tables])
+
+
+def build_panel(years,
+                panel_year=None,
+                company_folder=COMPANY_DATA_FOLDER_PATH,
+                fs_folder=FS_FOLDER_PATH,
+                efs_folder=EFS_FOLDER_PATH,
+                cache_dir=None,
+                xbrl_tags=None):
+    """
+    Build the company-year panel.
+
+    Args:
+        years: Panel years
+        panel_year: Year of the virksomhed panel files to read (default: the newest in company_folder)
+        company_folder: Folder with the virksomhed_{panel_year}_*.parquet files
+        fs_folder: Folder with the financial_statements_{year}.parquet files
+        efs_folder: Folder with the companies_all_tags_{year}.parquet files
+        cache_dir: Folder of the part cache (default: {company_folder}/{OUTPUT_FILENAME}_cache)
+        xbrl_tags: Optional list of XBRL tags to keep (default: all)
+
+    Returns:
+        DataFrame with one row per cvrNummer and year
+    """
+    years = sorted(set(years))
+    prefix = f"{COMPANY_FILENAME}_{panel_year}" if panel_year else latest_panel_prefix(company_folder)
+    cache = PartCache(cache_dir or os.path.join(company_folder, f"{OUTPUT_FILENAME}_cache"))
+
+    parts = {}
+    print("Collecting panel parts...")
+    path = os.path.join(company_folder, f"{prefix}_aarsbeskaeftigelse.parquet")
+    if os.path.exists(path):
+        parts['employment'] = cache.get('employment', [path], {"years": years},
+                                        lambda: employment_part(path, years))
+    else:
+        print(f"  employment: missing {path}")
+
+    snapshot_inputs = [os.path.join(company_folder, f"{prefix}_{name}.parquet") for name in ['main', *PANEL_SNAPSHOT_TABLES]]
+    snapshot_inputs = [path for path in snapshot_inputs if os.path.exists(path)]
+    if snapshot_inputs and snapshot_inputs[0].endswith("_main.parquet"):
+        parts['snapshot'] = cache.get('snapshot', snapshot_inputs, {"years": years},
+                                      lambda: snapshot_part(company_folder, prefix, years))
+    else:
+        print(f"  snapshot: missing {prefix}_main.parquet")
+
+    for year in years:
+        for name, folder, filename, build in [
+            ('financials', fs_folder, FS_FILENAME, lambda path, year: financials_part(path, year)),
+            ('xbrl', efs_folder, EFS_FILENAME, lambda path, year: xbrl_part(path, year, xbrl_tags)),
+        ]:
+            if folder is None:
+                continue
+            path = os.path.join(folder, f"{filename}_{year}.parquet")
+            if not os.path.exists(path):
+                print(f"  {name}_{year}: missing {path}")
+                continue
+            parts[f"{name}_{year}"] = cache.get(f"{name}_{year}", [path], {"tags": xbrl_tags} if name == 'xbrl' else {},
+                                                lambda: build(path, year))
+
+    # Yearly parts of one source become one part before the join
+    grouped = {}
+    for name, table in parts.items():
+        grouped.setdefault(name.split('_')[0], []).append(table)
+    grouped = {name: tables[0] if len(tables) == 1 else
+               concat_parts(tables).sort_by([('cvrNummer', 'ascending'), ('year', 'ascending')])
+               for name, tables in grouped.items()}
+
+    start = time.perf_counter()
+    panel = merge_join(grouped)
+    print(f"Joined {len(grouped)} parts into {panel.num_rows} company-years in {time.perf_counter() - start:.2f}s")
+    return panel.to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build the cvrNummer x year company panel')
+    parser.add_argument('--years', type=int, nargs=2, required=True, metavar=('FIRST', 'LAST'),
+                        help='First and last panel year')
+    parser.add_argument('--panel-year', type=int, help='Year of the virksomhed panel files (default: the newest in --folder)')
+    parser.add_argument('--folder', default=COMPANY_DATA_FOLDER_PATH, help='Folder with the virksomhed panel files')
+    parser.add_argument('--cache-dir', help=f'Folder of the part cache (default: {OUTPUT_FILENAME}_cache in --folder)')
+    parser.add_argument('--tags', nargs='+', help='XBRL tags to keep (default: all)')
+    parser.add_argument('--out', help=f'Output parquet file (default: {OUTPUT_FILENAME}_FIRST_LAST.parquet in --folder)')
+    args = parser.parse_args()
+
+    first, last = args.years
+    panel = build_panel(range(first, last + 1), panel_year=args.panel_year, company_folder=args.folder,
+                        cache_dir=args.cache_dir, xbrl_tags=args.tags)
+    out = args.out or os.path.join(args.folder, f"{OUTPUT_FILENAME}_{first}_{last}.parquet")
+    panel.to_parquet(out, index=False)
+    print(f"Saved {len(panel)} rows x {len(panel.columns)} columns to {out}")
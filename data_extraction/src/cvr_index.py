@@ -0,0 +1,319 @@
+"""
+CVR number lookup index over the panel files of every year.
+
+Panel files are written sorted by CVR number in small row groups (see sort_by_cvr and
+row_group_size). The index stores, for every CVR number, the files and row groups
+holding its rows and the [start, stop) row range inside each row group, as sorted
+.npy arrays that are memory-mapped when loaded. A lookup is one np.searchsorted and
+reads only the matching row groups, instead of scanning every file of every year.
+
+The size and modification time of every indexed file are recorded. Loading an index,
+and every lookup, checks them, so an index left over from before a re-extraction (whose
+row groups and row ranges now point at other rows) is refused or rebuilt instead of
+silently returning wrong rows.
+
+Files that are not sorted (older runs, spilled tables) are still indexed correctly:
+a CVR number then just spans more row groups or a wider row range. Existing files
+can be rewritten sorted with the sort command.
+
+Usage:
+    python cvr_index.py sort --folder /data/cvr          # sort existing panel files in place
+    python cvr_index.py build --folder /data/cvr
+    python cvr_index.py lookup --folder /data/cvr --cvr 12345678 --tables navne virksomhedsstatus
+
+    index = CvrIndex.load(folder)
+    history = index.lookup(12345678)        # {table: DataFrame with a panel_year column}
+"""
+
+import os
+import re
+import glob
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COMPANY_DATA_FOLDER_PATH = os.getenv("COMPANY_DATA_FOLDER_PATH")
+OUTPUT_FILENAME = "virksomhed"
+INDEX_DIRNAME = "cvr_index"
+
+# CVR number columns of the panel tables (main, the other tables, translated files)
+CVR_COLUMNS = ['cvrNummer', 'Vrvirksomhed_cvrNummer', 'cvr_number']
+# Target size of a row group of the panel files (in memory). A lookup decodes whole
+# row groups (roughly 4 ms per MB), while the footer grows with the number of row groups
+ROW_GROUP_BYTES = 1024 * 1024
+MIN_ROW_GROUP_SIZE = 1_000
+ARRAYS = ['cvr', 'file', 'row_group', 'start', 'stop']
+
+
+def cvr_column(names):
+    """Name of the CVR number column among `names`, or None."""
+    return next((name for name in CVR_COLUMNS if name in names), None)
+
+
+def sort_by_cvr(table):
+    """Stable sort of a panel pyarrow Table by its CVR number column (unchanged if it has none)."""
+    column = cvr_column(table.column_names)
+    return table.take(pc.sort_indices(table[column], null_placement="at_end")) if column else table
+
+
+def row_group_size(table):
+    """Rows per row group so that a row group of the pyarrow Table holds about ROW_GROUP_BYTES."""
+    if table.num_rows == 0:
+        return None
+    return max(MIN_ROW_GROUP_SIZE, ROW_GROUP_BYTES * table.num_rows // max(table.nbytes, 1))
+
+
+def sort_file(path):
+    """Rewrite a parquet file sorted by CVR number with small row groups."""
+    table = pq.read_table(path)
+    if cvr_column(table.column_names) is None:
+        return False
+    table = sort_by_cvr(table)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, row_group_size=row_group_size(table))
+    os.replace(tmp_path, path)
+    return True
+
+
+def panel_files(folder, prefix=OUTPUT_FILENAME):
+    """
+    Panel files in the folder as (path, table, panel year) tuples.
+
+    Matches {prefix}_{year}_{table}.parquet and {prefix}_{table}.parquet (panel year None).
+    """
+    files = []
+    for path in sorted(glob.glob(os.path.join(folder, f"{prefix}_*.parquet"))):
+        name = os.path.basename(path)[len(prefix) + 1:-len(".parquet")]
+        match = re.fullmatch(r"(\d{4})_(.+)", name)
+        files.append((path, match.group(2), int(match.group(1))) if match else (path, name, None))
+    return files
+
+
+def cvr_values(column):
+    """CVR numbers of a column as int64 (-1 where missing or not numeric)."""
+    if pa.types.is_integer(column.type):
+        return column.fill_null(-1).to_numpy().astype(np.int64)
+    return pd.to_numeric(column.to_pandas(), errors='coerce').fillna(-1).to_numpy(dtype=np.int64)
+
+
+def row_group_entries(values):
+    """
+    Unique CVR numbers of one row group with their [start, stop) row range.
+
+    Returns:
+        cvr, start, stop arrays (missing CVR numbers dropped)
+    """
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    cvr, first = np.unique(sorted_values, return_index=True)
+    start = np.minimum.reduceat(order, first)
+    stop = np.maximum.reduceat(order, first) + 1
+    keep = cvr >= 0
+    return cvr[keep], start[keep], stop[keep]
+
+
+def file_stamp(path):
+    """Size and modification time of a file, recorded in the index to detect rewritten files."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build_index(folder, prefix=OUTPUT_FILENAME, index_path=None):
+    """
+    Index every panel file in the folder, reading only the CVR number columns.
+
+    Args:
+        folder: Folder with the panel files
+        prefix: Panel file prefix
+        index_path: Output folder (default: {folder}/cvr_index)
+
+    Returns:
+        CvrIndex
+    """
+    index_path = index_path or os.path.join(folder, INDEX_DIRNAME)
+    os.makedirs(index_path, exist_ok=True)
+
+    files, parts = [], []
+    for path, table, year in panel_files(folder, prefix):
+        parquet_file = pq.ParquetFile(path)
+        column = cvr_column(parquet_file.schema_arrow.names)
+        if column is None or parquet_file.metadata.num_rows == 0:
+            continue
+        file_id = len(files)
+        files.append({"path": os.path.basename(path), "table": table, "year": year, "cvr_column": column,
+                      "row_groups": parquet_file.num_row_groups, **file_stamp(path)})
+        for row_group in range(parquet_file.num_row_groups):
+            values = cvr_values(parquet_file.read_row_group(row_group, columns=[column])[column])
+            cvr, start, stop = row_group_entries(values)
+            parts.append((cvr, np.full(len(cvr), file_id, dtype=np.int32), np.full(len(cvr), row_group, dtype=np.int32),
+                          start.astype(np.int32), stop.astype(np.int32)))
+
+    arrays = [np.concatenate([part[i] for part in parts]) if parts else np.empty(0, dtype=np.int64 if i == 0 else np.int32)
+              for i in range(len(ARRAYS))]
+    order = np.lexsort((arrays[2], arrays[1], arrays[0]))
+    for name, array in zip(ARRAYS, arrays):
+        np.save(os.path.join(index_path, f"{name}.npy"), array[order])
+    with open(os.path.join(index_path, "files.json"), "w", encoding="utf-8") as f:
+        json.dump(files, f, indent=2)
+    print(f"Indexed {len(files)} files, {len(arrays[0])} (cvr, row group) entries, "
+          f"{len(np.unique(arrays[0]))} CVR numbers in {index_path}")
+    return CvrIndex.load(folder, index_path)
+
+
+class CvrIndex:
+    """
+    Point lookups of one company's rows in every indexed panel file.
+
+    Args:
+        folder: Folder with the panel files
+        files: List of file descriptions (path, table, year, cvr_column)
+        arrays: Dictionary of the index arrays (cvr, file, row_group, start, stop)
+        max_workers: Threads decoding row groups in parallel
+    """
+
+    def __init__(self, folder, files, arrays, max_workers=8):
+        self.folder = folder
+        self.max_workers = max_workers
+        self.files = files
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.parquet_files = {}
+
+    @classmethod
+    def load(cls, folder, index_path=None, rebuild=False, prefix=OUTPUT_FILENAME):
+        """
+        Load an index saved by build_index(); the arrays are memory-mapped.
+
+        Args:
+            rebuild: Rebuild the index when an indexed file has changed since it was built
+                (otherwise a ValueError is raised)
+
+        Raises:
+            ValueError: An indexed file was rewritten, removed, or the index predates the
+                recorded file sizes and modification times
+        """
+        index_path = index_path or os.path.join(folder, INDEX_DIRNAME)
+        with open(os.path.join(index_path, "files.json"), encoding="utf-8") as f:
+            files = json.load(f)
+        arrays = {name: np.load(os.path.join(index_path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        index = cls(folder, files, arrays)
+        stale = index.stale_files()
+        if stale and rebuild:
+            print(f"Index {index_path} is out of date ({len(stale)} changed files); rebuilding...")
+            return build_index(folder, prefix, index_path)
+        index.check(stale)
+        return index
+
+    def stale_files(self, file_ids=None):
+        """Ids of indexed files that are missing or whose size or modification time changed."""
+        stale = []
+        for file_id in (range(len(self.files)) if file_ids is None else file_ids):
+            info = self.files[file_id]
+            path = os.path.join(self.folder, info["path"])
+            if not os.path.exists(path) or file_stamp(path) != {"size": info.get("size"),
+                                                                "mtime_ns": info.get("mtime_ns")}:
+                stale.append(file_id)
+        return stale
+
+    def check(self, stale):
+        if stale:
+            names = ", ".join(self.files[file_id]["path"] for file_id in stale[:5])
+            more = f" and {len(stale) - 5} more" if len(stale) > 5 else ""
+            raise ValueError(f"CVR index is out of date: {names}{more} changed since it was built. "
+                             f"Rebuild it (python cvr_index.py build).")
+
+    def _parquet_file(self, file_id):
+        # Opening a file parses its footer; keep the handles for later lookups
+        if file_id not in self.parquet_files:
+            self.parquet_files[file_id] = pq.ParquetFile(os.path.join(self.folder, self.files[file_id]["path"]))
+        return self.parquet_files[file_id]
+
+    def locate(self, cvr):
+        """Index entries (file, row_group, start, stop) of one CVR number."""
+        lo, hi = np.searchsorted(self.cvr, cvr, side="left"), np.searchsorted(self.cvr, cvr, side="right")
+        return [(int(self.file[i]), int(self.row_group[i]), int(self.start[i]), int(self.stop[i])) for i in range(lo, hi)]
+
+    def lookup(self, cvr, tables=None, years=None):
+        """
+        All rows of one company.
+
+        Args:
+            cvr: CVR number
+            tables: Optional list of table names (default: all indexed tables)
+            years: Optional list of panel years (default: all)
+
+        Returns:
+            Dictionary of table name -> DataFrame of the company's rows in every panel year,
+            with the panel year in a panel_year column
+        """
+        cvr = int(cvr)
+        entries = [(file_id, row_group, start, stop) for file_id, row_group, start, stop in self.locate(cvr)
+                   if (tables is None or self.files[file_id]["table"] in tables)
+                   and (years is None or self.files[file_id]["year"] in years)]
+
+        def read(entry):
+            file_id, row_group, start, stop = entry
+            rows = self._parquet_file(file_id).read_row_group(row_group, use_threads=False).slice(start, stop - start)
+            return rows.filter(pc.equal(pa.array(cvr_values(rows[self.files[file_id]["cvr_column"]])), cvr))
+
+        # Refuse files rewritten since the index was built, then open them (footers are
+        # cached) and decode the row groups in parallel
+        self.check(self.stale_files(sorted({file_id for file_id, *_ in entries})))
+        for file_id, *_ in entries:
+            self._parquet_file(file_id)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            row_sets = list(executor.map(read, entries))
+
+        results = {}
+        for (file_id, *_), rows in zip(entries, row_sets):
+            info = self.files[file_id]
+            results.setdefault(info["table"], []).append((info["year"], rows))
+
+        frames = {}
+        for table, parts in results.items():
+            merged = pa.concat_tables([rows.append_column("panel_year", pa.array([year] * len(rows), type=pa.int32()))
+                                       for year, rows in parts], promote_options="permissive")
+            frames[table] = merged.to_pandas()
+        return frames
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='CVR number lookup index over the panel files')
+    parser.add_argument('command', choices=['sort', 'build', 'lookup'],
+                        help='sort: rewrite the panel files sorted by CVR number; build: (re)build the index; '
+                             'lookup: print the rows of one company')
+    parser.add_argument('--folder', default=COMPANY_DATA_FOLDER_PATH, help='Folder with the panel files')
+    parser.add_argument('--cvr', type=int, help='lookup: CVR number')
+    parser.add_argument('--tables', nargs='+', help='lookup: only these tables')
+    parser.add_argument('--years', type=int, nargs='+', help='lookup: only these panel years')
+    args = parser.parse_args()
+
+    if args.command == 'sort':
+        for path, table, year in panel_files(args.folder):
+            start = time.perf_counter()
+            if sort_file(path):
+                print(f"Sorted {path} in {time.perf_counter() - start:.1f}s")
+    elif args.command == 'build':
+        start = time.perf_counter()
+        build_index(args.folder)
+        print(f"Built in {time.perf_counter() - start:.1f}s")
+    else:
+        if args.cvr is None:
+            parser.error('lookup requires --cvr')
+        index = CvrIndex.load(args.folder, rebuild=True)
+        start = time.perf_counter()
+        frames = index.lookup(args.cvr, tables=args.tables, years=args.years)
+        print(f"Found {sum(len(df) for df in frames.values())} rows in {len(frames)} tables "
+              f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+        for table, df in frames.items():
+            print(f"\n{table} ({len(df)} rows)")
+            print(df.to_string(index=False, max_colwidth=40))
@@ -0,0 +1,213 @@
+"""
+Writes the extraction outputs as one hive-partitioned multi-year dataset:
+
+    {root}/table={table}/year={year}/part-0.parquet
+    {root}/table={table}/_common_metadata        schema of the table across all years
+
+Tables are named after the loose files without the year: virksomhed_{table} for the
+panel tables, financial_statements, companies_all_tags (wide XBRL) and
+companies_all_tags_long. Columns take their type from the schema registry (schemas.py);
+the others (XBRL tags, translated columns) keep their own. Every partition written is
+cast to the table's common schema (widened when a new year brings new columns or wider
+types), so all years of a table agree and older partitions are cast at scan time. A
+column whose types cannot be widened into one another (e.g. an XBRL tag that is numeric
+one year and text the next) becomes a string column. A partition is written to a hidden
+temporary folder and then swapped in, so rewriting a year never leaves it half written.
+
+Open the dataset with catalog.py.
+
+Usage:
+    # Publish existing loose files of some years
+    python dataset_writer.py --root /data/cvr_dataset --years 2015 2024
+
+    # Or while extracting
+    python virksomhed_api_call.py --year 2024 --dataset-root /data/cvr_dataset
+"""
+
+import os
+import re
+import glob
+import shutil
+import argparse
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from cvr_index import row_group_size
+from schemas import conform, unify_schemas, table_schema as registered_schema
+
+load_dotenv()
+
+COMPANY_DATA_FOLDER_PATH = os.getenv("COMPANY_DATA_FOLDER_PATH")
+FS_FOLDER_PATH = os.getenv("FS_FOLDER_PATH")  # "FS=financial_statements"
+EFS_FOLDER_PATH = os.getenv("EFS_FOLDER_PATH")  # "EFS=expanded_financial_statements"
+DATASET_ROOT = os.getenv("DATASET_ROOT")
+
+PARTITION_COLUMN = "year"
+PARTITION_TYPE = pa.int16()
+SCHEMA_FILENAME = "_common_metadata"
+# Dataset tables registered in schemas.SCHEMAS under another name
+REGISTERED_TABLES = {"companies_all_tags": "xbrl_wide", "companies_all_tags_long": "xbrl_long"}
+
+
+def table_path(root, table):
+    return os.path.join(root, f"table={table}")
+
+
+def table_schema(root, table):
+    """Common schema of a table (without the year partition column), or None if it has no partitions yet."""
+    path = os.path.join(table_path(root, table), SCHEMA_FILENAME)
+    return pq.read_schema(path).remove_metadata() if os.path.exists(path) else None
+
+
+def source_schema(table, schema):
+    """
+    Schema of a source of a dataset table: the registered type of each column (schemas.table_schema,
+    e.g. panel_schema('navne') for virksomhed_navne), and the source's own type for the others
+    (the XBRL tags, translated columns).
+    """
+    name, key = table, 'cvrNummer'
+    for prefix, prefix_key in [("virksomhed_", 'cvrNummer'), ("produktionsenhed_", 'pNummer')]:
+        if table.startswith(prefix):
+            name, key = table[len(prefix):], prefix_key
+    name = REGISTERED_TABLES.get(name, name)
+    registered = registered_schema(name, schema.names, key)
+    fields = []
+    for field in schema:
+        if field.name in registered.names:
+            fields.append(registered.field(field.name))
+        elif pa.types.is_null(field.type) or pa.types.is_large_string(field.type):
+            fields.append(pa.field(field.name, pa.string()))
+        else:
+            fields.append(field)
+    return pa.schema(fields)
+
+
+def _row_groups(sources):
+    """Yield the row groups of the sources (pyarrow Tables, DataFrames or parquet paths) one at a time."""
+    for source in sources:
+        if isinstance(source, pd.DataFrame):
+            yield pa.Table.from_pandas(source, preserve_index=False)
+        elif isinstance(source, pa.Table):
+            yield source
+        else:
+            parquet_file = pq.ParquetFile(source)
+            for row_group in range(parquet_file.num_row_groups):
+                yield parquet_file.read_row_group(row_group)
+
+
+def _partition_columns(schema):
+    """Columns that clash with the partition column (DuckDB matches column names case-insensitively)."""
+    return [name for name in schema.names if name.lower() == PARTITION_COLUMN]
+
+
+def _source_schema(source):
+    if isinstance(source, pd.DataFrame):
+        return pa.Schema.from_pandas(source, preserve_index=False)
+    if isinstance(source, pa.Table):
+        return source.schema
+    return pq.read_schema(source)
+
+
+def write_partition(sources, root, table, year):
+    """
+    Replace one year of a table with the given data.
+
+    Row groups are streamed one at a time, so sorted files (see cvr_index.py) keep
+    their order, and split into row groups of about 1 MB. Columns named like the partition
+    column (e.g. the Year column of the wide XBRL files) are dropped. Nothing is written for
+    a table without any columns.
+
+    Args:
+        sources: pyarrow Table, DataFrame or parquet path, or a list of them
+        root: Dataset root folder
+        table: Table name
+        year: Partition year
+
+    Returns:
+        Number of rows written
+    """
+    sources = sources if isinstance(sources, list) else [sources]
+    schemas = [schema for schema in [table_schema(root, table)] if schema is not None]
+    for source in sources:
+        schema = source_schema(table, _source_schema(source).remove_metadata())
+        schemas.append(pa.schema([field for field in schema if field.name not in _partition_columns(schema)]))
+    schema = unify_schemas(schemas)
+    if len(schema) == 0:
+        # Tables without any columns (empty in every year so far) are not readable as parquet
+        return 0
+
+    base = table_path(root, table)
+    os.makedirs(base, exist_ok=True)
+    final_dir = os.path.join(base, f"{PARTITION_COLUMN}={year}")
+    tmp_dir = os.path.join(base, f".{PARTITION_COLUMN}={year}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    rows = 0
+    with pq.ParquetWriter(os.path.join(tmp_dir, "part-0.parquet"), schema) as writer:
+        for row_group in _row_groups(sources):
+            row_group = row_group.replace_schema_metadata(None).drop_columns(_partition_columns(row_group.schema))
+            row_group = conform(row_group, schema)
+            writer.write_table(row_group, row_group_size=row_group_size(row_group))
+            rows += len(row_group)
+
+    # Swap the partition in, then record the (possibly widened) common schema
+    old_dir = f"{tmp_dir}.old"
+    if os.path.exists(final_dir):
+        os.replace(final_dir, old_dir)
+    os.replace(tmp_dir, final_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    pq.write_metadata(schema, os.path.join(base, SCHEMA_FILENAME))
+    return rows
+
+
+def loose_files(year, company_folder=COMPANY_DATA_FOLDER_PATH, fs_folder=FS_FOLDER_PATH, efs_folder=EFS_FOLDER_PATH):
+    """
+    Loose output files of one year as (table, [paths]) pairs.
+
+    virksomhed_{year}_{table}.parquet, financial_statements_{year}.parquet,
+    companies_all_tags_{year}.parquet and companies_all_tags_long/year={year}/.
+    """
+    files = []
+    if company_folder:
+        pattern = re.compile(rf"virksomhed_{year}_(.+)\.parquet")
+        for path in sorted(glob.glob(os.path.join(company_folder, f"virksomhed_{year}_*.parquet"))):
+            match = pattern.fullmatch(os.path.basename(path))
+            if match:
+                files.append((f"virksomhed_{match.group(1)}", [path]))
+    if fs_folder and os.path.exists(os.path.join(fs_folder, f"financial_statements_{year}.parquet")):
+        files.append(("financial_statements", [os.path.join(fs_folder, f"financial_statements_{year}.parquet")]))
+    if efs_folder:
+        if os.path.exists(os.path.join(efs_folder, f"companies_all_tags_{year}.parquet")):
+            files.append(("companies_all_tags", [os.path.join(efs_folder, f"companies_all_tags_{year}.parquet")]))
+        long_paths = sorted(glob.glob(os.path.join(efs_folder, "companies_all_tags_long", f"year={year}", "*.parquet")))
+        if long_paths:
+            files.append(("companies_all_tags_long", long_paths))
+    return files
+
+
+def publish_year(root, year, **folders):
+    """Write every loose output file of a year into the dataset (see loose_files)."""
+    for table, paths in loose_files(year, **folders):
+        rows = write_partition(paths, root, table, year)
+        print(f"  {table}/year={year}: {rows} rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Publish the loose output files as a hive-partitioned dataset')
+    parser.add_argument('--root', default=DATASET_ROOT, help='Dataset root folder (default: $DATASET_ROOT)')
+    parser.add_argument('--years', type=int, nargs=2, required=True, metavar=('FIRST', 'LAST'), help='Years to publish')
+    parser.add_argument('--company-folder', default=COMPANY_DATA_FOLDER_PATH)
+    parser.add_argument('--fs-folder', default=FS_FOLDER_PATH)
+    parser.add_argument('--efs-folder', default=EFS_FOLDER_PATH)
+    args = parser.parse_args()
+
+    if not args.root:
+        parser.error('--root (or DATASET_ROOT) is required')
+    first, last = args.years
+    for year in range(first, last + 1):
+        print(f"Publishing {year}...")
+        publish_year(args.root, year, company_folder=args.company_folder, fs_folder=args.fs_folder,
+                     efs_folder=args.efs_folder)
@@ -0,0 +1,213 @@
+"""
+Pre-flight sizing of an extraction run (the --dry-run option of the extraction scripts).
+
+The run's query is sent with track_total_hits for the exact number of documents, and a
+few sample pages are fetched: the first page of each slice of a sliced scroll, so the
+sample is spread over the whole index instead of its first documents. Each sample page
+is timed, its decoded size measured, and it goes through the run's own explode (or
+flatten) functions. The rows of each table over all sample pages are encoded to parquet
+once. The per-document figures are extrapolated to:
+
+    transfer volume      documents x bytes per document
+    rows per table       documents x rows per document
+    output size          the file footer (the size of an empty file of the table) plus
+                         documents x parquet data bytes per document
+    peak memory          what the mode keeps in memory (all exploded rows, or the memory
+                         budget, plus raw hits for wide/JSON output and the pages in flight)
+    wall time            pages x page latency / slices, plus the explode and write time
+                         (overlapping the download when pages are exploded while the
+                         slices keep downloading)
+
+Usage:
+    python virksomhed_api_call.py --year 2024 --dry-run
+    python produktionsenhed_api_call.py --year 2024 --slices 4 --dry-run
+"""
+
+import io
+import os
+import json
+import math
+import time
+import tracemalloc
+import requests
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from run_metrics import peak_rss_mb
+from schemas import schema_for, conform
+
+SAMPLE_PAGES = 3
+TIMEOUT = (30, 300)  # (connect, read) seconds
+
+
+def sample_pages(search_url, scroll_url, query, headers, pages=SAMPLE_PAGES):
+    """
+    Fetch the first page of every slice of a sliced scroll.
+
+    Returns:
+        Total number of documents (sum of the slice totals) and a list of
+        {"hits", "seconds", "bytes", "decoded_bytes"} per page
+    """
+    query = {**query, "track_total_hits": True}
+    total, samples = 0, []
+    for slice_id in range(pages):
+        body = {**query, "slice": {"id": slice_id, "max": pages}} if pages > 1 else query
+        start = time.perf_counter()
+        response = requests.post(f"{search_url}?scroll=1m", json=body, headers=headers, timeout=TIMEOUT)
+        seconds = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"Request failed with status code {response.status_code}: {response.text[:200]}")
+
+        # Memory of the decoded page (Python objects), which is what the scripts hold
+        tracemalloc.start()
+        data = json.loads(response.content)
+        decoded_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        if data.get('_scroll_id'):
+            try:
+                requests.delete(scroll_url, json={"scroll_id": [data['_scroll_id']]}, headers=headers,
+                                timeout=(TIMEOUT[0], 10))
+            except requests.exceptions.RequestException:
+                pass
+        hits_total = data.get("hits", {}).get("total")
+        total += hits_total.get("value", 0) if isinstance(hits_total, dict) else (hits_total or 0)
+        samples.append({"hits": data["hits"]["hits"], "seconds": seconds, "bytes": len(response.content),
+                        "decoded_bytes": decoded_bytes})
+    return total, samples
+
+
+def _to_table(result):
+    """An explode result as the Arrow table the PanelBuilder holds (typed by schemas.schema_for)."""
+    return result if isinstance(result, pa.Table) else conform(result, schema_for(result.columns))
+
+
+def _encode(table):
+    """Parquet bytes and encode seconds of a table."""
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    if table.num_columns:
+        pq.write_table(table, buffer)
+    return buffer.tell(), time.perf_counter() - start
+
+
+def estimate(search_url, scroll_url, query, headers, tables, size, sample_pages_count=SAMPLE_PAGES, slices=1,
+             pipelined=False, memory_budget=None, keep_raw=False, in_flight_pages=1):
+    """
+    Estimate the size, memory and duration of an extraction run from a few sample pages.
+
+    Args:
+        search_url, scroll_url: Search and scroll endpoints
+        query: The run's search query (size is set to `size`)
+        headers: Request headers
+        tables: Dictionary of table name -> function taking a list of hits and returning a
+            DataFrame, a pyarrow Table or a dictionary of sub-table name -> DataFrame
+        size: Documents per page of the run
+        slices: Scroll slices downloaded in parallel
+        pipelined: Pages are exploded while the slices keep downloading
+        memory_budget: MB of exploded rows held in memory before spilling (None: no limit)
+        keep_raw: The run keeps every decoded hit in memory (wide and JSON output)
+        in_flight_pages: Decoded pages held in memory at a time
+
+    Returns:
+        Dictionary with the estimates (see print_estimate)
+    """
+    baseline_mb = peak_rss_mb()
+    total, samples = sample_pages(search_url, scroll_url, {**query, "size": size}, headers, sample_pages_count)
+    docs = sum(len(sample["hits"]) for sample in samples)
+    if docs == 0:
+        return {"documents": total, "sample_documents": 0}
+
+    sample_tables, explode_seconds, write_seconds = {}, 0.0, 0.0
+    for sample in samples:
+        for name, explode in tables.items():
+            start = time.perf_counter()
+            result = explode(sample["hits"])
+            explode_seconds += time.perf_counter() - start
+            for table_name, frame in (result if isinstance(result, dict) else {name: result}).items():
+                sample_tables.setdefault(table_name, []).append(_to_table(frame))
+
+    # Encode the sample rows of each table once, as the run writes one file per table: the
+    # footer is paid once, only the data grows with the documents
+    scale = total / docs
+    per_table = {}
+    for name, parts in sample_tables.items():
+        table = pa.concat_tables(parts, promote_options="permissive")
+        parquet_bytes, seconds = _encode(table)
+        footer_bytes, _ = _encode(table.schema.empty_table())
+        write_seconds += seconds
+        per_table[name] = {"rows": int(table.num_rows * scale),
+                           "memory_bytes": int(sum(part.nbytes for part in parts) * scale),
+                           "parquet_bytes": int(footer_bytes + max(parquet_bytes - footer_bytes, 0) * scale)}
+    pages = math.ceil(total / size)
+    page_seconds = sum(sample["seconds"] for sample in samples) / len(samples)
+    decoded_per_doc = sum(sample["decoded_bytes"] for sample in samples) / docs
+
+    # Memory: exploded rows (or the budget), the copy made when a table is concatenated at
+    # the end, raw hits for wide/JSON output and the decoded pages in flight
+    exploded = sum(stats["memory_bytes"] for stats in per_table.values())
+    largest = max((stats["memory_bytes"] for stats in per_table.values()), default=0)
+    if memory_budget:
+        held = min(exploded, memory_budget * 1024 * 1024)
+        finish_copy = 0
+    else:
+        held, finish_copy = exploded, largest
+    raw = decoded_per_doc * total if keep_raw else 0
+    in_flight = decoded_per_doc * min(size, total) * in_flight_pages
+    peak_mb = baseline_mb + (held + finish_copy + raw + in_flight) / (1024 * 1024)
+
+    download = pages * page_seconds / slices
+    process = (explode_seconds + write_seconds) * scale
+    wall = max(download, process) if pipelined else download + process
+
+    return {
+        "documents": total,
+        "sample_documents": docs,
+        "pages": pages,
+        "transfer_bytes": int(sum(sample["bytes"] for sample in samples) * scale),
+        "page_seconds": page_seconds,
+        "tables": per_table,
+        "output_bytes": sum(stats["parquet_bytes"] for stats in per_table.values()),
+        "peak_memory_mb": peak_mb,
+        "download_seconds": download,
+        "process_seconds": process,
+        "wall_seconds": wall,
+        # Slices beyond this only add load: the single-threaded explode becomes the bottleneck
+        "useful_slices": max(1, math.ceil(pages * page_seconds / process)) if process else slices,
+    }
+
+
+def _size(nbytes):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if nbytes < 1024 or unit == "GB":
+            return f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+
+
+def _duration(seconds):
+    return f"{seconds / 3600:.1f} h" if seconds >= 3600 else f"{seconds / 60:.1f} min"
+
+
+def print_estimate(report):
+    """Print an estimate returned by estimate()."""
+    if not report.get("sample_documents"):
+        print(f"Dry run: {report['documents']} documents; nothing to sample.")
+        return
+    print(f"\nDry run estimate (from {report['sample_documents']} sampled documents):")
+    print(f"  Documents:     {report['documents']} in {report['pages']} pages")
+    print(f"  Transfer:      {_size(report['transfer_bytes'])} ({report['page_seconds']:.2f} s per page)")
+    print(f"  Output:        {_size(report['output_bytes'])} of parquet")
+    print(f"  Peak memory:   {report['peak_memory_mb']:.0f} MB")
+    print(f"  Wall time:     {_duration(report['wall_seconds'])} (download {_duration(report['download_seconds'])}, "
+          f"explode and write {_duration(report['process_seconds'])})")
+    print(f"  Useful slices: up to {report['useful_slices']}")
+    print("  Rows per table:")
+    for name, stats in report["tables"].items():
+        print(f"    {name:<40} {stats['rows']:>14,} rows  {_size(stats['parquet_bytes']):>10}")
+
+
+def write_estimate(report, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
@@ -5,13 +5,17 @@ the financial data, flattens nested structures, and saves as parquet
 """
 
 import os
+import sys
 import json
 import base64
-import logging
 import requests
 import pandas as pd
+import pyarrow.parquet as pq
 from dotenv import load_dotenv
-from funcy import print_durations
+from run_metrics import RunMetrics, PROFILERS
+from dataset_writer import write_partition
+from dry_run import estimate, print_estimate, write_estimate
+from schemas import schema_for, conform, to_frame
 
 load_dotenv()
 
@@ -23,6 +27,7 @@ OUTPUT_FILENAME = "financial_statements"
 
 # API ENDPOINT
 FINANCIAL_STATMENTS_API_ENDPOINT = "http://distribution.virk.dk/offentliggoerelser/_search"
+SCROLL_API_ENDPOINT = "http://distribution.virk.dk/_search/scroll"
 
 
 def flatten_financial_data(json_data):
@@ -86,18 +91,41 @@ def flatten_financial_data(json_data):
     else:
         df_combined = df_flattened
 
-    return df_combined
+    return to_frame(conform(df_combined, schema_for(df_combined.columns)))
 
 
-@print_durations() # 25 min to 1 hour 500 Mb/s high speed internet
+# 25 min to 1 hour on 500 Mb/s high speed internet
 def main(virk_username=VIRK_USERNAME,
          virk_password=VIRK_PASSWORD,
          financial_statments_api_endpoint=FINANCIAL_STATMENTS_API_ENDPOINT,
+         scroll_api_endpoint=SCROLL_API_ENDPOINT,
          fs_folder_path=FS_FOLDER_PATH,
          output_filename=OUTPUT_FILENAME,
          size=3000,
          year=None,
-         save_format="parquet"):
+         save_format="parquet",
+         metrics_path=None,
+         prometheus_path=None,
+         profile=None,
+         profile_dir=None,
+         dataset_root=None,
+         dry_run=False):
+    """
+    Download financial statements from Virk API.
+
+    Returns None, without writing any output or run report, if a request fails (also in the
+    middle of the scroll).
+
+    Args:
+        metrics_path: Path of the JSON run report (default: {output_filename}_run_report.json in the output folder)
+        prometheus_path: Optional path of a Prometheus textfile with the run metrics
+        profile: None, "cprofile" or "pyinstrument" to profile every stage
+        profile_dir: Folder for the per-stage profiles (default: the output folder)
+        dataset_root: Also write the parquet output into this hive-partitioned dataset as
+            financial_statements/year={year} (see dataset_writer.py; requires a year)
+        dry_run: Only estimate the documents, transfer, rows, peak memory and wall time of the
+            run from a few sample pages (see dry_run.py); returns the estimate
+    """
 
     url = f"{financial_statments_api_endpoint}?scroll=1m"
     credentials = f"{virk_username}:{virk_password}"
@@ -149,7 +177,20 @@ def main(virk_username=VIRK_USERNAME,
         }
         print("Retrieving all financial data...")
 
-    response = requests.post(url, json=query, headers=headers)
+    if dry_run:
+        # Every hit is kept until the end and flattened at once
+        report = estimate(financial_statments_api_endpoint, scroll_api_endpoint, query, headers,
+                          {OUTPUT_FILENAME: flatten_financial_data}, size, keep_raw=True)
+        print_estimate(report)
+        write_estimate(report, os.path.join(fs_folder_path, f"{output_filename}_dry_run.json"))
+        return report
+
+    metrics = RunMetrics(output_filename, profile=profile, profile_dir=profile_dir or fs_folder_path,
+                         params={"year": year, "size": size, "save_format": save_format})
+
+    with metrics.stage("request") as stage:
+        response = requests.post(url, json=query, headers=headers)
+        stage["bytes"] = len(response.content)
 
     if response.status_code != 200:
         print(f"Request failed with status code: {response.status_code}")
@@ -158,7 +199,9 @@ def main(virk_username=VIRK_USERNAME,
     else:
         print("Starting data retrieval...")
 
-    response_data = response.json()
+    with metrics.stage("decode") as stage:
+        response_data = response.json()
+        stage["rows"] = len(response_data.get("hits", {}).get("hits", []))
 
     # Scroll to get all data
     if '_scroll_id' not in response_data:
@@ -168,34 +211,48 @@ def main(virk_username=VIRK_USERNAME,
     scroll_id = response_data['_scroll_id']
     hits = response_data['hits']['hits']
     all_results = hits
+    scroll_failed = False
 
     while len(hits) > 0:
-        scroll_url = "http://distribution.virk.dk/_search/scroll"
+        scroll_url = scroll_api_endpoint
         scroll_query = {
             "scroll": "1m",
             "scroll_id": scroll_id
         }
-        scroll_response = requests.post(scroll_url, json=scroll_query, headers=headers)
+        with metrics.stage("request") as stage:
+            scroll_response = requests.post(scroll_url, json=scroll_query, headers=headers)
+            stage["bytes"] = len(scroll_response.content)
 
         if scroll_response.status_code != 200:
             print(f"Scroll request failed with status code: {scroll_response.status_code}")
             print(scroll_response.text)
+            scroll_failed = True
             break
 
-        scroll_data = scroll_response.json()
+        with metrics.stage("decode") as stage:
+            scroll_data = scroll_response.json()
+            stage["rows"] = len(scroll_data.get("hits", {}).get("hits", []))
 
         if '_scroll_id' not in scroll_data:
             print("No scroll ID found in the scroll response.")
+            scroll_failed = True
             break
 
         scroll_id = scroll_data['_scroll_id']
         hits = scroll_data['hits']['hits']
         all_results.extend(hits)
 
+    if scroll_failed:
+        # A partial pull must not pass for a complete one: no output file and no run report
+        print(f"Scroll stopped after {len(all_results)} records; nothing was saved.")
+        return None
+
     print(f"API call completed. Total records retrieved: {len(all_results)}")
 
     # Flatten the nested JSON structure
-    df_flattened = flatten_financial_data(all_results)
+    with metrics.stage("explode/financial_statements") as stage:
+        df_flattened = flatten_financial_data(all_results)
+        stage["rows"] = len(df_flattened)
 
     print(f"Flattened DataFrame shape: {df_flattened.shape}")
     print(f"Columns: {len(df_flattened.columns)}")
@@ -204,15 +261,27 @@ def main(virk_username=VIRK_USERNAME,
     if save_format.lower() == "parquet":
         file_path = os.path.join(fs_folder_path, f"{output_filename}.parquet")
         print(f"Saving data as parquet to {file_path}...")
-        df_flattened.to_parquet(file_path, index=False)
+        with metrics.stage("write/financial_statements", rows=len(df_flattened)) as stage:
+            pq.write_table(conform(df_flattened, schema_for(df_flattened.columns)), file_path)
+            stage["bytes"] = os.path.getsize(file_path)
+        if dataset_root and year is not None:
+            with metrics.stage("publish/financial_statements") as stage:
+                stage["rows"] = write_partition(file_path, dataset_root, OUTPUT_FILENAME, year)
+            print(f"Published to {dataset_root}")
+        elif dataset_root:
+            print("Publishing to the dataset needs a year; skipping it.")
     else:
         # Fallback to JSON for backward compatibility
         file_path = os.path.join(fs_folder_path, f"{output_filename}.json")
         print(f"Saving data as JSON to {file_path}...")
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(all_results, f, ensure_ascii=False, indent=4)
+        with metrics.stage("write/raw_json", rows=len(all_results)):
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(all_results, f, ensure_ascii=False, indent=4)
 
     print("Data saved successfully!")
+    if metrics_path is None:
+        metrics_path = os.path.join(fs_folder_path, f"{output_filename}_run_report.json")
+    metrics.finish(metrics_path, prometheus_path)
     return df_flattened
 
 
@@ -223,6 +292,18 @@ if __name__ == "__main__":
     parser.add_argument('--year', type=int, help='Filter data by specific year')
     parser.add_argument('--format', choices=['parquet', 'json'], default='parquet',
                         help='Output format (default: parquet)')
+    parser.add_argument('--dataset-root', help='Also write the output into this hive-partitioned dataset (needs --year)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only estimate the size, peak memory and wall time of the run from a few sample pages')
+    parser.add_argument('--metrics-json', help='Path of the JSON run report (default: next to the output file)')
+    parser.add_argument('--prometheus-textfile', help='Also write the run metrics as a Prometheus textfile')
+    parser.add_argument('--profile', choices=PROFILERS, help='Profile every stage with cProfile or pyinstrument')
+    parser.add_argument('--profile-dir', help='Folder for the per-stage profiles (default: the output folder)')
     args = parser.parse_args()
 
-    main(year=args.year, save_format=args.format)
+    result = main(year=args.year, save_format=args.format,
+                  metrics_path=args.metrics_json, prometheus_path=args.prometheus_textfile,
+                  profile=args.profile, profile_dir=args.profile_dir, dataset_root=args.dataset_root,
+                  dry_run=args.dry_run)
+    if result is None:
+        sys.exit(1)
@@ -0,0 +1,326 @@
+"""
+Consolidated multi-year archive of the virksomhed panel tables.
+
+Every yearly pull holds the complete history of each company updated that year, so a
+company updated in 2019, 2021 and 2024 brings the same history rows three times. The
+archive keeps every unique row of a table once. Each row is identified by a 64-bit
+content hash of its non-null values. The yearly pulls that contained it are recorded
+as a bit mask, from which first_seen and last_seen are derived.
+
+Layout of a table in the archive:
+
+    {archive}/{table}/rows_{year}_{n}.parquet    rows first seen in that pull (append-only)
+    {archive}/{table}/seen.parquet               row_hash -> years bit mask, sorted by hash
+    {archive}/{table}/repeats.parquet            row_hash, year -> count, for rows a pull holds more than once
+
+Adding a year hashes the pull, writes only the rows not seen before and rewrites the
+small seen file (16 bytes per unique row). Adding a year again (e.g. a re-pull)
+replaces its bits. Rows whose mask becomes empty stay in their data file and are
+skipped on load, as are rows whose hash is not in the seen file (a data file written
+by an add that did not finish).
+
+A pull can hold identical rows (e.g. the same period registered twice). Their count
+is kept in the repeats file, so load(table, year=...) returns the pull with its
+duplicates and stats() counts them in pulled_rows. load(table) without a year returns
+each unique row once.
+
+Hashes ignore the column order and null columns, so a column added in a later year
+does not make the old rows look new. Numbers are hashed as float64, so a column read
+as Int64 one year and float the next still matches. Translated files (translate.py)
+have other column names and values, so do not mix them with untranslated years.
+
+Usage:
+    python history_archive.py add --folder /data/cvr --archive /data/cvr_archive --years 2015 2024
+    python history_archive.py stats --archive /data/cvr_archive
+    python history_archive.py load --archive /data/cvr_archive --table navne --year 2021 --out navne_2021.parquet
+
+    archive = HistoryArchive(root)
+    archive.load("navne")              # every unique row with first_seen / last_seen
+    archive.load("navne", year=2021)   # the rows of the 2021 pull
+"""
+
+import os
+import glob
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from cvr_index import panel_files
+
+load_dotenv()
+
+COMPANY_DATA_FOLDER_PATH = os.getenv("COMPANY_DATA_FOLDER_PATH")
+HISTORY_ARCHIVE_PATH = os.getenv("HISTORY_ARCHIVE_PATH")
+OUTPUT_FILENAME = "virksomhed"
+
+# Bit 0 of the years mask is FIRST_YEAR; a uint64 mask covers 64 yearly pulls
+FIRST_YEAR = 1990
+LAST_YEAR = FIRST_YEAR + 63
+HASH_COLUMN = "row_hash"
+SEEN_FILENAME = "seen.parquet"
+REPEATS_FILENAME = "repeats.parquet"
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def year_bit(year):
+    if not FIRST_YEAR <= year <= LAST_YEAR:
+        raise ValueError(f"Year {year} is outside the archive range {FIRST_YEAR}-{LAST_YEAR}")
+    return np.uint64(1) << np.uint64(year - FIRST_YEAR)
+
+
+def _column_values(column):
+    """Values of a column in the form they are hashed in (float64 numbers, int64 datetimes, objects)."""
+    if pd.api.types.is_bool_dtype(column) or pd.api.types.is_numeric_dtype(column):
+        return column.to_numpy(dtype=np.float64, na_value=np.nan)
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.to_numpy(dtype="datetime64[ns]").view(np.int64)
+    return column.to_numpy(dtype=object)
+
+
+def row_hashes(df):
+    """
+    64-bit content hash of every row of a DataFrame.
+
+    Each non-null value is hashed together with its column name and the results are
+    summed, so the hash does not depend on the column order or on null columns.
+
+    Returns:
+        numpy uint64 array
+    """
+    hashes = np.zeros(len(df), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for name in df.columns:
+            column = df[name]
+            name_hash = pd.util.hash_array(np.array([name], dtype=object))[0]
+            values = _column_values(column)
+            if values.dtype == object:
+                # Hash each distinct value once (nulls are zeroed below)
+                codes, uniques = pd.factorize(values)
+                hashed = pd.util.hash_array(np.asarray(uniques, dtype=object))[codes] if len(uniques) else codes.astype(np.uint64)
+            else:
+                hashed = pd.util.hash_array(values)
+            mixed = (hashed ^ name_hash) * _MIX
+            mixed ^= mixed >> np.uint64(29)
+            mixed[column.isna().to_numpy()] = 0
+            hashes += mixed
+    return hashes
+
+
+def seen_years(mask):
+    """first_seen and last_seen years of a years bit mask array."""
+    mask = np.asarray(mask, dtype=np.uint64)
+    with np.errstate(divide="ignore"):
+        lowest = mask & (~mask + np.uint64(1))
+        first = np.log2(lowest.astype(np.float64)).astype(np.int64) + FIRST_YEAR
+        last = np.floor(np.log2(mask.astype(np.float64))).astype(np.int64) + FIRST_YEAR
+    return first, last
+
+
+class HistoryArchive:
+    """
+    Deduplicated multi-year store of the panel tables.
+
+    Args:
+        root: Archive folder
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def tables(self):
+        return sorted(os.path.basename(os.path.dirname(path))
+                      for path in glob.glob(os.path.join(self.root, "*", SEEN_FILENAME)))
+
+    def _read_seen(self, table):
+        path = os.path.join(self.root, table, SEEN_FILENAME)
+        if not os.path.exists(path):
+            return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.uint64)
+        seen = pq.read_table(path)
+        return (seen[HASH_COLUMN].to_numpy().astype(np.uint64),
+                seen["years"].to_numpy().astype(np.uint64))
+
+    def _write_seen(self, table, hashes, years):
+        path = os.path.join(self.root, table, SEEN_FILENAME)
+        seen = pa.table({HASH_COLUMN: pa.array(hashes, type=pa.uint64()), "years": pa.array(years, type=pa.uint64())})
+        pq.write_table(seen, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+    def _read_repeats(self, table):
+        path = os.path.join(self.root, table, REPEATS_FILENAME)
+        if not os.path.exists(path):
+            return pd.DataFrame({HASH_COLUMN: np.empty(0, dtype=np.uint64), "year": np.empty(0, dtype=np.int16),
+                                 "count": np.empty(0, dtype=np.int64)})
+        return pd.read_parquet(path)
+
+    def _write_repeats(self, table, repeats):
+        path = os.path.join(self.root, table, REPEATS_FILENAME)
+        repeats.to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+
+    def _match_seen(self, table, hashes):
+        """Years masks of row hashes (0 for hashes missing from the seen file)."""
+        seen_hashes, seen_masks = self._read_seen(table)
+        positions = np.searchsorted(seen_hashes, hashes)
+        found = positions < len(seen_hashes)
+        found[found] = seen_hashes[positions[found]] == hashes[found]
+        masks = np.zeros(len(hashes), dtype=np.uint64)
+        masks[found] = seen_masks[positions[found]]
+        return masks
+
+    def add(self, df, table, year):
+        """
+        Add one yearly pull of a table.
+
+        Args:
+            df: DataFrame of the pull
+            table: Table name (e.g. navne)
+            year: Year of the pull
+
+        Returns:
+            Number of new unique rows written
+        """
+        bit = year_bit(year)
+        folder = os.path.join(self.root, table)
+        os.makedirs(folder, exist_ok=True)
+        seen_hashes, seen_masks = self._read_seen(table)
+        seen_masks &= ~bit
+
+        hashes = row_hashes(df)
+        unique_hashes, first_rows, counts = np.unique(hashes, return_index=True, return_counts=True)
+        positions = np.searchsorted(seen_hashes, unique_hashes)
+        found = positions < len(seen_hashes)
+        found[found] = seen_hashes[positions[found]] == unique_hashes[found]
+        seen_masks[positions[found]] |= bit
+
+        new_hashes = unique_hashes[~found]
+        if len(new_hashes):
+            new_rows = np.sort(first_rows[~found])
+            rows = df.iloc[new_rows].reset_index(drop=True)
+            rows[HASH_COLUMN] = pd.array(hashes[new_rows], dtype="UInt64")
+            n = len(glob.glob(os.path.join(folder, f"rows_{year}_*.parquet")))
+            rows.to_parquet(os.path.join(folder, f"rows_{year}_{n}.parquet"), index=False)
+
+            # Keep the seen file sorted by hash for the searchsorted above
+            all_hashes = np.concatenate([seen_hashes, new_hashes])
+            all_masks = np.concatenate([seen_masks, np.full(len(new_hashes), bit, dtype=np.uint64)])
+            order = np.argsort(all_hashes, kind="stable")
+            seen_hashes, seen_masks = all_hashes[order], all_masks[order]
+
+        # Rows the pull holds more than once (replacing the counts of an earlier add of the year)
+        repeats = self._read_repeats(table)
+        repeated = counts > 1
+        repeats = pd.concat([repeats[repeats["year"] != year],
+                             pd.DataFrame({HASH_COLUMN: unique_hashes[repeated],
+                                           "year": np.full(repeated.sum(), year, dtype=np.int16),
+                                           "count": counts[repeated].astype(np.int64)})], ignore_index=True)
+        self._write_repeats(table, repeats)
+        self._write_seen(table, seen_hashes, seen_masks)
+        return len(new_hashes)
+
+    def add_year(self, folder, year, tables=None, prefix=OUTPUT_FILENAME):
+        """
+        Add the panel files {prefix}_{year}_{table}.parquet of one year.
+
+        Returns:
+            Dictionary of table -> (rows in the pull, new unique rows)
+        """
+        counts = {}
+        for path, table, file_year in panel_files(folder, prefix):
+            if file_year != year or (tables is not None and table not in tables):
+                continue
+            df = pd.read_parquet(path)
+            if len(df.columns) == 0:
+                continue
+            counts[table] = (len(df), self.add(df, table, year))
+        return counts
+
+    def load(self, table, year=None, columns=None):
+        """
+        Unique rows of a table.
+
+        Args:
+            table: Table name
+            year: Optional year: the rows of that yearly pull, with the rows it holds more
+                than once repeated
+            columns: Optional list of columns to read
+
+        Returns:
+            DataFrame with first_seen and last_seen columns
+        """
+        paths = sorted(glob.glob(os.path.join(self.root, table, "rows_*.parquet")))
+        if not paths:
+            raise KeyError(f"No table {table!r} in {self.root}")
+        read_columns = None if columns is None else list(dict.fromkeys([*columns, HASH_COLUMN]))
+        rows = pa.concat_tables([pq.read_table(path, columns=read_columns).replace_schema_metadata(None)
+                                 for path in paths], promote_options="permissive")
+
+        # Rows of an unfinished add are not in the seen file (mask 0), and may be written
+        # again by the next add of their year: keep the first row of each hash
+        hashes = rows[HASH_COLUMN].to_numpy().astype(np.uint64)
+        masks = self._match_seen(table, hashes)
+        keep = (masks & year_bit(year)) != 0 if year is not None else masks != 0
+        _, first_rows = np.unique(hashes, return_index=True)
+        keep &= np.isin(np.arange(len(hashes)), first_rows)
+        take = np.flatnonzero(keep)
+        if year is not None:
+            repeats = self._read_repeats(table)
+            repeats = repeats[repeats["year"] == year]
+            counts = pd.Series(repeats["count"].to_numpy(), index=repeats[HASH_COLUMN].to_numpy())
+            take = np.repeat(take, counts.reindex(hashes[take]).fillna(1).to_numpy(dtype=np.int64))
+        df = rows.take(take).drop_columns([HASH_COLUMN]).to_pandas()
+        df["first_seen"], df["last_seen"] = seen_years(masks[take])
+        return df
+
+    def stats(self):
+        """Unique rows and rows over all yearly pulls (duplicates within a pull included) per table."""
+        stats = []
+        for table in self.tables():
+            _, masks = self._read_seen(table)
+            masks = masks[masks != 0]
+            repeats = self._read_repeats(table)
+            pulls = sum(int(((masks >> np.uint64(bit)) & np.uint64(1)).sum()) for bit in range(64))
+            pulls += int((repeats["count"] - 1).sum())
+            years = [FIRST_YEAR + bit for bit in range(64) if ((masks >> np.uint64(bit)) & np.uint64(1)).any()]
+            stats.append({"table": table, "unique_rows": len(masks), "pulled_rows": pulls,
+                          "years": f"{min(years)}-{max(years)}" if years else ""})
+        return pd.DataFrame(stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Deduplicated multi-year archive of the virksomhed panel tables')
+    parser.add_argument('command', choices=['add', 'stats', 'load'],
+                        help='add: add yearly pulls; stats: rows per table; load: write the unique rows of a table')
+    parser.add_argument('--archive', default=HISTORY_ARCHIVE_PATH, help='Archive folder (default: $HISTORY_ARCHIVE_PATH)')
+    parser.add_argument('--folder', default=COMPANY_DATA_FOLDER_PATH, help='add: folder with the panel files')
+    parser.add_argument('--years', type=int, nargs=2, metavar=('FIRST', 'LAST'), help='add: years to add')
+    parser.add_argument('--tables', nargs='+', help='add: only these tables')
+    parser.add_argument('--table', help='load: table name')
+    parser.add_argument('--year', type=int, help='load: only the rows of this yearly pull')
+    parser.add_argument('--out', help='load: output parquet file')
+    args = parser.parse_args()
+
+    if not args.archive:
+        parser.error('--archive (or HISTORY_ARCHIVE_PATH) is required')
+    archive = HistoryArchive(args.archive)
+    if args.command == 'add':
+        if not args.years:
+            parser.error('add requires --years')
+        first, last = args.years
+        for year in range(first, last + 1):
+            start = time.perf_counter()
+            counts = archive.add_year(args.folder, year, tables=args.tables)
+            print(f"{year}: {sum(rows for rows, _ in counts.values())} rows, "
+                  f"{sum(new for _, new in counts.values())} new in {time.perf_counter() - start:.1f}s")
+    elif args.command == 'stats':
+        print(archive.stats().to_string(index=False))
+    else:
+        if not args.table or not args.out:
+            parser.error('load requires --table and --out')
+        df = archive.load(args.table, year=args.year)
+        df.to_parquet(args.out, index=False)
+        print(f"Wrote {len(df)} rows to {args.out}")
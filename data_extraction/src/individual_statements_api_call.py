@@ -3,21 +3,39 @@
 
 This script:
 1. Fetches XML URLs for a given year.
-2. Downloads and parses XBRL XML files in batches.
+2. Downloads and parses XBRL XML files in one pipeline, checkpointing each batch
+   as a Parquet part file so an interrupted run resumes where it stopped.
 3. Directly transforms the data into wide format (pivot table).
-4. Outputs companies_all_tags_{year}.parquet files
+4. Outputs companies_all_tags_{year}.parquet files, or with --output long a
+   year-partitioned long-format fact dataset under companies_all_tags_long/
 
 """
 
 import os
+import re
+import sys
+import glob
+import json
+import hashlib
+import math
+import shutil
 import httpx
 import asyncio
 import argparse
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from array import array
+from collections import namedtuple
 from dotenv import load_dotenv
 from funcy import print_durations
 import xml.etree.ElementTree as ET
+from tqdm import tqdm
 from tqdm.asyncio import tqdm_asyncio
+from schemas import SCHEMAS, XBRL_FACTS, schema_for, conform, to_frame
+from run_metrics import RunMetrics
 
 load_dotenv()
 
@@ -45,7 +63,33 @@ def parse_arguments():
         '--batch-size',
         type=int,
         default=1000,
-        help='Number of URLs to process per batch (default: 1000)'
+        help='Number of URLs per checkpointed part file (default: 1000)'
+    )
+    parser.add_argument(
+        '--max-in-flight',
+        type=int,
+        default=50,
+        help='Maximum number of concurrent downloads (default: 50)'
+    )
+    parser.add_argument(
+        '--output',
+        choices=['wide', 'long'],
+        default='wide',
+        help='wide: one pivoted file per year (default). long: one row per fact, partitioned by fact year'
+    )
+    parser.add_argument(
+        '--multi-year',
+        action='store_true',
+        help='Read metadata and download each XML once for the whole year range, routing facts to their period year'
+    )
+    parser.add_argument(
+        '--tags',
+        help='File with the tags to keep, one per line ("Revenue" or "fsa:Revenue")'
+    )
+    parser.add_argument(
+        '--tag-prefix',
+        nargs='+',
+        help='Keep every tag of these taxonomy prefixes (e.g. fsa gsd)'
     )
     args = parser.parse_args()
 
@@ -63,16 +107,88 @@ def parse_arguments():
     return args
 
 
-def get_xml_dataframe(fs_folder_path=FS_FOLDER_PATH, input_filename=INPUT_FILENAME):
-    """Load the financial statements metadata file."""
-    input_path = os.path.join(fs_folder_path, f"{input_filename}.parquet")
-    df = pd.read_parquet(input_path)
-    return df
+XML_METADATA_COLUMNS = ["regnskabsperiode_slutDato", "AARSRAPPORT_xml"]
+# Period end column in the metadata files: financial_statements_api_call.py flattens it
+# from the regnskab object, other files name it directly
+END_DATE_COLUMNS = ["regnskab_regnskabsperiode_slutDato", "regnskabsperiode_slutDato"]
+
+
+def end_date_column(schema):
+    """Name of the period end column of a metadata file, or None if it has none."""
+    return next((name for name in END_DATE_COLUMNS if name in schema.names), None)
+
+
+def end_date_filter(schema, years):
+    """Build a pyarrow filter keeping rows whose accounting period ends within the given years."""
+    column = end_date_column(schema)
+    field = ds.field(column)
+    date_type = schema.field(column).type
+    start, end = f"{min(years)}-01-01", f"{max(years) + 1}-01-01"
+    if pa.types.is_timestamp(date_type) or pa.types.is_date(date_type):
+        start = pa.scalar(pd.Timestamp(start)).cast(date_type)
+        end = pa.scalar(pd.Timestamp(end)).cast(date_type)
+    # ISO date strings compare correctly as plain strings
+    return (field >= start) & (field < end) & field.is_valid() & ds.field("AARSRAPPORT_xml").is_valid()
+
+
+def metadata_paths(fs_folder_path, input_filename, years=None):
+    """
+    Locate financial statement metadata files.
+
+    Prefers the combined {input_filename}.parquet. Otherwise falls back to the
+    year-partitioned {input_filename}_{year}.parquet files written by
+    financial_statements_api_call.py. Those are selected on period start or end
+    date, so a report ending in year Y can sit in the Y-1 file as well.
+    """
+    combined = os.path.join(fs_folder_path, f"{input_filename}.parquet")
+    if os.path.exists(combined):
+        return [combined]
+
+    if years is None:
+        candidates = sorted(glob.glob(os.path.join(fs_folder_path, f"{input_filename}_*.parquet")))
+    else:
+        candidates = [os.path.join(fs_folder_path, f"{input_filename}_{year}.parquet")
+                      for year in range(min(years) - 1, max(years) + 1)]
+    return [path for path in candidates if os.path.exists(path)]
+
+
+def get_xml_dataframe(fs_folder_path=FS_FOLDER_PATH, input_filename=INPUT_FILENAME, years=None):
+    """
+    Load the financial statements metadata needed to find XBRL URLs.
+
+    Only the period end date (regnskab_regnskabsperiode_slutDato as written by
+    financial_statements_api_call.py, or regnskabsperiode_slutDato; returned as
+    regnskabsperiode_slutDato) and the XML URL columns are read, and when years
+    are given the date range filter is pushed down into the Parquet scan. The
+    yearly files are memory-mapped and concatenated as Arrow tables with the
+    registered column types (ISO date strings, see schemas).
+    """
+    paths = metadata_paths(fs_folder_path, input_filename, years)
+    if not paths:
+        raise FileNotFoundError(f"No {input_filename} parquet files found in {fs_folder_path}")
+
+    schema = schema_for(XML_METADATA_COLUMNS)
+    tables = []
+    for path in paths:
+        file_schema = pq.read_schema(path)
+        end_date = end_date_column(file_schema)
+        if end_date is None or "AARSRAPPORT_xml" not in file_schema.names:
+            print(f"Skipping {path}: missing {END_DATE_COLUMNS[0]} or AARSRAPPORT_xml")
+            continue
+        row_filter = end_date_filter(file_schema, years) if years is not None else None
+        table = pq.read_table(path, columns=[end_date, "AARSRAPPORT_xml"], filters=row_filter, memory_map=True)
+        table = table.rename_columns(XML_METADATA_COLUMNS)
+        if pa.types.is_timestamp(table.schema.field("regnskabsperiode_slutDato").type):
+            # Cast through date32 so timestamps become plain ISO dates like the string files
+            table = table.set_column(0, "regnskabsperiode_slutDato", table[0].cast(pa.date32()))
+        tables.append(conform(table, schema))
+
+    return to_frame(pa.concat_tables(tables) if tables else schema.empty_table())
 
 
 def get_xml_urls_by_year(data, year):
     """Extract XML URLs for a specific year."""
-    df = data.copy()
+    df = data[XML_METADATA_COLUMNS].copy()
     df["regnskabsperiode_slutDato"] = pd.to_datetime(df["regnskabsperiode_slutDato"])
     cond_1 = df['regnskabsperiode_slutDato'].dt.year == year
     cond_2 = ~df['AARSRAPPORT_xml'].isna()
@@ -80,6 +196,18 @@ def get_xml_urls_by_year(data, year):
     return xml_urls
 
 
+def get_xml_urls_by_years(data, years):
+    """Extract unique XML URLs for several years, ordered by ascending report year."""
+    df = data[XML_METADATA_COLUMNS].copy()
+    df["regnskabsperiode_slutDato"] = pd.to_datetime(df["regnskabsperiode_slutDato"])
+    df["year"] = df["regnskabsperiode_slutDato"].dt.year
+    cond_1 = df["year"].isin(years)
+    cond_2 = ~df['AARSRAPPORT_xml'].isna()
+    df = df[cond_1 & cond_2].sort_values("year", kind="stable")
+    xml_urls = df["AARSRAPPORT_xml"].unique().tolist()
+    return xml_urls
+
+
 async def fetch_xml(client, url):
     """Fetch a single XML file from URL."""
     try:
@@ -94,25 +222,156 @@ async def fetch_xml(client, url):
         return url, None
 
 
-def parse_xml_content(xml_content):
-    """Parse XBRL XML content and return a DataFrame."""
+XBRL_NAMESPACES = {
+    "xbrli": "http://www.xbrl.org/2003/instance",
+    "gsd": "http://xbrl.dcca.dk/gsd",
+    "sob": "http://xbrl.dcca.dk/sob",
+    "cmn": "http://xbrl.dcca.dk/cmn",
+    "mrv": "http://xbrl.dcca.dk/mrv",
+    "fsa": "http://xbrl.dcca.dk/fsa"
+}
+
+
+class TagIndex(dict):
+    """
+    Namespace/tag intern table used by the parser.
+
+    Maps Clark-notation element names ("{http://xbrl.dcca.dk/fsa}Revenue") to an
+    integer tag code, or to None when the element is not selected. `names[code]`
+    holds the interned local tag name ("Revenue"). Tags listed explicitly are
+    precomputed; any other element name is resolved once on first sight and
+    cached, so each distinct tag is split and checked only once per process
+    instead of once per fact.
+
+    Args:
+        tags: Optional allow-list of tags, either "Revenue" (any namespace) or
+              "fsa:Revenue" (that namespace only)
+        prefixes: Optional taxonomy prefixes (e.g. ["fsa", "gsd"]) whose
+                  elements are all selected
+    """
+
+    def __init__(self, tags=None, prefixes=None):
+        super().__init__()
+        unknown = [p for p in (prefixes or []) if p not in XBRL_NAMESPACES]
+        if unknown:
+            raise ValueError(f"Unknown taxonomy prefixes {unknown}; expected one of {list(XBRL_NAMESPACES)}")
+
+        self.select_all = not tags and not prefixes
+        self.selection = {"tags": sorted(tags or []), "prefixes": sorted(prefixes or [])}
+        self.namespaces = {XBRL_NAMESPACES[p] for p in (prefixes or [])}
+        self.local_names = set()
+        self.names = []
+        self.codes = {}
+
+        for tag in tags or []:
+            prefix, _, local = tag.rpartition(":")
+            if prefix:
+                if prefix not in XBRL_NAMESPACES:
+                    raise ValueError(f"Unknown taxonomy prefix in tag {tag!r}")
+                self[f"{{{XBRL_NAMESPACES[prefix]}}}{local}"] = self.code_for(local)
+            else:
+                self.local_names.add(local)
+
+    def fingerprint(self):
+        """Short hash of the tag selection, stored with checkpoints (see process_url_batches)."""
+        return hashlib.sha1(json.dumps(self.selection, sort_keys=True).encode()).hexdigest()[:16]
+
+    def code_for(self, local):
+        """Return the code of a local tag name, interning it on first use."""
+        code = self.codes.get(local)
+        if code is None:
+            code = self.codes[local] = len(self.names)
+            self.names.append(sys.intern(local))
+        return code
+
+    def __missing__(self, clark_name):
+        if clark_name.startswith("{"):
+            namespace, _, local = clark_name[1:].partition("}")
+        else:
+            namespace, local = "", clark_name
+        selected = self.select_all or namespace in self.namespaces or local in self.local_names
+        value = self.code_for(local) if selected else None
+        self[clark_name] = value
+        return value
+
+
+DEFAULT_TAG_INDEX = TagIndex()
+
+
+def load_tag_list(path):
+    """Read a tag allow-list file: one tag per line ("Revenue" or "fsa:Revenue"), '#' starts a comment."""
+    tags = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            tag = line.split("#", 1)[0].strip()
+            if tag:
+                tags.append(tag)
+    return tags
+
+
+def parse_fact_value(text, unit_ref):
+    """
+    Split a raw XBRL fact value into its numeric and string parts.
+
+    Facts carrying a unitRef (monetary, shares, pure ratios) are numeric
+    by definition of the taxonomy and are returned as float. Everything
+    else (names, dates, free text) is kept as a stripped string.
+
+    Returns:
+        Tuple (value_num, value_str) where exactly one is not None,
+        or (None, None) for empty/nil facts.
+    """
+    if text is None:
+        return None, None
+    text = text.strip()
+    if not text:
+        return None, None
+    if unit_ref:
+        try:
+            return float(text), None
+        except ValueError:
+            pass
+    return None, text
+
+
+# One parsed document: per-fact codes in compact arrays plus small per-document
+# tables (contexts, units, decimals) that the codes point into.
+FactBlock = namedtuple("FactBlock", [
+    "tag_codes", "context_codes", "unit_codes", "decimals_codes",
+    "value_num", "value_str", "contexts", "units", "decimals",
+])
+
+FACT_COLUMNS = [
+    "tag", "value_num", "value_str", "unit", "contextRef", "unitRef", "decimals",
+    "identifier", "start_date", "end_date", "instant",
+]
+
+
+def parse_xml_facts(xml_content, tag_index=None):
+    """
+    Parse XBRL XML content into a compact FactBlock.
+
+    No per-fact dict is created: each fact appends a tag code (from `tag_index`),
+    a context code, a unit code and a decimals code to integer arrays, and its
+    value to `value_num` (NaN for non-numeric facts) or `value_str`. Contexts,
+    units and decimals are stored once per document in small tables.
+
+    Returns:
+        FactBlock, or None if the document could not be parsed
+    """
     if xml_content is None:
-        return pd.DataFrame()
+        return None
+
+    if tag_index is None:
+        tag_index = DEFAULT_TAG_INDEX
 
     try:
         root = ET.fromstring(xml_content)
 
-        ns = {
-            "xbrli": "http://www.xbrl.org/2003/instance",
-            "gsd": "http://xbrl.dcca.dk/gsd",
-            "sob": "http://xbrl.dcca.dk/sob",
-            "cmn": "http://xbrl.dcca.dk/cmn",
-            "mrv": "http://xbrl.dcca.dk/mrv",
-            "fsa": "http://xbrl.dcca.dk/fsa"
-        }
-
-        # Extract context information
-        contexts = {}
+        ns = XBRL_NAMESPACES
+
+        # Context table: (contextRef, identifier, start_date, end_date, instant)
+        contexts, context_codes = [], {}
         for context in root.findall("xbrli:context", ns):
             context_id = context.get("id")
             period = context.find("xbrli:period", ns)
@@ -125,50 +384,162 @@ def parse_xml_content(xml_content):
             end_date = period.findtext("xbrli:endDate", default="", namespaces=ns)
             instant = period.findtext("xbrli:instant", default="", namespaces=ns)
 
-            contexts[context_id] = {
-                "identifier": identifier,
-                "start_date": start_date,
-                "end_date": end_date,
-                "instant": instant,
-            }
+            context_codes[context_id] = len(contexts)
+            contexts.append((context_id, identifier, start_date, end_date, instant))
+
+        # Unit table: (unitRef, measure); divide units are written as "numerator/denominator"
+        units, unit_codes = [("", "")], {"": 0}
+        for unit in root.findall("xbrli:unit", ns):
+            measures = [m.text.strip() for m in unit.iter(f"{{{ns['xbrli']}}}measure") if m.text]
+            unit_codes[unit.get("id")] = len(units)
+            units.append((unit.get("id"), "/".join(measures)))
+
+        decimals, decimals_codes = [], {}
+        block = FactBlock(array("i"), array("i"), array("i"), array("i"), array("d"), [],
+                          contexts, units, decimals)
 
         # Extract all financial data elements
-        records = []
         for elem in root.iter():
-            if 'contextRef' in elem.attrib:
-                tag = elem.tag.split("}")[-1]
-                value = elem.text
-                context_ref = elem.attrib['contextRef']
-                unit_ref = elem.attrib.get('unitRef', '')
-                decimals = elem.attrib.get('decimals', '')
-                records.append({
-                    "tag": tag,
-                    "value": value,
-                    "contextRef": context_ref,
-                    "unitRef": unit_ref,
-                    "decimals": decimals,
-                    **contexts.get(context_ref, {})
-                })
-        return pd.DataFrame(records)
+            attrib = elem.attrib
+            context_ref = attrib.get("contextRef")
+            if context_ref is None:
+                continue
+            tag_code = tag_index[elem.tag]
+            if tag_code is None:
+                continue
+
+            context_code = context_codes.get(context_ref)
+            if context_code is None:
+                context_code = context_codes[context_ref] = len(contexts)
+                contexts.append((context_ref, None, None, None, None))
+
+            unit_ref = attrib.get("unitRef", "")
+            unit_code = unit_codes.get(unit_ref)
+            if unit_code is None:
+                unit_code = unit_codes[unit_ref] = len(units)
+                units.append((unit_ref, unit_ref))
+
+            decimals_value = attrib.get("decimals", "")
+            decimals_code = decimals_codes.get(decimals_value)
+            if decimals_code is None:
+                decimals_code = decimals_codes[decimals_value] = len(decimals)
+                decimals.append(decimals_value)
+
+            value_num, value_str = parse_fact_value(elem.text, unit_ref)
+            block.tag_codes.append(tag_code)
+            block.context_codes.append(context_code)
+            block.unit_codes.append(unit_code)
+            block.decimals_codes.append(decimals_code)
+            block.value_num.append(math.nan if value_num is None else value_num)
+            block.value_str.append(value_str)
+
+        return block
     except ET.ParseError as e:
         print(f"Error parsing XML: {e}")
-        return pd.DataFrame()
+        return None
     except Exception as e:
         print(f"Unexpected error during XML parsing: {e}")
+        return None
+
+
+def _stack_codes(blocks, field, table):
+    """Concatenate the code arrays of several blocks, shifting each by its table offset."""
+    codes, offset = [], 0
+    for block in blocks:
+        codes.append(np.frombuffer(getattr(block, field), dtype=np.intc) + offset)
+        offset += len(getattr(block, table))
+    return np.concatenate(codes)
+
+
+def facts_to_frame(blocks, tag_index=None, doc_index=None):
+    """
+    Build the long fact DataFrame from FactBlocks.
+
+    Codes are concatenated into numpy arrays and every column is a single
+    take from a stacked lookup table, so no per-fact Python objects are made
+    beyond the string values themselves.
+
+    Args:
+        blocks: FactBlocks (None or empty blocks are skipped)
+        tag_index: The TagIndex the blocks were parsed with
+        doc_index: Optional number per block, added as a leading `url_index` column
+    """
+    if tag_index is None:
+        tag_index = DEFAULT_TAG_INDEX
+    keep = [k for k, block in enumerate(blocks) if block is not None and len(block.tag_codes)]
+    if not keep:
         return pd.DataFrame()
+    blocks = [blocks[k] for k in keep]
+
+    tag_names = np.array(tag_index.names, dtype=object)
+    contexts = np.array([c for b in blocks for c in b.contexts], dtype=object).reshape(-1, 5)
+    units = np.array([u for b in blocks for u in b.units], dtype=object).reshape(-1, 2)
+    decimals = np.array([d for b in blocks for d in b.decimals], dtype=object)
+
+    context_codes = _stack_codes(blocks, "context_codes", "contexts")
+    unit_codes = _stack_codes(blocks, "unit_codes", "units")
+    decimals_codes = _stack_codes(blocks, "decimals_codes", "decimals")
+    tag_codes = np.concatenate([np.frombuffer(b.tag_codes, dtype=np.intc) for b in blocks])
+
+    value_str = np.empty(len(tag_codes), dtype=object)
+    value_str[:] = [v for b in blocks for v in b.value_str]
+
+    df = pd.DataFrame({
+        "tag": tag_names[tag_codes],
+        "value_num": np.concatenate([np.frombuffer(b.value_num, dtype=np.float64) for b in blocks]),
+        "value_str": value_str,
+        "unit": units[unit_codes, 1],
+        "contextRef": contexts[context_codes, 0],
+        "unitRef": units[unit_codes, 0],
+        "decimals": decimals[decimals_codes],
+        "identifier": contexts[context_codes, 1],
+        "start_date": contexts[context_codes, 2],
+        "end_date": contexts[context_codes, 3],
+        "instant": contexts[context_codes, 4],
+    })
+    if doc_index is not None:
+        df.insert(0, "url_index", np.repeat([doc_index[k] for k in keep], [len(b.tag_codes) for b in blocks]))
+    return df
+
+
+def parse_xml_content(xml_content, tag_index=None):
+    """
+    Parse XBRL XML content and return a long DataFrame with one row per fact.
 
+    Numeric facts are stored in `value_num` (float64) and non-numeric facts in
+    `value_str`. `unit` holds the resolved measure of the unitRef
+    (e.g. "iso4217:DKK" or "xbrli:pure"). Only elements selected by `tag_index`
+    (a TagIndex, default: all tags) become records.
+    """
+    block = parse_xml_facts(xml_content, tag_index)
+    return facts_to_frame([block], tag_index)
 
-async def process_urls_async(urls_batch):
+
+async def process_urls_async(urls_batch, tag_index=None):
     """Fetch and parse a batch of XML URLs asynchronously."""
-    all_dfs = []
+    blocks = []
     async with httpx.AsyncClient() as client:
         tasks = [fetch_xml(client, url) for url in urls_batch]
         for url, xml_content in await tqdm_asyncio.gather(*tasks, desc="Fetching and Parsing XMLs"):
             if xml_content:
-                df_company = parse_xml_content(xml_content)
-                if not df_company.empty:
-                    all_dfs.append(df_company)
-    return pd.concat(all_dfs, ignore_index=True) if all_dfs else pd.DataFrame()
+                blocks.append(parse_xml_facts(xml_content, tag_index))
+    return facts_to_frame(blocks, tag_index)
+
+
+def integral_tags(df):
+    """
+    Return the numeric tags that can be stored as int64.
+
+    A tag qualifies when every fact reports decimals <= 0 (whole DKK, thousands,
+    share counts) or INF (an exact value), and every value is a whole number.
+    """
+    if df.empty:
+        return []
+    decimals = df["decimals"].astype(str).str.strip().str.upper()
+    exact = decimals == "INF"
+    whole = (exact | (pd.to_numeric(decimals.where(~exact), errors="coerce") <= 0)) & (df["value_num"] % 1 == 0)
+    per_tag = whole.groupby(df["tag"]).all()
+    return per_tag[per_tag].index.tolist()
 
 
 def transform_to_wide_format(df, year):
@@ -191,13 +562,26 @@ def transform_to_wide_format(df, year):
         print(f"Warning: No data found for year {year} after filtering.")
         return pd.DataFrame()
 
-    # Create pivot table
-    pivot = df.pivot_table(
+    # Create pivot tables: numeric facts keep their native dtype, text facts stay strings
+    numeric = df[df["value_num"].notna()]
+    text = df[df["value_num"].isna() & df["value_str"].notna() & ~df["tag"].isin(numeric["tag"].unique())]
+
+    pivot_num = numeric.pivot_table(
+        index="identifier",
+        columns="tag",
+        values="value_num",
+        aggfunc="first"
+    )
+    pivot_num = pivot_num.astype({tag: "Int64" for tag in integral_tags(numeric)})
+
+    pivot_str = text.pivot_table(
         index="identifier",
         columns="tag",
-        values="value",
+        values="value_str",
         aggfunc="first"
-    ).reset_index()
+    )
+
+    pivot = pivot_num.join(pivot_str, how="outer").reset_index()
 
     pivot.columns.name = None
 
@@ -207,71 +591,460 @@ def transform_to_wide_format(df, year):
     return pivot
 
 
+LONG_COLUMNS = [
+    "identifier", "tag", "value_num", "value_str", "unit", "unitRef", "decimals",
+    "contextRef", "start_date", "end_date", "instant", "source_url", "report_year", "year",
+]
+
+
+def report_sources(data, xml_urls):
+    """
+    Source report of every URL, indexed by its position in xml_urls (the url_index of the facts).
+
+    Returns:
+        DataFrame with source_url and report_year (the year the report's accounting period
+        ends; the earliest one if a URL is listed for several years)
+    """
+    df = data[XML_METADATA_COLUMNS].dropna()
+    df = df.assign(report_year=pd.to_datetime(df["regnskabsperiode_slutDato"]).dt.year)
+    report_year = df.sort_values("report_year", kind="stable").drop_duplicates("AARSRAPPORT_xml")
+    report_year = report_year.set_index("AARSRAPPORT_xml")["report_year"]
+    return pd.DataFrame({"source_url": xml_urls,
+                         "report_year": report_year.reindex(xml_urls).astype("Int16").array})
+
+
+def to_long_format(df, sources=None):
+    """
+    Prepare parsed facts for the long-format store.
+
+    Every fact is kept, including prior-year comparatives, and assigned to the
+    year of its own period (end_date for duration facts, instant otherwise).
+    Each fact carries its source report (source_url, report_year; see
+    report_sources, joined on the url_index column of the facts), so a company's
+    own filing for a year (report_year == year) can be told apart from the
+    comparatives of the following year's report in the same partition.
+    Rows are sorted by tag and identifier so that row group statistics on the
+    dictionary-encoded tag column let readers skip unrelated row groups.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=LONG_COLUMNS)
+
+    df = df.copy()
+    if sources is not None and "url_index" in df.columns:
+        df = df.join(sources, on="url_index")
+    else:
+        df["source_url"], df["report_year"] = None, None
+    df["tag"] = df["tag"].astype(str).str.strip()
+    for col in ["start_date", "end_date", "instant"]:
+        df[col] = pd.to_datetime(df[col], errors="coerce")
+    df["year"] = df["end_date"].dt.year.fillna(df["instant"].dt.year)
+    df = df[df["year"].notna()]
+    df["year"] = df["year"].astype("int16")
+
+    df = df.sort_values(["tag", "identifier"], kind="stable")
+    return df[LONG_COLUMNS].reset_index(drop=True)
+
+
+def write_long_format(df, run_label, efs_folder_path=EFS_FOLDER_PATH, output_filename=OUTPUT_FILENAME):
+    """
+    Write long-format facts as a hive-partitioned dataset (year=YYYY/).
+
+    Files are named after the run (a year, or "2012-2024" in multi-year mode), so
+    rerunning replaces its own files while facts routed to other year partitions
+    by other runs are kept (see remove_long_parts).
+    """
+    table = conform(df, SCHEMAS["xbrl_long"])
+    base_dir = os.path.join(efs_folder_path, f"{output_filename}_long")
+    ds.write_dataset(
+        table,
+        base_dir,
+        format="parquet",
+        partitioning=ds.partitioning(pa.schema([("year", pa.int16())]), flavor="hive"),
+        basename_template=f"part-{run_label}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        max_rows_per_group=64 * 1024,
+        min_rows_per_group=16 * 1024,
+    )
+    return base_dir
+
+
+def remove_long_parts(run_label, efs_folder_path=EFS_FOLDER_PATH, output_filename=OUTPUT_FILENAME):
+    """Delete the long-format files of an earlier run with the same label, in every year partition."""
+    base_dir = os.path.join(efs_folder_path, f"{output_filename}_long")
+    pattern = re.compile(rf"part-{re.escape(str(run_label))}-\d{{5}}-\d+\.parquet")
+    removed = 0
+    for path in glob.glob(os.path.join(base_dir, "year=*", "part-*.parquet")):
+        if pattern.fullmatch(os.path.basename(path)):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+# --- Checkpointed pipeline ---
+MANIFEST_FILENAME = "manifest.jsonl"
+SELECTION_FILENAME = "selection.json"
+
+
+def load_manifest(checkpoint_dir):
+    """Return the finished URLs and the part files recorded in a checkpoint directory."""
+    done_urls, parts = set(), []
+    manifest_path = os.path.join(checkpoint_dir, MANIFEST_FILENAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                done_urls.update(entry["urls"])
+                parts.append(os.path.join(checkpoint_dir, entry["part"]))
+    return done_urls, parts
+
+
+def write_checkpoint_part(checkpoint_dir, part_number, df, urls):
+    """
+    Write one finished batch as a Parquet part file and then record its URLs
+    in the manifest. A part only counts as done once its manifest line exists.
+    """
+    table = conform(df, XBRL_FACTS)
+
+    part = f"part-{part_number:05d}.parquet"
+    pq.write_table(table, os.path.join(checkpoint_dir, part))
+    with open(os.path.join(checkpoint_dir, MANIFEST_FILENAME), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"part": part, "urls": urls}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    return len(table)
+
+
+async def pipeline_urls_async(indexed_urls, checkpoint_dir, batch_size=1000, max_in_flight=50, first_part=0,
+                              tag_index=None):
+    """
+    Fetch and parse URLs as one continuous pipeline.
+
+    `max_in_flight` workers pull URLs from a queue, so there is no barrier between
+    batches. Parsed documents are collected by a single writer that flushes a part
+    file every `batch_size` fetched URLs. URLs whose download failed are not
+    recorded and are retried on the next run.
+    """
+    url_queue = asyncio.Queue()
+    for item in indexed_urls:
+        url_queue.put_nowait(item)
+    results = asyncio.Queue(maxsize=max_in_flight)
+
+    async def worker(client):
+        while True:
+            try:
+                index, url = url_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            _, xml_content = await fetch_xml(client, url)
+            block = parse_xml_facts(xml_content, tag_index) if xml_content else None
+            await results.put((index, url, xml_content is not None, block))
+
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(limits=limits) as client:
+        workers = [asyncio.create_task(worker(client)) for _ in range(min(max_in_flight, len(indexed_urls)))]
+
+        part_number = first_part
+        blocks, block_index, batch_urls = [], [], []
+        remaining = len(indexed_urls)
+        with tqdm(total=remaining, desc="Fetching and Parsing XMLs") as progress:
+            while remaining:
+                index, url, fetched, block = await results.get()
+                remaining -= 1
+                progress.update(1)
+                if fetched:
+                    batch_urls.append(url)
+                if block is not None:
+                    blocks.append(block)
+                    block_index.append(index)
+
+                if batch_urls and (len(batch_urls) >= batch_size or remaining == 0):
+                    df_batch = facts_to_frame(blocks, tag_index, doc_index=block_index)
+                    rows = write_checkpoint_part(checkpoint_dir, part_number, df_batch, batch_urls)
+                    progress.write(f"Part {part_number} written: {len(batch_urls)} URLs, {rows} rows")
+                    part_number += 1
+                    blocks, block_index, batch_urls = [], [], []
+
+        await asyncio.gather(*workers)
+
+
+def process_url_batches(xml_urls, checkpoint_dir, batch_size: int = 1000, max_in_flight: int = 50,
+                        tag_index=None):
+    """
+    Download and parse XML URLs into checkpointed Parquet part files.
+
+    URLs already listed in the checkpoint manifest are skipped, so an interrupted
+    run resumes where it stopped. The checkpoint records the tag selection it was
+    parsed with; if it was made with another selection (other --tags or --tag-prefix,
+    or before the selection was recorded) it is discarded and the run starts over,
+    so the output never mixes facts of two selections. Returns the list of part files.
+    """
+    tag_index = tag_index if tag_index is not None else DEFAULT_TAG_INDEX
+    selection = {"fingerprint": tag_index.fingerprint(), **tag_index.selection}
+    selection_path = os.path.join(checkpoint_dir, SELECTION_FILENAME)
+    if os.path.isdir(checkpoint_dir):
+        stored = None
+        if os.path.exists(selection_path):
+            with open(selection_path, encoding="utf-8") as f:
+                stored = json.load(f).get("fingerprint")
+        if stored != selection["fingerprint"]:
+            print(f"Checkpoint {checkpoint_dir} was made with another tag selection; starting over.")
+            shutil.rmtree(checkpoint_dir)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    if not os.path.exists(selection_path):
+        with open(selection_path, "w", encoding="utf-8") as f:
+            json.dump(selection, f)
+    done_urls, parts = load_manifest(checkpoint_dir)
+    pending = [(i, url) for i, url in enumerate(xml_urls) if url not in done_urls]
+
+    if done_urls:
+        print(f"Resuming from checkpoint: {len(xml_urls) - len(pending)} URLs already processed in {len(parts)} part files")
+
+    if pending:
+        asyncio.run(pipeline_urls_async(pending, checkpoint_dir, batch_size, max_in_flight,
+                                        first_part=len(parts), tag_index=tag_index))
+
+    _, parts = load_manifest(checkpoint_dir)
+    return parts
+
+
+def read_checkpoint_facts(parts, year=None, keep_index=False):
+    """
+    Read checkpointed facts back in report order, optionally only those whose
+    period (end_date or instant) falls in `year`. With keep_index the url_index
+    column (position of the source URL) is kept.
+    """
+    dataset = ds.dataset(parts, schema=XBRL_FACTS, format="parquet")
+    row_filter = None
+    if year is not None:
+        start, end = f"{year}-01-01", f"{year + 1}-01-01"
+        end_date, instant = ds.field("end_date"), ds.field("instant")
+        row_filter = ((end_date >= start) & (end_date < end)) | ((instant >= start) & (instant < end))
+    df = dataset.to_table(filter=row_filter).to_pandas()
+    df = df.sort_values("url_index", kind="stable")
+    if not keep_index:
+        df = df.drop(columns="url_index")
+    return df.reset_index(drop=True)
+
+
+def write_checkpoint_long_format(parts, run_label, efs_folder_path=EFS_FOLDER_PATH, output_filename=OUTPUT_FILENAME,
+                                 sources=None):
+    """
+    Stream checkpoint parts into the long-format dataset one part at a time.
+
+    The files of an earlier run with the same label are removed first, so a rerun
+    writing fewer parts leaves no stale facts behind.
+    """
+    remove_long_parts(run_label, efs_folder_path, output_filename)
+    total_facts = 0
+    for i, part in enumerate(parts):
+        df_long = to_long_format(read_checkpoint_facts([part], keep_index=True), sources)
+        if df_long.empty:
+            continue
+        write_long_format(df_long, f"{run_label}-{i:05d}", efs_folder_path, output_filename)
+        total_facts += len(df_long)
+    return total_facts
+
+
+def checkpoint_path(run_label, efs_folder_path=EFS_FOLDER_PATH, output_filename=OUTPUT_FILENAME):
+    return os.path.join(efs_folder_path, f"{output_filename}_{run_label}_checkpoint")
+
+
+def finish_checkpoint(checkpoint_dir, xml_urls):
+    """
+    Remove the checkpoint once every URL is done; keep it so a rerun retries failed downloads.
+
+    Returns:
+        True if every URL is done
+    """
+    done_urls, _ = load_manifest(checkpoint_dir)
+    failed = len(set(xml_urls) - done_urls)
+    if failed:
+        print(f"{failed} URLs could not be downloaded. Checkpoint kept at {checkpoint_dir}; rerun to retry them.")
+        return False
+    shutil.rmtree(checkpoint_dir)
+    return True
+
+
+def finish_run(metrics, run_label, rows, efs_folder_path=EFS_FOLDER_PATH, output_filename=OUTPUT_FILENAME):
+    """
+    Write the run report {output_filename}_{run_label}_run_report.json of a completed run.
+
+    The report is only written once every URL is done and the output is in place, and
+    records the rows written (0 for a year without reports, which has no output file).
+    """
+    metrics.params["rows"] = rows
+    os.makedirs(efs_folder_path, exist_ok=True)
+    metrics.finish(os.path.join(efs_folder_path, f"{output_filename}_{run_label}_run_report.json"))
+    return True
+
+
+def save_wide_format(df_wide, year, efs_folder_path=EFS_FOLDER_PATH, output_filename=OUTPUT_FILENAME):
+    """Save one year of wide format data as companies_all_tags_{year}.parquet."""
+    output_path = os.path.join(efs_folder_path, f"{output_filename}_{year}.parquet")
+    print(f"\nSaving final wide format data to: {output_path}")
+    pq.write_table(conform(df_wide, SCHEMAS["xbrl_wide"], extra=True), output_path)
+    print(f"✓ Successfully saved! Total companies: {len(df_wide)}, Total columns: {len(df_wide.columns)}")
+
+
 @print_durations()
 def download_and_process_year(year: int,
                                fs_folder_path=FS_FOLDER_PATH,
                                input_filename=INPUT_FILENAME,
                                efs_folder_path=EFS_FOLDER_PATH,
                                output_filename=OUTPUT_FILENAME,
-                               batch_size: int = 1000):
-    """Download XML data for a year and directly produce wide format output."""
+                               batch_size: int = 1000,
+                               output: str = "wide",
+                               max_in_flight: int = 50,
+                               tag_index=None):
+    """
+    Download XML data for a year and produce wide (default) or long format output.
+
+    Parsed batches are checkpointed under {output_filename}_{year}_checkpoint/ and
+    the checkpoint is removed once every URL has been processed and the final
+    output has been written. The run report ({output_filename}_{year}_run_report.json)
+    is written then too.
+
+    Returns:
+        True if the year is complete, False if URLs are left to retry
+    """
 
     print(f"\n{'='*60}")
     print(f"Processing year: {year}")
     print(f"{'='*60}\n")
 
+    metrics = RunMetrics(f"{output_filename}_{year}",
+                         params={"year": year, "output": output, "batch_size": batch_size,
+                                 "max_in_flight": max_in_flight})
+
     print("Reading local virk.dk financial statement metadata file...")
-    xml_df = get_xml_dataframe(fs_folder_path, input_filename)
-    xml_urls = get_xml_urls_by_year(xml_df, year)
+    with metrics.stage("read_metadata") as stage:
+        xml_df = get_xml_dataframe(fs_folder_path, input_filename, years=[year])
+        xml_urls = get_xml_urls_by_year(xml_df, year)
+        stage["rows"] = len(xml_urls)
 
     total_urls = len(xml_urls)
+    metrics.params["urls"] = total_urls
     print(f"Total number of XML URLs to process: {total_urls}")
 
     if total_urls == 0:
         print(f"No XML URLs found for year {year}.")
-        return
+        return finish_run(metrics, year, 0, efs_folder_path, output_filename)
 
-    # Process in batches and accumulate data
-    num_batches = (total_urls + batch_size - 1) // batch_size
-    all_batch_dfs = []
+    checkpoint_dir = checkpoint_path(year, efs_folder_path, output_filename)
+    with metrics.stage("download", rows=total_urls):
+        parts = process_url_batches(xml_urls, checkpoint_dir, batch_size, max_in_flight, tag_index)
 
-    for i in range(num_batches):
-        start_index = i * batch_size
-        end_index = min((i + 1) * batch_size, total_urls)
-        current_batch_urls = xml_urls[start_index:end_index]
+    if output == "long":
+        with metrics.stage("write/long") as stage:
+            total_facts = write_checkpoint_long_format(parts, year, efs_folder_path, output_filename,
+                                                       sources=report_sources(xml_df, xml_urls))
+            stage["rows"] = total_facts
+        print(f"✓ Saved {total_facts} facts to long-format dataset: {os.path.join(efs_folder_path, f'{output_filename}_long')}")
+        return (finish_checkpoint(checkpoint_dir, xml_urls)
+                and finish_run(metrics, year, total_facts, efs_folder_path, output_filename))
 
-        print(f"\nProcessing Batch {i+1}/{num_batches} (URLs {start_index} to {end_index-1})...")
-
-        df_batch = asyncio.run(process_urls_async(current_batch_urls))
-
-        if not df_batch.empty:
-            print(f"Batch {i+1} completed. Total rows in this batch: {len(df_batch)}")
-            all_batch_dfs.append(df_batch)
-        else:
-            print(f"No data extracted for Batch {i+1}.")
+    df_combined = read_checkpoint_facts(parts, year)
+    print(f"Total rows for year {year}: {len(df_combined)}")
 
-    # Combine all batches
-    if not all_batch_dfs:
+    if df_combined.empty:
         print(f"No data extracted for year {year} across all batches.")
-        return
-
-    print(f"\nCombining {len(all_batch_dfs)} batches...")
-    df_combined = pd.concat(all_batch_dfs, ignore_index=True)
-    print(f"Total rows combined: {len(df_combined)}")
+        return (finish_checkpoint(checkpoint_dir, xml_urls)
+                and finish_run(metrics, year, 0, efs_folder_path, output_filename))
 
     # Transform to wide format
     print("\nTransforming to wide format...")
-    df_wide = transform_to_wide_format(df_combined, year)
+    with metrics.stage("explode/wide", rows=len(df_combined)):
+        df_wide = transform_to_wide_format(df_combined, year)
 
     if df_wide.empty:
         print(f"No data in wide format for year {year}.")
-        return
+        return (finish_checkpoint(checkpoint_dir, xml_urls)
+                and finish_run(metrics, year, 0, efs_folder_path, output_filename))
 
-    # Save final output
-    output_path = os.path.join(efs_folder_path, f"{output_filename}_{year}.parquet")
-    print(f"\nSaving final wide format data to: {output_path}")
-    df_wide.to_parquet(output_path, index=False)
-    print(f"✓ Successfully saved! Total companies: {len(df_wide)}, Total columns: {len(df_wide.columns)}")
+    with metrics.stage("write/wide", rows=len(df_wide)):
+        save_wide_format(df_wide, year, efs_folder_path, output_filename)
+    return (finish_checkpoint(checkpoint_dir, xml_urls)
+            and finish_run(metrics, year, len(df_wide), efs_folder_path, output_filename))
+
+
+@print_durations()
+def download_and_process_years(years,
+                               fs_folder_path=FS_FOLDER_PATH,
+                               input_filename=INPUT_FILENAME,
+                               efs_folder_path=EFS_FOLDER_PATH,
+                               output_filename=OUTPUT_FILENAME,
+                               batch_size: int = 1000,
+                               output: str = "wide",
+                               max_in_flight: int = 50,
+                               tag_index=None):
+    """
+    Multi-year mode: read the metadata once, download every XML once and route
+    each parsed fact to the year of its own period (end_date or instant).
+
+    Reports are processed in ascending report year, so in the wide output a
+    company's own filing for a year takes precedence and comparative figures
+    from the following year's report only fill in what is missing.
+
+    Returns:
+        True if every year is complete (run report {output_filename}_{first}-{last}_run_report.json
+        written), False if URLs are left to retry
+    """
+    years = sorted(years)
+    label = f"{years[0]}-{years[-1]}"
+
+    print(f"\n{'='*60}")
+    print(f"Processing years: {label} (multi-year)")
+    print(f"{'='*60}\n")
+
+    metrics = RunMetrics(f"{output_filename}_{label}",
+                         params={"years": years, "output": output, "batch_size": batch_size,
+                                 "max_in_flight": max_in_flight})
+
+    print("Reading local virk.dk financial statement metadata file...")
+    with metrics.stage("read_metadata") as stage:
+        xml_df = get_xml_dataframe(fs_folder_path, input_filename, years=years)
+        xml_urls = get_xml_urls_by_years(xml_df, years)
+        stage["rows"] = len(xml_urls)
+
+    total_urls = len(xml_urls)
+    metrics.params["urls"] = total_urls
+    print(f"Total number of XML URLs to process: {total_urls}")
+
+    if total_urls == 0:
+        print(f"No XML URLs found for years {label}.")
+        return finish_run(metrics, label, 0, efs_folder_path, output_filename)
+
+    checkpoint_dir = checkpoint_path(label, efs_folder_path, output_filename)
+    with metrics.stage("download", rows=total_urls):
+        parts = process_url_batches(xml_urls, checkpoint_dir, batch_size, max_in_flight, tag_index)
+
+    if output == "long":
+        with metrics.stage("write/long") as stage:
+            total_facts = write_checkpoint_long_format(parts, label, efs_folder_path, output_filename,
+                                                       sources=report_sources(xml_df, xml_urls))
+            stage["rows"] = total_facts
+        print(f"✓ Saved {total_facts} facts to long-format dataset: {os.path.join(efs_folder_path, f'{output_filename}_long')}")
+        return (finish_checkpoint(checkpoint_dir, xml_urls)
+                and finish_run(metrics, label, total_facts, efs_folder_path, output_filename))
+
+    rows = 0
+    for year in years:
+        print(f"\nTransforming year {year} to wide format...")
+        with metrics.stage("explode/wide"):
+            df_wide = transform_to_wide_format(read_checkpoint_facts(parts, year), year)
+
+        if df_wide.empty:
+            print(f"No data in wide format for year {year}.")
+            continue
+
+        with metrics.stage("write/wide", rows=len(df_wide)):
+            save_wide_format(df_wide, year, efs_folder_path, output_filename)
+        rows += len(df_wide)
+
+    return (finish_checkpoint(checkpoint_dir, xml_urls)
+            and finish_run(metrics, label, rows, efs_folder_path, output_filename))
 
 
 # --- Main ---
@@ -282,15 +1055,38 @@ def main():
 
     print(f"Years to process: {years}")
     print(f"Batch size: {batch_size}")
+    print(f"Output: {args.output}")
 
-    for year in years:
+    tags = load_tag_list(args.tags) if args.tags else None
+    tag_index = TagIndex(tags=tags, prefixes=args.tag_prefix)
+    if not tag_index.select_all:
+        print(f"Tag selection: {len(tags or [])} listed tags, prefixes {args.tag_prefix or []}")
+
+    failed = []
+    if args.multi_year:
         try:
-            download_and_process_year(year=year, batch_size=batch_size)
+            if not download_and_process_years(years=years, batch_size=batch_size, output=args.output,
+                                              max_in_flight=args.max_in_flight, tag_index=tag_index):
+                failed = years
         except Exception as e:
-            print(f"Error processing year {year}: {e}")
-            continue
+            print(f"Error processing years {years[0]}-{years[-1]}: {e}")
+            failed = years
+    else:
+        for year in years:
+            try:
+                if not download_and_process_year(year=year, batch_size=batch_size, output=args.output,
+                                                 max_in_flight=args.max_in_flight, tag_index=tag_index):
+                    failed.append(year)
+            except Exception as e:
+                print(f"Error processing year {year}: {e}")
+                failed.append(year)
 
     print(f"\n{'='*60}")
+    if failed:
+        # A non-zero exit tells the pipeline (run_pipeline.py) to retry the years
+        print(f"Years not completed: {failed}. Rerun to resume them from their checkpoints.")
+        print(f"{'='*60}")
+        sys.exit(1)
     print("All years processed!")
     print(f"{'='*60}")
 
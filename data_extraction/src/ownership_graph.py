@@ -0,0 +1,357 @@
+"""
+Ownership and board graph over the deltagerRelation panel.
+
+The build step compiles participant -> company edges from
+virksomhed_{year}_deltagerRelation.parquet (or the normalized
+deltagerRelation_* tables) into a compressed sparse row (CSR) adjacency, stored
+as NumPy arrays that are memory-mapped on load:
+
+    {folder}/virksomhed_{year}_ownership_graph/
+        nodes.npy          enhedsNummer of every node, sorted (node id = position)
+        cvr.npy            cvrNummer per node (-1 if unknown, e.g. persons)
+        out_indptr.npy     CSR by participant: edges of node i are out_indptr[i]:out_indptr[i+1]
+        out_indices.npy    company node of every edge
+        in_indptr.npy      CSR by company
+        in_indices.npy     participant node of every in-edge
+        in_edges.npy       edge id (position in the out arrays) of every in-edge
+        role.npy           organisationHovedtype code per edge (names in meta.json)
+        share.npy          ownership share per edge (EJERANDEL_PROCENT, NaN if none)
+        valid_from.npy     validity interval per edge, days since 1970-01-01
+        valid_to.npy
+        meta.json
+
+Usage:
+    python ownership_graph.py build --year 2024
+    python ownership_graph.py khop --year 2024 --cvr 10000001 --k 3 --as-of 2020-01-01
+    python ownership_graph.py owners --year 2024 --cvr 10000001
+
+    graph = OwnershipGraph.load(path)
+    graph.k_hop(graph.nodes_for_cvr(10000001), k=3, direction="in", ownership_only=True)
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COMPANY_DATA_FOLDER_PATH = os.getenv("COMPANY_DATA_FOLDER_PATH")
+OUTPUT_FILENAME = "virksomhed"
+
+# attributType holding the ownership share in attributVaerdi
+OWNERSHIP_SHARE_TYPE = "EJERANDEL_PROCENT"
+RELATION_COLUMNS = ['cvrNummer', 'enhedsNummer', 'deltagerEnhedsNummer', 'deltagerEnhedstype',
+                    'deltagerForretningsnoegle', 'organisationHovedtype', 'attributType', 'attributVaerdi',
+                    'gyldigFra', 'gyldigTil']
+# Open validity bounds
+MIN_DAY = np.iinfo(np.int32).min
+MAX_DAY = np.iinfo(np.int32).max
+ARRAYS = ["nodes", "cvr", "out_indptr", "out_indices", "in_indptr", "in_indices", "in_edges",
+          "role", "share", "valid_from", "valid_to"]
+
+
+def read_relations(folder, prefix):
+    """
+    Read the deltagerRelation panel, from the denormalized file or, if that is missing,
+    by joining the normalized deltagerRelation_* tables.
+    """
+    path = os.path.join(folder, f"{prefix}_deltagerRelation.parquet")
+    if os.path.exists(path):
+        return pd.read_parquet(path, columns=RELATION_COLUMNS)
+
+    base = os.path.join(folder, f"{prefix}_deltagerRelation")
+    attributes = pd.read_parquet(f"{base}_attribut.parquet")
+    organisations = pd.read_parquet(f"{base}_organisation.parquet",
+                                    columns=['organisationKey', 'cvrNummer', 'enhedsNummer', 'deltagerKey',
+                                             'organisationHovedtype'])
+    participants = pd.read_parquet(f"{base}_deltager.parquet")
+    df = attributes.merge(organisations, on='organisationKey').merge(participants, on='deltagerKey')
+    return df[RELATION_COLUMNS]
+
+
+def to_days(values, missing):
+    """ISO date strings -> int32 days since 1970-01-01, with `missing` for null/invalid dates."""
+    if not isinstance(values, (pa.Array, pa.ChunkedArray)):
+        values = pa.array(np.asarray(values, dtype=object), type=pa.string(), from_pandas=True)
+    elif pa.types.is_null(values.type):
+        values = values.cast(pa.string())
+    dates = pc.strptime(pc.utf8_slice_codeunits(values, 0, 10), format="%Y-%m-%d", unit="s", error_is_null=True)
+    days = dates.cast(pa.date32()).cast(pa.int32()).fill_null(missing)
+    return days.to_numpy()
+
+
+def build_edges(relations):
+    """
+    One edge per (participant, company, role, validity interval), with the ownership
+    share of that interval if any.
+
+    Returns:
+        DataFrame with src, dst (enhedsNummer), role, share, valid_from, valid_to,
+        and a (enhedsNummer, cvrNummer) DataFrame of the companies seen
+    """
+    df = relations.dropna(subset=['deltagerEnhedsNummer', 'enhedsNummer'])
+    is_share = (df['attributType'] == OWNERSHIP_SHARE_TYPE).to_numpy()
+    edges = pd.DataFrame({
+        'src': df['deltagerEnhedsNummer'].astype('int64').to_numpy(),
+        'dst': df['enhedsNummer'].astype('int64').to_numpy(),
+        'role': df['organisationHovedtype'].fillna("UNKNOWN").to_numpy(dtype=object),
+        'share': np.where(is_share, pd.to_numeric(df['attributVaerdi'], errors='coerce').to_numpy(dtype=float), np.nan),
+        'valid_from': to_days(df['gyldigFra'].to_numpy(dtype=object), MIN_DAY),
+        'valid_to': to_days(df['gyldigTil'].to_numpy(dtype=object), MAX_DAY),
+    })
+    edges = edges.groupby(['src', 'dst', 'role', 'valid_from', 'valid_to'], as_index=False, sort=False)['share'].max()
+
+    companies = pd.concat([
+        pd.DataFrame({'enhedsNummer': df['enhedsNummer'], 'cvrNummer': df['cvrNummer']}),
+        pd.DataFrame({'enhedsNummer': df['deltagerEnhedsNummer'], 'cvrNummer': df['deltagerForretningsnoegle']})
+        [(df['deltagerEnhedstype'] == "VIRKSOMHED").to_numpy()],
+    ]).dropna().astype('int64').drop_duplicates('enhedsNummer')
+    return edges, companies
+
+
+def build_graph(relations, graph_path):
+    """
+    Compile the relations into CSR arrays and save them under graph_path.
+
+    Returns:
+        meta dictionary (node/edge counts and role names)
+    """
+    edges, companies = build_edges(relations)
+
+    nodes = np.unique(np.concatenate([edges['src'].to_numpy(), edges['dst'].to_numpy()]))
+    src = np.searchsorted(nodes, edges['src'].to_numpy()).astype(np.int32)
+    dst = np.searchsorted(nodes, edges['dst'].to_numpy()).astype(np.int32)
+    roles, role_codes = np.unique(edges['role'].to_numpy(dtype=str), return_inverse=True)
+
+    # Out-CSR: edges sorted by participant, then company
+    order = np.lexsort((dst, src))
+    src, dst = src[order], dst[order]
+    out_indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=len(nodes)), out=out_indptr[1:])
+
+    # In-CSR: the same edges grouped by company; in_edges points back into the out arrays
+    in_edges = np.argsort(dst, kind="stable")
+    in_indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(dst, minlength=len(nodes)), out=in_indptr[1:])
+
+    cvr = np.full(len(nodes), -1, dtype=np.int64)
+    known = companies[companies['enhedsNummer'].isin(nodes)]
+    cvr[np.searchsorted(nodes, known['enhedsNummer'].to_numpy())] = known['cvrNummer'].to_numpy()
+
+    arrays = {
+        "nodes": nodes, "cvr": cvr,
+        "out_indptr": out_indptr, "out_indices": dst,
+        "in_indptr": in_indptr, "in_indices": src[in_edges], "in_edges": in_edges.astype(np.int64),
+        "role": role_codes.astype(np.int16)[order],
+        "share": edges['share'].to_numpy(dtype=np.float32)[order],
+        "valid_from": edges['valid_from'].to_numpy()[order],
+        "valid_to": edges['valid_to'].to_numpy()[order],
+    }
+    os.makedirs(graph_path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(graph_path, f"{name}.npy"), array)
+
+    meta = {"nodes": int(len(nodes)), "edges": int(len(dst)), "roles": roles.tolist()}
+    with open(os.path.join(graph_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def _gather(indptr, nodes):
+    """Positions of all CSR entries of `nodes`, and the frontier index each position came from."""
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    origin = np.repeat(np.arange(len(nodes)), counts)
+    positions = np.arange(counts.sum()) + np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return positions, origin
+
+
+class OwnershipGraph:
+    """
+    Memory-mapped CSR graph of participant -> company edges (see build_graph).
+
+    Nodes are addressed by node id (position in `nodes`); use node_ids() and
+    nodes_for_cvr() to go from enhedsNummer / cvrNummer to node ids.
+    """
+
+    def __init__(self, arrays, meta):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.meta = meta
+        self.roles = meta["roles"]
+
+    @classmethod
+    def load(cls, graph_path, mmap=True):
+        arrays = {name: np.load(os.path.join(graph_path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                  for name in ARRAYS}
+        with open(os.path.join(graph_path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(arrays, meta)
+
+    # --- Lookups ---
+    def node_ids(self, enheds_numre):
+        """Node ids of enhedsNummer values (missing ones are dropped)."""
+        enheds_numre = np.atleast_1d(np.asarray(enheds_numre, dtype=np.int64))
+        ids = np.minimum(np.searchsorted(self.nodes, enheds_numre), len(self.nodes) - 1)
+        return ids[self.nodes[ids] == enheds_numre]
+
+    def nodes_for_cvr(self, cvr_nummer):
+        return np.flatnonzero(np.asarray(self.cvr) == cvr_nummer)
+
+    def describe(self, node_ids):
+        return pd.DataFrame({"enhedsNummer": np.asarray(self.nodes)[node_ids],
+                             "cvrNummer": np.asarray(self.cvr)[node_ids]})
+
+    # --- Edge filters ---
+    def _edge_mask(self, edges, roles=None, as_of=None, ownership_only=False):
+        mask = np.ones(len(edges), dtype=bool)
+        if roles is not None:
+            codes = [self.roles.index(role) for role in roles if role in self.roles]
+            mask &= np.isin(self.role[edges], codes)
+        if as_of is not None:
+            day = to_days([as_of], MIN_DAY)[0]
+            mask &= (self.valid_from[edges] <= day) & (self.valid_to[edges] >= day)
+        if ownership_only:
+            mask &= ~np.isnan(self.share[edges])
+        return mask
+
+    def _step(self, frontier, direction, **filters):
+        """Edges leaving `frontier`: (edge ids, frontier index, neighbour node ids)."""
+        if direction == "out":
+            positions, origin = _gather(self.out_indptr, frontier)
+            edges, neighbours = positions, self.out_indices[positions]
+        else:
+            positions, origin = _gather(self.in_indptr, frontier)
+            edges, neighbours = self.in_edges[positions], self.in_indices[positions]
+        mask = self._edge_mask(edges, **filters)
+        return edges[mask], origin[mask], neighbours[mask]
+
+    # --- Traversals ---
+    def neighbours(self, node_ids, direction="out", **filters):
+        """
+        Direct neighbours.
+
+        Args:
+            direction: "out" (participant -> companies it owns or sits in) or "in" (company -> its participants)
+            roles: Optional list of organisationHovedtype names to follow
+            as_of: Optional ISO date; only edges valid on that date
+            ownership_only: Only edges with an ownership share
+        """
+        _, _, neighbours = self._step(np.atleast_1d(node_ids), direction, **filters)
+        return np.unique(neighbours)
+
+    def k_hop(self, node_ids, k, direction="out", **filters):
+        """
+        All nodes within k hops (breadth-first, one vectorized step per hop).
+
+        Args:
+            direction: "out", "in" or "both"
+
+        Returns:
+            DataFrame with enhedsNummer, cvrNummer and hops (0 for the start nodes)
+        """
+        frontier = np.unique(np.atleast_1d(node_ids))
+        hops = np.full(len(self.nodes), -1, dtype=np.int16)
+        hops[frontier] = 0
+        directions = ["out", "in"] if direction == "both" else [direction]
+        for hop in range(1, k + 1):
+            found = [self._step(frontier, d, **filters)[2] for d in directions]
+            candidates = np.unique(np.concatenate(found)) if found else np.array([], dtype=np.int64)
+            frontier = candidates[hops[candidates] < 0]
+            if len(frontier) == 0:
+                break
+            hops[frontier] = hop
+        reached = np.flatnonzero(hops >= 0)
+        result = self.describe(reached)
+        result["hops"] = hops[reached]
+        return result.sort_values(["hops", "enhedsNummer"], ignore_index=True)
+
+    def ultimate_owners(self, node_ids, as_of=None, max_depth=20):
+        """
+        Follow ownership edges upwards until owners without owners of their own.
+
+        Effective shares are multiplied along each chain and summed over chains that
+        meet. Without as_of, only open-ended (current) ownership edges are used.
+        Circular holdings are cut at max_depth.
+
+        Returns:
+            DataFrame with enhedsNummer, cvrNummer, share (effective) and depth
+        """
+        if as_of is None:
+            as_of = "9999-12-31"
+        frontier = np.unique(np.atleast_1d(node_ids))
+        shares = np.ones(len(frontier))
+        owners, owner_shares, owner_depths = [], [], []
+        for depth in range(max_depth + 1):
+            edges, origin, parents = self._step(frontier, "in", as_of=as_of, ownership_only=True)
+            if depth > 0:
+                # Frontier nodes without owners of their own are ultimate owners
+                is_top = np.ones(len(frontier), dtype=bool)
+                is_top[origin] = False
+                owners.append(frontier[is_top])
+                owner_shares.append(shares[is_top])
+                owner_depths.append(np.full(is_top.sum(), depth))
+            if len(edges) == 0:
+                break
+            # Merge chains that reach the same owner at this depth
+            frontier, inverse = np.unique(parents, return_inverse=True)
+            shares = np.bincount(inverse, weights=shares[origin] * self.share[edges], minlength=len(frontier))
+
+        if not owners:
+            return pd.DataFrame(columns=["enhedsNummer", "cvrNummer", "share", "depth"])
+        owners = np.concatenate(owners)
+        result = self.describe(owners)
+        result["share"] = np.concatenate(owner_shares)
+        result["depth"] = np.concatenate(owner_depths)
+        result = result.groupby(["enhedsNummer", "cvrNummer"], as_index=False).agg(share=("share", "sum"),
+                                                                                  depth=("depth", "min"))
+        return result.sort_values("share", ascending=False, ignore_index=True)
+
+
+def graph_path_for(folder, year):
+    prefix = f"{OUTPUT_FILENAME}_{year}" if year is not None else OUTPUT_FILENAME
+    return prefix, os.path.join(folder, f"{prefix}_ownership_graph")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build and query the CVR ownership/board graph')
+    parser.add_argument('command', choices=['build', 'khop', 'owners'])
+    parser.add_argument('--year', type=int, help='Panel year (virksomhed_{year}_deltagerRelation.parquet)')
+    parser.add_argument('--folder', default=COMPANY_DATA_FOLDER_PATH, help='Folder with the panel files')
+    parser.add_argument('--cvr', type=int, help='CVR number to query')
+    parser.add_argument('--enhed', type=int, help='enhedsNummer to query (instead of --cvr)')
+    parser.add_argument('--k', type=int, default=3, help='Number of hops for khop (default: 3)')
+    parser.add_argument('--direction', choices=['out', 'in', 'both'], default='both', help='khop direction')
+    parser.add_argument('--roles', nargs='+', help='Only follow these organisationHovedtype roles')
+    parser.add_argument('--ownership-only', action='store_true', help='Only follow edges with an ownership share')
+    parser.add_argument('--as-of', help='Only edges valid on this date (YYYY-MM-DD)')
+    args = parser.parse_args()
+
+    prefix, graph_path = graph_path_for(args.folder, args.year)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        meta = build_graph(read_relations(args.folder, prefix), graph_path)
+        print(f"Graph with {meta['nodes']} nodes and {meta['edges']} edges written to {graph_path} "
+              f"in {time.perf_counter() - start:.1f}s")
+        print(f"Roles: {', '.join(meta['roles'])}")
+    else:
+        graph = OwnershipGraph.load(graph_path)
+        start_nodes = graph.node_ids(args.enhed) if args.enhed is not None else graph.nodes_for_cvr(args.cvr)
+        if len(start_nodes) == 0:
+            parser.error("CVR/enhedsNummer not found in the graph")
+        start = time.perf_counter()
+        if args.command == 'khop':
+            result = graph.k_hop(start_nodes, args.k, args.direction, roles=args.roles, as_of=args.as_of,
+                                 ownership_only=args.ownership_only)
+        else:
+            result = graph.ultimate_owners(start_nodes, as_of=args.as_of)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(result.to_string(index=False))
+        print(f"\n{len(result)} rows in {elapsed_ms:.1f} ms")
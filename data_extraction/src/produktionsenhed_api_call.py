@@ -0,0 +1,291 @@
+"""
+Production units (P-units) from cvr-permanent/produktionsenhed into panel parquet files.
+
+Every workplace is a P-unit, so the index is much larger than cvr-permanent/virksomhed.
+Nothing is accumulated: each scroll page is exploded as it arrives (with the explode
+functions of virksomhed_api_call.py, keyed by pNummer) and the panel tables are
+spilled to part files once they exceed a memory budget (see PanelBuilder). Pages are
+downloaded by a sliced scroll, one thread per slice, into a queue that holds at most
+two pages per slice, so memory stays bounded however many documents there are.
+
+Output files (produktionsenhed_{year}_{table}.parquet):
+    main, navne, beliggenhedsadresse, postadresse, hovedbranche, bibranche1-3,
+    aarsbeskaeftigelse, kvartalsbeskaeftigelse, telefonNummer, elektroniskPost,
+    livsforloeb and virksomhedsrelation (the P-unit -> CVR number link over time)
+
+Usage:
+    python produktionsenhed_api_call.py --year 2024 --slices 4
+    python produktionsenhed_api_call.py --year 2024 --slices 4 --memory-budget 500 --dataset-root /data/cvr_dataset
+"""
+
+import os
+import sys
+import time
+import queue
+import base64
+import argparse
+import threading
+import requests
+from functools import partial
+from dotenv import load_dotenv
+from run_metrics import RunMetrics, PROFILERS
+from dataset_writer import write_partition
+from dry_run import estimate, print_estimate, write_estimate
+from virksomhed_api_call import (PanelBuilder, create_main_dataframe, explode_temporal_field, explode_addresses,
+                                 explode_branches, explode_employment, explode_livsforloeb, SCROLL_API_ENDPOINT)
+
+load_dotenv()
+
+# Environment Variables
+VIRK_USERNAME = os.getenv("VIRK_USERNAME")
+VIRK_PASSWORD = os.getenv("VIRK_PASSWORD")
+PUNIT_DATA_FOLDER_PATH = os.getenv("PUNIT_DATA_FOLDER_PATH") or os.getenv("COMPANY_DATA_FOLDER_PATH")
+OUTPUT_FILENAME = "produktionsenhed"
+
+# API ENDPOINT
+PUNIT_DATA_API_ENDPOINT = "http://distribution.virk.dk/cvr-permanent/produktionsenhed/_search"
+
+ENTITY = "VrproduktionsEnhed"
+SCROLL_KEEPALIVE = "5m"
+TIMEOUT = (30, 300)  # (connect, read) seconds
+MAX_RETRIES = 3
+# MB of exploded rows held in memory before the largest tables are spilled
+DEFAULT_MEMORY_BUDGET = 1000
+# Pages waiting to be exploded, per slice
+QUEUE_PAGES_PER_SLICE = 2
+
+_punit = {'entity': ENTITY, 'key': 'pNummer'}
+
+# Panel tables: output name -> explode function taking the list of hits
+PUNIT_TABLES = {
+    'main': create_main_dataframe,
+    'navne': partial(explode_temporal_field, field_name='navne', value_cols=['navn'], **_punit),
+    'beliggenhedsadresse': partial(explode_addresses, address_field='beliggenhedsadresse', **_punit),
+    'postadresse': partial(explode_addresses, address_field='postadresse', **_punit),
+    'hovedbranche': partial(explode_branches, branch_field='hovedbranche', **_punit),
+    'bibranche1': partial(explode_branches, branch_field='bibranche1', **_punit),
+    'bibranche2': partial(explode_branches, branch_field='bibranche2', **_punit),
+    'bibranche3': partial(explode_branches, branch_field='bibranche3', **_punit),
+    'aarsbeskaeftigelse': partial(explode_employment, employment_field='aarsbeskaeftigelse', **_punit),
+    'kvartalsbeskaeftigelse': partial(explode_employment, employment_field='kvartalsbeskaeftigelse', **_punit),
+    'telefonNummer': partial(explode_temporal_field, field_name='telefonNummer', value_cols=['kontaktoplysning'], **_punit),
+    'elektroniskPost': partial(explode_temporal_field, field_name='elektroniskPost', value_cols=['kontaktoplysning'], **_punit),
+    'livsforloeb': partial(explode_livsforloeb, **_punit),
+    # P-unit -> company link: the CVR number the P-unit belonged to in each period
+    'virksomhedsrelation': partial(explode_temporal_field, field_name='virksomhedsrelation', value_cols=['cvrNummer'], **_punit),
+}
+
+
+def post(url, body, headers):
+    """
+    POST a search or scroll request, retrying timeouts, connection errors and 5xx responses.
+
+    Returns:
+        (response JSON, seconds, response bytes)
+    """
+    for attempt in range(1, MAX_RETRIES + 1):
+        start = time.perf_counter()
+        try:
+            response = requests.post(url, json=body, headers=headers, timeout=TIMEOUT)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            error = e
+        else:
+            if response.status_code == 200:
+                return response.json(), time.perf_counter() - start, len(response.content)
+            error = RuntimeError(f"Request failed with status code {response.status_code}: {response.text[:200]}")
+            if response.status_code < 500:
+                raise error
+        if attempt < MAX_RETRIES:
+            print(f"{error}. Retrying ({attempt}/{MAX_RETRIES})...")
+            time.sleep(attempt)
+    raise error
+
+
+def _put(pages, stop, item):
+    """Put an item on the page queue, waiting while it is full; give up once stop is set."""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def scroll_slice(search_url, scroll_url, query, headers, pages, stop, slice_id=0, slices=1):
+    """
+    Scroll through one slice and put its pages on the queue.
+
+    Every item is (slice_id, hits, seconds, bytes); hits is an exception if the slice
+    failed and None once it is done.
+    """
+    if slices > 1:
+        query = {**query, "slice": {"id": slice_id, "max": slices}}
+    scroll_id = None
+    try:
+        data, seconds, nbytes = post(f"{search_url}?scroll={SCROLL_KEEPALIVE}", query, headers)
+        total = data.get("hits", {}).get("total")
+        print(f"Slice {slice_id}: {total.get('value') if isinstance(total, dict) else total} hits")
+        while not stop.is_set():
+            scroll_id = data.get('_scroll_id', scroll_id)
+            hits = data['hits']['hits']
+            if not hits or not _put(pages, stop, (slice_id, hits, seconds, nbytes)) or scroll_id is None:
+                break
+            data, seconds, nbytes = post(scroll_url, {"scroll": SCROLL_KEEPALIVE, "scroll_id": scroll_id}, headers)
+    except Exception as e:
+        _put(pages, stop, (slice_id, e, 0, 0))
+    finally:
+        # Best-effort scroll cleanup to release server-side resources
+        if scroll_id is not None:
+            try:
+                requests.delete(scroll_url, json={"scroll_id": [scroll_id]}, headers=headers, timeout=(TIMEOUT[0], 10))
+            except Exception as e:
+                print(f"Exception during scroll cleanup: {e}")
+        _put(pages, stop, (slice_id, None, 0, 0))
+
+
+def main(virk_username=VIRK_USERNAME,
+         virk_password=VIRK_PASSWORD,
+         punit_data_api_endpoint=PUNIT_DATA_API_ENDPOINT,
+         scroll_api_endpoint=SCROLL_API_ENDPOINT,
+         punit_data_folder_path=PUNIT_DATA_FOLDER_PATH,
+         output_filename=OUTPUT_FILENAME,
+         size=3000,
+         year=None,
+         slices=1,
+         memory_budget=DEFAULT_MEMORY_BUDGET,
+         dataset_root=None,
+         dry_run=False,
+         metrics_path=None,
+         prometheus_path=None,
+         profile=None,
+         profile_dir=None):
+    """
+    Download the production units from Virk API into panel parquet files.
+
+    Args:
+        year: Only P-units last updated in this year
+        slices: Number of scroll slices downloaded in parallel (one thread each)
+        memory_budget: MB of exploded rows to hold in memory before the largest tables are
+            spilled to parquet part files (None: no limit)
+        dataset_root: Also write the tables into this hive-partitioned dataset as
+            produktionsenhed_{table}/year={year} (see dataset_writer.py; requires a year)
+        dry_run: Only estimate the documents, transfer, rows per table, peak memory and wall time
+            of the run from a few sample pages (see dry_run.py); returns the estimate
+        metrics_path: Path of the JSON run report (default: {output_filename}_run_report.json in the output folder)
+        prometheus_path: Optional path of a Prometheus textfile with the run metrics
+        profile: None, "cprofile" or "pyinstrument" to profile every stage
+        profile_dir: Folder for the per-stage profiles (default: the output folder)
+
+    Returns:
+        Dictionary of table name -> parquet path (or DataFrame without a memory budget),
+        or None if the download failed, without writing any output or run report (the estimate
+        with dry_run)
+    """
+    credentials = f"{virk_username}:{virk_password}"
+    encoded_credentials = base64.b64encode(credentials.encode('utf-8')).decode('utf-8')
+    headers = {
+        "Authorization": f"Basic {encoded_credentials}",
+        "Content-Type": "application/json"
+    }
+
+    query = {
+        "size": size,
+        # Recommended when using scroll to get a consistent view and avoid duplicates/skips
+        "sort": ["_doc"],
+        "track_total_hits": True,
+        "query": {"match_all": {}}
+    }
+    if year is not None:
+        query["query"] = {"range": {f"{ENTITY}.sidstOpdateret": {"gte": f"{year}-01-01", "lte": f"{year}-12-31"}}}
+        output_filename = f"{output_filename}_{year}"
+        print(f"Filtering data for year: {year}")
+    else:
+        print("Retrieving all production units...")
+
+    if dry_run:
+        # Pages wait in the queue and one is being downloaded by every slice
+        report = estimate(punit_data_api_endpoint, scroll_api_endpoint, query, headers,
+                          {name: partial(explode, verbose=False) for name, explode in PUNIT_TABLES.items()}, size,
+                          slices=slices, pipelined=True, memory_budget=memory_budget,
+                          in_flight_pages=(QUEUE_PAGES_PER_SLICE + 1) * slices + 1)
+        print_estimate(report)
+        write_estimate(report, os.path.join(punit_data_folder_path, f"{output_filename}_dry_run.json"))
+        return report
+
+    metrics = RunMetrics(output_filename, profile=profile, profile_dir=profile_dir or punit_data_folder_path,
+                         params={"year": year, "size": size, "slices": slices, "memory_budget": memory_budget})
+    panel = PanelBuilder(os.path.join(punit_data_folder_path, output_filename), metrics, memory_budget,
+                         tables=PUNIT_TABLES, key='pNummer')
+
+    # The slices only download; pages are exploded here, one at a time
+    pages = queue.Queue(maxsize=QUEUE_PAGES_PER_SLICE * slices)
+    stop = threading.Event()
+    threads = [threading.Thread(target=scroll_slice, daemon=True,
+                                args=(punit_data_api_endpoint, scroll_api_endpoint, query, headers, pages, stop,
+                                      slice_id, slices))
+               for slice_id in range(slices)]
+    for thread in threads:
+        thread.start()
+
+    n_retrieved = 0
+    running = slices
+    try:
+        while running:
+            slice_id, hits, seconds, nbytes = pages.get()
+            if hits is None:
+                running -= 1
+                continue
+            if isinstance(hits, Exception):
+                print(f"Slice {slice_id} failed: {hits}")
+                panel.discard()
+                return None
+            metrics.add("request", wall_seconds=seconds, bytes=nbytes)
+            panel.add_page(hits)
+            n_retrieved += len(hits)
+            print(f"Retrieved {n_retrieved} records so far...")
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    print(f"API call completed. Total records retrieved: {n_retrieved}")
+
+    tables = panel.finish()
+    print(f"\nSaved {len(tables)} parquet files to {punit_data_folder_path}")
+    if dataset_root and year is not None:
+        for name in tables:
+            with metrics.stage(f"publish/{name}") as stage:
+                file_path = os.path.join(punit_data_folder_path, f"{output_filename}_{name}.parquet")
+                stage["rows"] = write_partition(file_path, dataset_root, f"{OUTPUT_FILENAME}_{name}", year)
+        print(f"Published {len(tables)} tables to {dataset_root}")
+    elif dataset_root:
+        print("Publishing to the dataset needs a year; skipping it.")
+
+    if metrics_path is None:
+        metrics_path = os.path.join(punit_data_folder_path, f"{output_filename}_run_report.json")
+    metrics.finish(metrics_path, prometheus_path)
+    return tables
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Download production units (P-units) from the Virk API')
+    parser.add_argument('--year', type=int, help='Filter data by specific year')
+    parser.add_argument('--slices', type=int, default=1, help='Scroll slices downloaded in parallel (default: 1)')
+    parser.add_argument('--size', type=int, default=3000, help='Documents per scroll page (default: 3000)')
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET, metavar='MB',
+                        help=f'MB of exploded rows held in memory before spilling (default: {DEFAULT_MEMORY_BUDGET})')
+    parser.add_argument('--dataset-root', help='Also write the outputs into this hive-partitioned dataset (needs --year)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only estimate the size, peak memory and wall time of the run from a few sample pages')
+    parser.add_argument('--metrics-json', help='Path of the JSON run report (default: next to the output files)')
+    parser.add_argument('--prometheus-textfile', help='Also write the run metrics as a Prometheus textfile')
+    parser.add_argument('--profile', choices=PROFILERS, help='Profile every stage with cProfile or pyinstrument')
+    parser.add_argument('--profile-dir', help='Folder for the per-stage profiles (default: the output folder)')
+    args = parser.parse_args()
+
+    result = main(year=args.year, slices=args.slices, size=args.size, memory_budget=args.memory_budget,
+                  dataset_root=args.dataset_root, dry_run=args.dry_run, metrics_path=args.metrics_json,
+                  prometheus_path=args.prometheus_textfile, profile=args.profile, profile_dir=args.profile_dir)
+    if result is None:
+        sys.exit(1)
@@ -0,0 +1,233 @@
+"""
+Per-stage run metrics for the extraction scripts.
+
+Each stage (request, decode, explode/<table>, write/<table>, ...) records wall
+time, CPU time, bytes, rows and peak RSS. Repeated stages (one request per
+scroll page) are aggregated. At the end of a run the metrics are written as a
+JSON run report and, optionally, as a Prometheus textfile for the node_exporter
+textfile collector.
+
+Optional profiling wraps every stage in cProfile or pyinstrument (if installed)
+and writes one profile per stage.
+
+Usage:
+    metrics = RunMetrics("virksomhed_2018", profile="cprofile", profile_dir="profiles")
+    with metrics.stage("request") as stage:
+        response = requests.post(...)
+        stage["bytes"] = len(response.content)
+    metrics.write_json("virksomhed_2018_run_report.json")
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import cProfile
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+PROFILERS = ["cprofile", "pyinstrument"]
+
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS counter (Linux only; a no-op elsewhere)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    """Peak resident set size in MB since the last reset_peak_rss() (or process start)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+class RunMetrics:
+    """
+    Collects per-stage metrics for one extraction run.
+
+    Args:
+        run_name: Name of the run, used in reports and Prometheus labels
+        profile: None, "cprofile" or "pyinstrument"
+        profile_dir: Folder for per-stage profiles (default: current folder)
+        params: Optional dict of run parameters stored in the report
+    """
+
+    def __init__(self, run_name, profile=None, profile_dir=None, params=None):
+        if profile not in (None, *PROFILERS):
+            raise ValueError(f"Unknown profiler {profile!r}; expected one of {PROFILERS}")
+        if profile == "pyinstrument":
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                raise ImportError("Profiling with pyinstrument requires `pip install pyinstrument`")
+
+        self.run_name = run_name
+        self.profile = profile
+        self.profile_dir = profile_dir or "."
+        self.params = params or {}
+        self.stages = {}
+        self.profilers = {}
+        self.started_at = datetime.now(timezone.utc)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.peak_rss_mb = peak_rss_mb()
+
+    @contextmanager
+    def stage(self, name, bytes=0, rows=0):
+        """
+        Measure one execution of a stage.
+
+        The yielded dict may be updated with "bytes" and "rows" inside the block.
+        Stage names like "explode/navne" are reported as stage="explode", table="navne".
+        """
+        record = {"bytes": bytes, "rows": rows}
+        profiler = self._start_profiler(name)
+        reset_peak_rss()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            if profiler is not None:
+                self._stop_profiler(profiler)
+            self.add(name, wall_seconds=wall, cpu_seconds=cpu,
+                     bytes=record["bytes"], rows=record["rows"], peak_rss_mb=peak_rss_mb())
+
+    def add(self, name, wall_seconds=0.0, cpu_seconds=0.0, bytes=0, rows=0, peak_rss_mb=0.0):
+        """Add one measured execution to a stage's aggregate."""
+        stage = self.stages.setdefault(name, {
+            "calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "bytes": 0, "rows": 0, "peak_rss_mb": 0.0,
+        })
+        stage["calls"] += 1
+        stage["wall_seconds"] += wall_seconds
+        stage["cpu_seconds"] += cpu_seconds
+        stage["bytes"] += bytes or 0
+        stage["rows"] += rows or 0
+        stage["peak_rss_mb"] = max(stage["peak_rss_mb"], peak_rss_mb)
+        self.peak_rss_mb = max(self.peak_rss_mb, peak_rss_mb)
+
+    # --- Profiling ---
+    def _start_profiler(self, name):
+        if self.profile is None:
+            return None
+        profiler = self.profilers.get(name)
+        if profiler is None:
+            if self.profile == "cprofile":
+                profiler = cProfile.Profile()
+            else:
+                from pyinstrument import Profiler
+                profiler = Profiler()
+            self.profilers[name] = profiler
+        if self.profile == "cprofile":
+            profiler.enable()
+        else:
+            profiler.start()
+        return profiler
+
+    def _stop_profiler(self, profiler):
+        if self.profile == "cprofile":
+            profiler.disable()
+        else:
+            profiler.stop()
+
+    def write_profiles(self):
+        """Write one profile per stage: .prof (cProfile, open with snakeviz/pstats) or .html (pyinstrument)."""
+        if not self.profilers:
+            return []
+        os.makedirs(self.profile_dir, exist_ok=True)
+        paths = []
+        for name, profiler in self.profilers.items():
+            base = os.path.join(self.profile_dir, f"{self.run_name}_{name.replace('/', '_')}")
+            if self.profile == "cprofile":
+                path = f"{base}.prof"
+                profiler.dump_stats(path)
+            else:
+                path = f"{base}.html"
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(profiler.output_html())
+            paths.append(path)
+        return paths
+
+    # --- Reports ---
+    def report(self):
+        return {
+            "run": self.run_name,
+            "started_at": self.started_at.isoformat(),
+            "wall_seconds": time.perf_counter() - self.wall_start,
+            "cpu_seconds": time.process_time() - self.cpu_start,
+            "peak_rss_mb": self.peak_rss_mb,
+            "params": self.params,
+            "stages": self.stages,
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        return path
+
+    def write_prometheus(self, path):
+        """Write a Prometheus textfile, atomically (write to a temp file, then rename)."""
+        report = self.report()
+        run = report["run"]
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f"# HELP cvr_extraction_{name} {help_text}")
+            lines.append(f"# TYPE cvr_extraction_{name} gauge")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"cvr_extraction_{name}{{{label_text}}} {value}")
+
+        def stage_labels(name):
+            stage, _, table = name.partition("/")
+            return {"run": run, "stage": stage, "table": table}
+
+        metric("run_wall_seconds", "Wall time of the run.", [({"run": run}, report["wall_seconds"])])
+        metric("run_cpu_seconds", "CPU time of the run.", [({"run": run}, report["cpu_seconds"])])
+        metric("run_peak_rss_bytes", "Peak resident set size of the run.",
+               [({"run": run}, int(report["peak_rss_mb"] * 1024 * 1024))])
+        for key, help_text in [("calls", "Number of executions of the stage."),
+                               ("wall_seconds", "Wall time spent in the stage."),
+                               ("cpu_seconds", "CPU time spent in the stage."),
+                               ("bytes", "Bytes received or written by the stage."),
+                               ("rows", "Rows produced by the stage.")]:
+            metric(f"stage_{key}", help_text,
+                   [(stage_labels(name), stage[key]) for name, stage in self.stages.items()])
+        metric("stage_peak_rss_bytes", "Peak resident set size during the stage.",
+               [(stage_labels(name), int(stage["peak_rss_mb"] * 1024 * 1024)) for name, stage in self.stages.items()])
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+        return path
+
+    def print_summary(self):
+        report = self.report()
+        print(f"\nRun {report['run']}: {report['wall_seconds']:.1f}s wall, {report['cpu_seconds']:.1f}s CPU, "
+              f"peak RSS {report['peak_rss_mb']:.0f} MB")
+        print(f"  {'stage':<32}{'calls':>8}{'wall s':>10}{'cpu s':>10}{'MB':>10}{'rows':>12}{'peak MB':>10}")
+        for name, stage in sorted(self.stages.items(), key=lambda item: -item[1]["wall_seconds"]):
+            print(f"  {name:<32}{stage['calls']:>8}{stage['wall_seconds']:>10.2f}{stage['cpu_seconds']:>10.2f}"
+                  f"{stage['bytes'] / 1e6:>10.1f}{stage['rows']:>12}{stage['peak_rss_mb']:>10.0f}")
+
+    def finish(self, json_path, prometheus_path=None):
+        """Print the summary and write the JSON report, the optional Prometheus textfile and profiles."""
+        self.print_summary()
+        print(f"Run report written to {self.write_json(json_path)}")
+        if prometheus_path:
+            print(f"Prometheus metrics written to {self.write_prometheus(prometheus_path)}")
+        for path in self.write_profiles():
+            print(f"Profile written to {path}")
@@ -0,0 +1,326 @@
+"""
+Runs the extraction scripts for a range of years as one dependency-aware pipeline.
+
+Every (step, year) is a task that runs its script in a subprocess:
+
+    virksomhed              virksomhed_api_call.py --year Y
+    produktionsenhed        produktionsenhed_api_call.py --year Y
+    financial_statements    financial_statements_api_call.py --year Y
+    xbrl                    individual_statements_api_call.py --years Y, after financial_statements
+                            Y and Y-1 (a report ending in Y can sit in the Y-1 file, see
+                            individual_statements_api_call.metadata_paths)
+
+Independent tasks run concurrently under two global limits: --workers processes and
+--max-connections connections to the CVR distribution API (one scroll per run, --slices
+for production units). The XBRL downloads go to another host and are bounded by
+--max-in-flight. Ready tasks with the most dependents start first, so the XBRL step of a
+year starts as soon as its financial statements are in.
+
+The state of every task is kept in {state_dir}/pipeline_state.json and its output in
+{state_dir}/logs/{task}.log. A rerun skips the tasks that are up to date: done with the
+same command, with their run report and output still in place and finished after their
+dependencies. A run only counts as done if the script exits cleanly and writes its run
+report (the scripts exit non-zero without writing any output or report when a request
+fails, also in the middle of a scroll; the XBRL step writes it once every URL is done), and for the XBRL step if companies_all_tags_{year}.parquet or its
+long-format parts are in place (unless the report records no rows, e.g. a year without
+reports). Failed tasks are retried
+--retries times and are rerun by the next run; the XBRL step resumes from its checkpoint.
+
+Usage:
+    python run_pipeline.py --years 2015 2024
+    python run_pipeline.py --years 2024 --steps virksomhed produktionsenhed --slices 4 --max-connections 6
+    python run_pipeline.py --years 2015 2024 --plan
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import subprocess
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+COMPANY_DATA_FOLDER_PATH = os.getenv("COMPANY_DATA_FOLDER_PATH")
+PUNIT_DATA_FOLDER_PATH = os.getenv("PUNIT_DATA_FOLDER_PATH") or COMPANY_DATA_FOLDER_PATH
+FS_FOLDER_PATH = os.getenv("FS_FOLDER_PATH")
+EFS_FOLDER_PATH = os.getenv("EFS_FOLDER_PATH")
+PIPELINE_STATE_PATH = os.getenv("PIPELINE_STATE_PATH") or "pipeline_state"
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_FILENAME = "pipeline_state.json"
+
+# In dependency order
+STEPS = ["virksomhed", "produktionsenhed", "financial_statements", "xbrl"]
+DEFAULT_STEPS = ["virksomhed", "financial_statements", "xbrl"]
+SCRIPTS = {
+    "virksomhed": "virksomhed_api_call.py",
+    "produktionsenhed": "produktionsenhed_api_call.py",
+    "financial_statements": "financial_statements_api_call.py",
+    "xbrl": "individual_statements_api_call.py",
+}
+XBRL_OUTPUT_FILENAME = "companies_all_tags"
+RETRY_DELAY = 60  # seconds, times the attempt number
+
+
+def task_name(step, year):
+    return f"{step}_{year}"
+
+
+def run_report_path(step, year):
+    """Run report written at the end of a successful run."""
+    folders = {"virksomhed": COMPANY_DATA_FOLDER_PATH, "produktionsenhed": PUNIT_DATA_FOLDER_PATH,
+               "financial_statements": FS_FOLDER_PATH, "xbrl": EFS_FOLDER_PATH}
+    name = XBRL_OUTPUT_FILENAME if step == "xbrl" else step
+    return os.path.join(folders[step] or ".", f"{name}_{year}_run_report.json")
+
+
+def output_in_place(step, year):
+    """
+    Whether the output of a task with a run report is in place.
+
+    Only checked for the XBRL step: companies_all_tags_{year}.parquet, or the parts of the
+    long-format dataset written by the year's run, unless the run wrote no rows.
+    """
+    if step != "xbrl":
+        return True
+    with open(run_report_path(step, year), encoding="utf-8") as f:
+        if json.load(f).get("params", {}).get("rows") == 0:
+            return True
+    folder = EFS_FOLDER_PATH or "."
+    return (os.path.exists(os.path.join(folder, f"{XBRL_OUTPUT_FILENAME}_{year}.parquet"))
+            or bool(glob.glob(os.path.join(folder, f"{XBRL_OUTPUT_FILENAME}_long", "year=*", f"part-{year}-*.parquet"))))
+
+
+def finished_ok(step, year, started):
+    """Whether a task that exited cleanly finished its work."""
+    report = run_report_path(step, year)
+    return os.path.exists(report) and os.path.getmtime(report) >= started and output_in_place(step, year)
+
+
+def task_command(step, year, options):
+    """Command line of a task."""
+    command = [sys.executable, os.path.join(SRC_DIR, SCRIPTS[step])]
+    if step == "xbrl":
+        return command + ["--years", str(year), "--max-in-flight", str(options.max_in_flight)]
+    command += ["--year", str(year)]
+    if step == "produktionsenhed":
+        command += ["--slices", str(options.slices)]
+    if options.memory_budget and step in ("virksomhed", "produktionsenhed"):
+        command += ["--memory-budget", str(options.memory_budget)]
+    if options.dataset_root:
+        command += ["--dataset-root", options.dataset_root]
+    return command
+
+
+def build_tasks(years, steps, options):
+    """
+    Tasks of the pipeline, in dependency order.
+
+    Returns:
+        Dictionary of task name -> {"step", "year", "command", "connections", "depends"}.
+        depends lists the dependencies whether or not they are part of this run.
+    """
+    tasks = {}
+    for step in sorted(steps, key=STEPS.index):
+        for year in years:
+            depends = [task_name("financial_statements", y) for y in (year - 1, year)] if step == "xbrl" else []
+            tasks[task_name(step, year)] = {
+                "step": step,
+                "year": year,
+                "command": task_command(step, year, options),
+                "connections": {"produktionsenhed": options.slices, "xbrl": 0}.get(step, 1),
+                "depends": depends,
+            }
+    return tasks
+
+
+def load_state(state_dir):
+    path = os.path.join(state_dir, STATE_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state_dir, state):
+    path = os.path.join(state_dir, STATE_FILENAME)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def up_to_date(name, task, state, rerun):
+    """
+    Whether a task can be skipped: done with the same command, its run report and output still in
+    place, and finished after its dependencies (none of which is rerun).
+    """
+    entry = state.get(name)
+    if not entry or entry["status"] != "done" or entry["command"] != task["command"][1:]:
+        return False
+    report = run_report_path(task["step"], task["year"])
+    if not os.path.exists(report) or not output_in_place(task["step"], task["year"]):
+        return False
+    return all(dep not in rerun and state.get(dep, {}).get("finished", "") <= entry["started"]
+               for dep in task["depends"])
+
+
+def _dependents(tasks):
+    """Number of tasks depending (directly or not) on each task, used to start those first."""
+    counts = {}
+    for name in reversed(list(tasks)):
+        children = [child for child, task in tasks.items() if name in task["depends"]]
+        counts[name] = len(children) + sum(counts[child] for child in children)
+    return counts
+
+
+def plan(tasks, state, force=False):
+    """Split the tasks into those to run and those up to date."""
+    rerun = []
+    for name, task in tasks.items():
+        if force or not up_to_date(name, task, state, rerun):
+            rerun.append(name)
+    return rerun, [name for name in tasks if name not in rerun]
+
+
+def run_tasks(tasks, state_dir=PIPELINE_STATE_PATH, workers=2, max_connections=4, retries=1, force=False,
+              retry_delay=RETRY_DELAY, poll_seconds=1.0):
+    """
+    Run the tasks that are not up to date, concurrently within the limits.
+
+    Args:
+        tasks: Tasks from build_tasks
+        state_dir: Folder of the state file and the task logs
+        workers: Maximum number of tasks running at a time
+        max_connections: Maximum number of API connections in use at a time (a task needing
+            more runs alone)
+        retries: Times a failed task is retried in this run
+        force: Rerun every task
+
+    Returns:
+        Dictionary of task name -> "done", "up to date", "failed" or "blocked" (a dependency failed)
+    """
+    os.makedirs(os.path.join(state_dir, "logs"), exist_ok=True)
+    state = load_state(state_dir)
+    pending, skipped = plan(tasks, state, force)
+    results = {name: "up to date" for name in skipped}
+    for name in skipped:
+        print(f"[up to date] {name}")
+    priority = _dependents(tasks)
+    not_before, attempts, running = {}, {}, {}
+
+    try:
+        while pending or running:
+            for name, (process, log, started) in list(running.items()):
+                exit_code = process.poll()
+                if exit_code is None:
+                    continue
+                log.close()
+                del running[name]
+                task = tasks[name]
+                ok = exit_code == 0 and finished_ok(task["step"], task["year"], started)
+                state[name].update(status="done" if ok else "failed", finished=_now(), exit_code=exit_code,
+                                   seconds=round(time.time() - started, 1))
+                save_state(state_dir, state)
+                if ok:
+                    results[name] = "done"
+                    print(f"[done] {name} ({(time.time() - started) / 60:.1f} min)")
+                elif attempts[name] <= retries:
+                    not_before[name] = time.time() + retry_delay * attempts[name]
+                    pending.append(name)
+                    print(f"[failed] {name} (exit code {exit_code}); retrying in {retry_delay * attempts[name]} s")
+                else:
+                    results[name] = "failed"
+                    print(f"[failed] {name} (exit code {exit_code}), see {state[name]['log']}")
+
+            # Tasks behind a failed dependency wait for the next run
+            for name in list(pending):
+                if any(results.get(dep) in ("failed", "blocked") for dep in tasks[name]["depends"]):
+                    pending.remove(name)
+                    results[name] = "blocked"
+                    print(f"[blocked] {name}: a dependency failed")
+
+            in_use = sum(min(tasks[name]["connections"], max_connections) for name in running)
+            ready = [name for name in pending
+                     if time.time() >= not_before.get(name, 0)
+                     and all(dep not in pending and dep not in running for dep in tasks[name]["depends"])]
+            for name in sorted(ready, key=lambda name: (-priority[name], tasks[name]["year"])):
+                connections = min(tasks[name]["connections"], max_connections)
+                if len(running) >= workers or in_use + connections > max_connections:
+                    continue
+                in_use += connections
+                pending.remove(name)
+                attempts[name] = attempts.get(name, 0) + 1
+                log_path = os.path.join(state_dir, "logs", f"{name}.log")
+                log = open(log_path, "a", encoding="utf-8")
+                log.write(f"\n=== {_now()} attempt {attempts[name]}: {' '.join(tasks[name]['command'])}\n")
+                log.flush()
+                started = time.time()
+                process = subprocess.Popen(tasks[name]["command"], stdout=log, stderr=subprocess.STDOUT,
+                                           cwd=SRC_DIR, env={**os.environ, "PYTHONUNBUFFERED": "1"})
+                running[name] = (process, log, started)
+                state[name] = {"status": "running", "command": tasks[name]["command"][1:], "started": _now(),
+                               "attempts": state.get(name, {}).get("attempts", 0) + 1, "log": log_path}
+                save_state(state_dir, state)
+                print(f"[start] {name}")
+
+            if pending or running:
+                time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        for name, (process, log, _) in running.items():
+            process.terminate()
+            process.wait()
+            log.close()
+            state[name].update(status="failed", finished=_now(), exit_code=None)
+        save_state(state_dir, state)
+        raise
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the extraction scripts for a range of years as one pipeline')
+    parser.add_argument('--years', type=int, nargs='+', required=True, metavar=('YEAR', 'END_YEAR'),
+                        help='One year (e.g. 2024) or a range (e.g. 2015 2024)')
+    parser.add_argument('--steps', nargs='+', choices=STEPS, default=DEFAULT_STEPS,
+                        help=f'Steps to run (default: {" ".join(DEFAULT_STEPS)})')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Maximum number of tasks running at a time (default: half the CPUs)')
+    parser.add_argument('--max-connections', type=int, default=4,
+                        help='Maximum number of connections to the CVR distribution API at a time (default: 4)')
+    parser.add_argument('--slices', type=int, default=1, help='produktionsenhed: parallel scroll slices (default: 1)')
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+                        help='virksomhed and produktionsenhed: MB of exploded rows held before spilling')
+    parser.add_argument('--max-in-flight', type=int, default=50, help='xbrl: concurrent downloads (default: 50)')
+    parser.add_argument('--dataset-root', help='Also write the outputs into this hive-partitioned dataset')
+    parser.add_argument('--state-dir', default=PIPELINE_STATE_PATH,
+                        help='Folder of the pipeline state and task logs (default: $PIPELINE_STATE_PATH or pipeline_state)')
+    parser.add_argument('--retries', type=int, default=1, help='Times a failed task is retried in the run (default: 1)')
+    parser.add_argument('--force', action='store_true', help='Rerun every task, even if up to date')
+    parser.add_argument('--plan', action='store_true', help='Only print the tasks that would run')
+    args = parser.parse_args()
+
+    if len(args.years) > 2 or args.years[0] > args.years[-1]:
+        parser.error('--years takes one year or a range FIRST LAST')
+    years = list(range(args.years[0], args.years[-1] + 1))
+    tasks = build_tasks(years, args.steps, args)
+
+    if args.plan:
+        rerun, skipped = plan(tasks, load_state(args.state_dir), args.force)
+        for name in tasks:
+            print(f"{'run' if name in rerun else 'up to date':<11} {name:<28} {' '.join(tasks[name]['command'][1:])}")
+        sys.exit(0)
+
+    start = time.perf_counter()
+    results = run_tasks(tasks, args.state_dir, workers=args.workers, max_connections=args.max_connections,
+                        retries=args.retries, force=args.force)
+    counts = {status: list(results.values()).count(status) for status in ["done", "up to date", "failed", "blocked"]}
+    print(f"\nPipeline finished in {(time.perf_counter() - start) / 60:.1f} min: "
+          + ", ".join(f"{count} {status}" for status, count in counts.items()))
+    sys.exit(1 if counts["failed"] or counts["blocked"] else 0)
@@ -0,0 +1,290 @@
+"""
+Registry of the Arrow schemas of every output table.
+
+Tables used to be built with pd.DataFrame(records), so their dtypes followed each page's
+values: a column of all-None became object (or a null column in parquet), ints with a
+missing value became float, and a page without rows had no columns at all. Pages and
+yearly files then disagreed and every concatenation had to unify and cast.
+
+Here every column has a fixed type, so the per-page tables, spilled parts and yearly files
+of a table share one schema and concatenate without casts (pa.concat_tables is zero-copy).
+
+- Panel tables (virksomhed and produktionsenhed): PANEL_COLUMNS lists the columns of each
+  table after the unit number (cvrNummer, or pNummer for P-units) and enhedsNummer.
+- Column types follow the CVR field name (the last part of a flattened name such as
+  Vrvirksomhed_virksomhedMetadata_nyesteBeliggenhedsadresse_postnummer), see FIELD_TYPES;
+  other fields are strings. The open tables whose columns depend on the documents (main,
+  wide, financial_statements) are typed by the same rule column by column.
+- Normalized deltagerRelation tables and the XBRL tables are registered in SCHEMAS. The
+  XBRL wide table is open: its tag columns keep the type chosen for them (int64, float64 or
+  string, see individual_statements_api_call.integral_tags).
+
+Dates are kept as the ISO strings of the API, as before.
+
+Usage:
+    df = records_to_frame(records, panel_schema('navne'))      # in an explode function
+    table = conform(df, schema_for(df.columns))                # an open table
+"""
+
+import pandas as pd
+import pyarrow as pa
+
+# CVR fields that are not strings, by field name
+FIELD_TYPES = {
+    # Unit numbers
+    'cvrNummer': pa.int64(),
+    'pNummer': pa.int64(),
+    'enhedsNummer': pa.int64(),
+    'deltagerEnhedsNummer': pa.int64(),
+    'deltagerForretningsnoegle': pa.int64(),
+    'nyesteCvrNummerRelation': pa.int64(),
+    'samtId': pa.int64(),
+    'dataAdgang': pa.int64(),
+    # Addresses
+    'vejkode': pa.int64(),
+    'husnummerFra': pa.int64(),
+    'husnummerTil': pa.int64(),
+    'postnummer': pa.int64(),
+    'kommuneKode': pa.int64(),
+    # Employment
+    'aar': pa.int64(),
+    'kvartal': pa.int64(),
+    'maaned': pa.int64(),
+    'antalInklusivEjere': pa.int64(),
+    'antalAnsatte': pa.int64(),
+    'antalAarsvaerk': pa.float64(),
+    'antalPenheder': pa.int64(),
+    # Codes and sequence numbers
+    'virksomhedsformkode': pa.int64(),
+    'statuskode': pa.int64(),
+    'sekvensnr': pa.int64(),
+    'attributSekvensnr': pa.int64(),
+    # Flags
+    'reklamebeskyttet': pa.bool_(),
+    'fejlRegistreret': pa.bool_(),
+    'fejlVedIndlaesning': pa.bool_(),
+    'hemmelig': pa.bool_(),
+    'omgoerelse': pa.bool_(),
+    # Search metadata
+    '_score': pa.float64(),
+    # Normalized deltagerRelation keys
+    'organisationKey': pa.int32(),
+    'deltagerKey': pa.int32(),
+}
+
+PERIOD = ['gyldigFra', 'gyldigTil', 'sidstOpdateret']
+ADDRESS = ['landekode', 'fritekst', 'vejkode', 'vejnavn', 'husnummerFra', 'husnummerTil', 'bogstavFra',
+           'bogstavTil', 'etage', 'sidedoer', 'conavn', 'postboks', 'postnummer', 'postdistrikt', 'bynavn',
+           'adresseId', 'sidstValideret', 'kommuneKode', 'kommuneNavn', *PERIOD]
+BRANCH = ['branchekode', 'branchetekst', *PERIOD]
+EMPLOYMENT = ['aar', 'kvartal', 'maaned', 'antalInklusivEjere', 'antalAarsvaerk', 'antalAnsatte',
+              'intervalKodeAntalInklusivEjere', 'intervalKodeAntalAarsvaerk', 'intervalKodeAntalAnsatte',
+              'sidstOpdateret']
+CONTACT = ['kontaktoplysning', *PERIOD]
+RELATION = ['deltagerEnhedsNummer', 'deltagerEnhedstype', 'deltagerForretningsnoegle', 'organisationHovedtype',
+            'organisationNavn', 'attributType', 'attributVapitype', 'attributSekvensnr', 'attributVaerdi', *PERIOD]
+
+# Panel tables: columns after the unit number and enhedsNummer (main is open, see schema_for)
+PANEL_COLUMNS = {
+    'navne': ['navn', *PERIOD],
+    'binavne': ['navn', *PERIOD],
+    'beliggenhedsadresse': ADDRESS,
+    'postadresse': ADDRESS,
+    'hovedbranche': BRANCH,
+    'bibranche1': BRANCH,
+    'bibranche2': BRANCH,
+    'bibranche3': BRANCH,
+    'aarsbeskaeftigelse': EMPLOYMENT,
+    'kvartalsbeskaeftigelse': EMPLOYMENT,
+    'maanedsbeskaeftigelse': EMPLOYMENT,
+    'virksomhedsstatus': ['status', *PERIOD],
+    'telefonNummer': CONTACT,
+    'telefaxNummer': CONTACT,
+    'elektroniskPost': CONTACT,
+    'hjemmeside': CONTACT,
+    'virksomhedsform': ['kortBeskrivelse', 'langBeskrivelse', 'ansvarligDataleverandoer', *PERIOD],
+    'regNummer': ['regnummer', *PERIOD],
+    'livsforloeb': PERIOD,
+    'deltagerRelation': RELATION,
+    'attributter': ['type', 'vapitype', 'sekvensnr', 'vaerdi', *PERIOD],
+    # P-units: the CVR number the P-unit belonged to in each period
+    'virksomhedsrelation': ['cvrNummer', *PERIOD],
+}
+
+
+def field_type(name):
+    """Arrow type of a column, from its full name or the last part of a flattened name."""
+    if name in FIELD_TYPES:
+        return FIELD_TYPES[name]
+    return FIELD_TYPES.get(name.rsplit('_', 1)[-1], pa.string())
+
+
+def schema_for(names):
+    """Schema of the given columns, typed by field name (for the open tables)."""
+    return pa.schema([(name, field_type(name)) for name in names])
+
+
+def panel_schema(table, key='cvrNummer'):
+    """Schema of a panel table (key: cvrNummer, or pNummer for P-units)."""
+    return schema_for([key, 'enhedsNummer', *PANEL_COLUMNS[table]])
+
+
+def table_schema(table, columns, key='cvrNummer'):
+    """Registered schema of an output table, or the typed schema of its columns for an open table."""
+    if table in PANEL_COLUMNS:
+        return panel_schema(table, key)
+    if table in SCHEMAS:
+        return SCHEMAS[table]
+    return schema_for(columns)
+
+
+def unify_schemas(schemas):
+    """
+    Unify schemas like pa.unify_schemas(promote_options="permissive"), but resolve columns whose
+    types cannot be promoted (e.g. an XBRL tag that is numeric one year and text the next) to
+    string instead of raising. Those columns are printed.
+    """
+    schemas = [schema.remove_metadata() for schema in schemas]
+    try:
+        return pa.unify_schemas(schemas, promote_options="permissive")
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        pass
+    types = {}
+    for schema in schemas:
+        for field in schema:
+            types.setdefault(field.name, []).append(field.type)
+    fields = []
+    for name, column_types in types.items():
+        try:
+            column_type = pa.unify_schemas([pa.schema([(name, column_type)]) for column_type in column_types],
+                                           promote_options="permissive").field(name).type
+        except (pa.ArrowTypeError, pa.ArrowInvalid):
+            column_type = pa.string()
+            print(f"Column {name!r} has incompatible types ({', '.join(sorted(set(map(str, column_types))))}); "
+                  f"stored as string")
+        fields.append(pa.field(name, column_type))
+    return pa.schema(fields)
+
+
+XBRL_FACTS = pa.schema([
+    ("url_index", pa.int32()),
+    ("tag", pa.string()),
+    ("value_num", pa.float64()),
+    ("value_str", pa.string()),
+    ("unit", pa.string()),
+    ("contextRef", pa.string()),
+    ("unitRef", pa.string()),
+    ("decimals", pa.string()),
+    ("identifier", pa.string()),
+    ("start_date", pa.string()),
+    ("end_date", pa.string()),
+    ("instant", pa.string()),
+])
+
+SCHEMAS = {
+    'deltagerRelation_deltager': schema_for(['deltagerKey', 'deltagerEnhedsNummer', 'deltagerEnhedstype',
+                                             'deltagerForretningsnoegle']),
+    'deltagerRelation_organisation': schema_for(['organisationKey', 'cvrNummer', 'enhedsNummer', 'deltagerKey',
+                                                 'organisationHovedtype', 'organisationNavn', *PERIOD]),
+    'deltagerRelation_attribut': schema_for(['organisationKey', 'attributType', 'attributVapitype',
+                                             'attributSekvensnr', 'attributVaerdi', *PERIOD]),
+    # Checkpoint parts of the XBRL step (one row per parsed fact)
+    'xbrl_facts': XBRL_FACTS,
+    # companies_all_tags_long/year=YYYY/
+    'xbrl_long': pa.schema([
+        ("identifier", pa.string()),
+        ("tag", pa.dictionary(pa.int32(), pa.string())),
+        ("value_num", pa.float64()),
+        ("value_str", pa.string()),
+        ("unit", pa.string()),
+        ("unitRef", pa.string()),
+        ("decimals", pa.string()),
+        ("contextRef", pa.string()),
+        ("start_date", pa.timestamp("us")),
+        ("end_date", pa.timestamp("us")),
+        ("instant", pa.timestamp("us")),
+        # Source report: its URL and the year its accounting period ends
+        ("source_url", pa.dictionary(pa.int32(), pa.string())),
+        ("report_year", pa.int16()),
+        ("year", pa.int16()),
+    ]),
+    # companies_all_tags_{year}.parquet: identifier, one column per tag, Year (open)
+    'xbrl_wide': pa.schema([("identifier", pa.string()), ("Year", pa.int64())]),
+}
+
+# Nullable pandas dtypes, so an int or bool column keeps its dtype when a value is missing
+PANDAS_TYPES = {
+    pa.int64(): pd.Int64Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+}
+
+
+def _cast(column, name, target):
+    if column.type == target:
+        return column
+    try:
+        return column.cast(target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+        raise ValueError(f"Column {name!r} ({column.type}) does not fit its registered type {target}: {e}") from e
+
+
+def conform(data, schema, extra=False):
+    """
+    Conform a DataFrame or pyarrow Table to a registered schema.
+
+    Registered columns are cast to their type, and missing ones are added as nulls.
+    Columns outside the schema are dropped, or kept with extra=True (all-null and large_string
+    columns, as pandas string columns convert, become strings). With extra=True the data's
+    column order is kept.
+
+    Returns:
+        pyarrow Table (schema metadata dropped)
+    """
+    table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+    table = table.replace_schema_metadata(None)
+    names = table.column_names
+    columns, fields = [], []
+    for name in (names if extra else []):
+        target = schema.field(name).type if name in schema.names else None
+        column = table[name]
+        if target is None:
+            is_text = pa.types.is_null(column.type) or pa.types.is_large_string(column.type)
+            target = pa.string() if is_text else column.type
+        columns.append(_cast(column, name, target))
+        fields.append(pa.field(name, target))
+    for field in schema:
+        if extra and field.name in names:
+            continue
+        column = table[field.name] if field.name in names else pa.nulls(table.num_rows, field.type)
+        columns.append(_cast(column, field.name, field.type))
+        fields.append(field)
+    return pa.Table.from_arrays(columns, schema=pa.schema(fields))
+
+
+def to_frame(table):
+    """DataFrame of a conformed table, with nullable int and bool dtypes."""
+    return table.to_pandas(types_mapper=PANDAS_TYPES.get)
+
+
+def _column(values, name, target):
+    """Arrow array of one field's values, converting values of another type than the registered one."""
+    try:
+        return pa.array(values, type=target)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Values of another type than the registered one (e.g. a code sent as a number, or
+        # numbers and strings mixed in one page): go through their text
+        text = pa.array([value if value is None or isinstance(value, str) else str(value) for value in values],
+                        type=pa.string())
+        return _cast(text, name, target)
+
+
+def records_to_frame(records, schema):
+    """Build a DataFrame of records (a list of dicts) with exactly the registered columns and dtypes."""
+    try:
+        table = pa.Table.from_pylist(records, schema=schema)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        table = pa.Table.from_arrays([_column([record.get(field.name) for record in records], field.name, field.type)
+                                      for field in schema], schema=schema)
+    return to_frame(table)
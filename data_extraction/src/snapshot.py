@@ -0,0 +1,212 @@
+"""
+Point-in-time snapshots of the virksomhed panel tables.
+
+Every panel table carries gyldigFra/gyldigTil validity intervals. For each table
+an IntervalIndex sorts the rows by (enhedsNummer, gyldigFra), packed into one int64
+key per row; the state of every company on a date is then a single vectorized
+np.searchsorted over all (company, date) pairs instead of filtering rows.
+
+Usage:
+    python snapshot.py --year 2024 --date 2020-01-01 --out snapshot_2020.parquet
+    python snapshot.py --year 2024 --date 2018-12-31 2019-12-31 2020-12-31 --out snapshots.parquet
+
+    snapshots = SnapshotEngine.from_panel(folder, "virksomhed_2024")
+    snapshots.snapshot("2020-01-01")
+"""
+
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from ownership_graph import to_days, MIN_DAY, MAX_DAY
+
+load_dotenv()
+
+COMPANY_DATA_FOLDER_PATH = os.getenv("COMPANY_DATA_FOLDER_PATH")
+OUTPUT_FILENAME = "virksomhed"
+
+# Panel table -> {column: snapshot column name}
+SNAPSHOT_TABLES = {
+    'navne': {'navn': 'navn'},
+    'beliggenhedsadresse': {'vejnavn': 'vejnavn', 'husnummerFra': 'husnummerFra', 'postnummer': 'postnummer',
+                            'postdistrikt': 'postdistrikt', 'kommuneKode': 'kommuneKode'},
+    'hovedbranche': {'branchekode': 'hovedbranche_kode', 'branchetekst': 'hovedbranche_tekst'},
+    'virksomhedsstatus': {'status': 'status'},
+    'virksomhedsform': {'kortBeskrivelse': 'virksomhedsform_kode', 'langBeskrivelse': 'virksomhedsform'},
+}
+# Bits of the sort key used for the start day (enhedsNummer goes above them).
+# 20 bits cover roughly 1400 years either side of 1970; open starts map to the lowest value.
+DAY_BITS = 20
+DAY_OFFSET = 1 << (DAY_BITS - 1)
+
+
+def interval_keys(enheds_numre, days):
+    """Sort keys enhedsNummer << DAY_BITS | day, ordering rows by (enhedsNummer, day)."""
+    days = np.clip(days.astype(np.int64), -DAY_OFFSET, DAY_OFFSET - 1) + DAY_OFFSET
+    return (np.asarray(enheds_numre, dtype=np.int64) << DAY_BITS) | days
+
+
+class IntervalIndex:
+    """
+    Interval index of one panel table.
+
+    Rows are sorted by (enhedsNummer, gyldigFra) as one int64 key per row. For
+    overlapping intervals of the same company, the latest-starting one that covers
+    the date wins, also when a later-starting interval has already ended.
+
+    Args:
+        enheds_numre: enhedsNummer per row
+        valid_from, valid_to: int32 days since 1970-01-01 per row (MIN_DAY / MAX_DAY when open)
+        values: pyarrow.Table with the value columns, one row per input row
+    """
+
+    def __init__(self, enheds_numre, valid_from, valid_to, values):
+        keys = interval_keys(enheds_numre, valid_from)
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.valid_to = valid_to[order]
+        self.values = values.take(pa.array(order))
+        # Latest end of the intervals of the same company up to each row: a running max
+        # that restarts at every company (offset by the company's rank above the days)
+        company = self.keys >> DAY_BITS
+        starts = np.ones(len(company), dtype=bool)
+        starts[1:] = company[1:] != company[:-1]
+        offset = (np.cumsum(starts) - 1) << 32
+        ends = self.valid_to.astype(np.int64) - MIN_DAY + offset
+        self.reach = np.maximum.accumulate(ends) - offset + MIN_DAY if len(ends) else ends
+
+    def lookup(self, enheds_numre, days):
+        """
+        Row of the interval valid for every (enhedsNummer, day) pair.
+
+        Returns:
+            int64 positions into self.values, -1 where no interval is valid
+        """
+        enheds_numre, days = np.asarray(enheds_numre), np.asarray(days)
+        if len(self.keys) == 0:
+            return np.full(len(days), -1, dtype=np.int64)
+        positions = np.searchsorted(self.keys, interval_keys(enheds_numre, days), side="right") - 1
+        known = positions >= 0
+        positions = np.where(known, positions, 0)
+        known &= (self.keys[positions] >> DAY_BITS) == enheds_numre
+        # Some interval of the company starting on or before the day still covers it
+        covered = known & (self.reach[positions] >= days)
+        found = covered & (self.valid_to[positions] >= days)
+        # The latest interval has ended: step back to the latest one that covers the day
+        # (only for overlapping intervals; reach guarantees one within the same company)
+        pending = np.flatnonzero(covered & ~found)
+        while len(pending):
+            positions[pending] -= 1
+            hit = self.valid_to[positions[pending]] >= days[pending]
+            found[pending[hit]] = True
+            pending = pending[~hit]
+        return np.where(found, positions, -1)
+
+    def take(self, positions):
+        """Value rows for lookup() positions (nulls where -1)."""
+        return self.values.take(pa.array(positions, mask=positions < 0))
+
+
+class SnapshotEngine:
+    """
+    As-of queries over several panel tables, joined on enhedsNummer.
+
+    Args:
+        entities: DataFrame with enhedsNummer and cvrNummer of every company to snapshot
+        tables: Dictionary of table name -> (DataFrame or pyarrow.Table with enhedsNummer,
+            gyldigFra, gyldigTil and the value columns, {column: snapshot column name})
+    """
+
+    def __init__(self, entities, tables):
+        entities = entities.drop_duplicates('enhedsNummer').sort_values('enhedsNummer', ignore_index=True)
+        self.enheds_numre = entities['enhedsNummer'].to_numpy(dtype=np.int64)
+        self.cvr_numre = entities['cvrNummer'].to_numpy()
+        self.indexes = {}
+        for name, (data, columns) in tables.items():
+            table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+            table = table.filter(pc.is_valid(table['enhedsNummer']))
+            self.indexes[name] = IntervalIndex(
+                table['enhedsNummer'].to_numpy(),
+                to_days(table['gyldigFra'], MIN_DAY),
+                to_days(table['gyldigTil'], MAX_DAY),
+                table.select(list(columns)).rename_columns(list(columns.values())),
+            )
+
+    @classmethod
+    def from_panel(cls, folder, prefix, tables=SNAPSHOT_TABLES):
+        """Build the engine from {folder}/{prefix}_{table}.parquet files (companies from {prefix}_main)."""
+        main = pd.read_parquet(os.path.join(folder, f"{prefix}_main.parquet"),
+                               columns=['Vrvirksomhed_enhedsNummer', 'Vrvirksomhed_cvrNummer'])
+        entities = main.rename(columns={'Vrvirksomhed_enhedsNummer': 'enhedsNummer',
+                                        'Vrvirksomhed_cvrNummer': 'cvrNummer'}).dropna(subset=['enhedsNummer'])
+        data = {}
+        for name, columns in tables.items():
+            path = os.path.join(folder, f"{prefix}_{name}.parquet")
+            if not os.path.exists(path) or pq.read_metadata(path).num_rows == 0:
+                print(f"Skipping {name}: no rows in {path}")
+                continue
+            data[name] = (pq.read_table(path, columns=['enhedsNummer', 'gyldigFra', 'gyldigTil', *columns]), columns)
+        return cls(entities, data)
+
+    def snapshot(self, dates, enheds_numre=None):
+        """
+        State of every company on one date or a list of dates.
+
+        Args:
+            dates: ISO date string or list of them
+            enheds_numre: Optional subset of companies (default: all)
+
+        Returns:
+            DataFrame with one row per company and date: date, enhedsNummer, cvrNummer and the
+            snapshot columns of every table (null where no interval is valid on that date)
+        """
+        dates = [dates] if isinstance(dates, str) else list(dates)
+        rows = np.arange(len(self.enheds_numre))
+        if enheds_numre is not None:
+            rows = rows[np.isin(self.enheds_numre, enheds_numre)]
+
+        # All (company, date) pairs, date-major
+        days = to_days(dates, MIN_DAY)
+        pair_rows = np.tile(rows, len(days))
+        pair_enheds = self.enheds_numre[pair_rows]
+        pair_days = np.repeat(days, len(rows))
+
+        columns = {
+            'date': pa.array(np.repeat(np.array(dates, dtype="datetime64[D]"), len(rows))),
+            'enhedsNummer': pa.array(pair_enheds),
+            'cvrNummer': pa.array(self.cvr_numre[pair_rows]),
+        }
+        for index in self.indexes.values():
+            values = index.take(index.lookup(pair_enheds, pair_days))
+            for column in values.column_names:
+                columns[column] = values[column]
+        return pa.table(columns).to_pandas(date_as_object=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Point-in-time snapshots of the CVR panel tables')
+    parser.add_argument('--year', type=int, help='Panel year (virksomhed_{year}_*.parquet)')
+    parser.add_argument('--folder', default=COMPANY_DATA_FOLDER_PATH, help='Folder with the panel files')
+    parser.add_argument('--date', nargs='+', required=True, help='Snapshot date(s), YYYY-MM-DD')
+    parser.add_argument('--out', help='Write the snapshot to this parquet file (default: print the first rows)')
+    args = parser.parse_args()
+
+    prefix = f"{OUTPUT_FILENAME}_{args.year}" if args.year is not None else OUTPUT_FILENAME
+    start = time.perf_counter()
+    engine = SnapshotEngine.from_panel(args.folder, prefix)
+    print(f"Indexed {len(engine.enheds_numre)} companies in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    snapshot = engine.snapshot(args.date)
+    print(f"Snapshot of {len(snapshot)} rows in {time.perf_counter() - start:.2f}s")
+    if args.out:
+        snapshot.to_parquet(args.out, index=False)
+        print(f"Saved to {args.out}")
+    else:
+        print(snapshot.head(20).to_string(index=False))
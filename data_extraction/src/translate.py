@@ -0,0 +1,128 @@
+"""
+Danish -> English translation of the CVR tables, using the dictionaries in utils/translations.py.
+
+Column renames only touch the schema (Table.rename_columns does not copy any data).
+Values are translated on the dictionary of a dictionary-encoded column: each distinct
+value is looked up once and the row indices are kept as they are, so a status column
+with 20 million rows and 15 distinct statuses costs 15 lookups. Plain string columns
+are dictionary-encoded for the remap and decoded back to strings afterwards.
+
+Usage:
+    python translate.py virksomhed_2024_main.parquet virksomhed_2024_virksomhedsstatus.parquet --out-dir translated
+
+    translator = Translator()
+    table = translator(pq.read_table(path))
+"""
+
+import os
+import sys
+import json
+import argparse
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# Make utils/ (at the repository root) importable
+REPO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+if REPO_PATH not in sys.path:
+    sys.path.insert(0, REPO_PATH)
+
+from utils.translations import COLUMN_TRANSLATIONS, VALUE_TRANSLATIONS  # noqa: E402
+
+# Columns whose values are translated, matched on the last "_" part of the column name
+# (status matches virksomhedsstatus.status and Vrvirksomhed_virksomhedMetadata_..._status)
+VALUE_COLUMNS = {'status', 'sammensatStatus', 'branchekode', 'type', 'attributType'}
+
+
+def is_string_column(data_type):
+    if pa.types.is_dictionary(data_type):
+        data_type = data_type.value_type
+    return pa.types.is_string(data_type) or pa.types.is_large_string(data_type)
+
+
+class Translator:
+    """
+    Translates the column names and values of pyarrow Tables.
+
+    Args:
+        columns: Dictionary of column name -> translated name (default: COLUMN_TRANSLATIONS)
+        values: Dictionary of value -> translated value (default: VALUE_TRANSLATIONS)
+        value_columns: Column names (last "_" part) whose values are translated (default: VALUE_COLUMNS)
+    """
+
+    def __init__(self, columns=COLUMN_TRANSLATIONS, values=VALUE_TRANSLATIONS, value_columns=VALUE_COLUMNS):
+        self.columns = columns
+        self.values = values
+        self.value_columns = value_columns
+        self.value_set = pa.array(list(values), type=pa.string())
+
+    def __call__(self, table):
+        return self.rename(self.translate_values(table))
+
+    def rename(self, table):
+        """Rename columns; a column whose translation is already taken keeps its name."""
+        names = []
+        for name in table.column_names:
+            translated = self.columns.get(name, name)
+            names.append(translated if translated not in names and translated not in table.column_names else name)
+        renamed = table.rename_columns(names)
+
+        # Keep the pandas metadata (nullable dtypes etc.) in step with the new names
+        metadata = table.schema.metadata or {}
+        if b'pandas' in metadata:
+            pandas_metadata = json.loads(metadata[b'pandas'])
+            mapping = dict(zip(table.column_names, names))
+            for column in pandas_metadata.get('columns', []):
+                if column.get('field_name') in mapping:
+                    column['name'] = column['field_name'] = mapping[column['field_name']]
+            renamed = renamed.replace_schema_metadata({**metadata, b'pandas': json.dumps(pandas_metadata).encode()})
+        return renamed
+
+    def translate_values(self, table):
+        """Translate the values of every string column listed in value_columns."""
+        for i, field in enumerate(table.schema):
+            if field.name.rsplit('_', 1)[-1] in self.value_columns and is_string_column(field.type):
+                column = table.column(i)
+                table = table.set_column(i, field, pa.chunked_array(
+                    [self.remap(chunk) for chunk in column.chunks], type=column.type))
+        return table
+
+    def remap(self, array):
+        """Translate one string or dictionary array through its dictionary."""
+        encoded = array if pa.types.is_dictionary(array.type) else array.dictionary_encode()
+        dictionary = encoded.dictionary
+        if not pc.any(pc.is_in(dictionary.cast(pa.string()), value_set=self.value_set)).as_py():
+            return array
+        translated = pa.array([self.values.get(value, value) for value in dictionary.to_pylist()], type=dictionary.type)
+        remapped = pa.DictionaryArray.from_arrays(encoded.indices, translated)
+        return remapped if pa.types.is_dictionary(array.type) else remapped.cast(array.type)
+
+    def translate_file(self, in_path, out_path, batch_size=1_000_000):
+        """
+        Stream a parquet file through the translator, one batch at a time.
+
+        Returns:
+            Number of rows written
+        """
+        parquet_file = pq.ParquetFile(in_path)
+        schema = self(parquet_file.schema_arrow.empty_table()).schema
+        rows = 0
+        with pq.ParquetWriter(out_path, schema) as writer:
+            for batch in parquet_file.iter_batches(batch_size=batch_size):
+                writer.write_table(self(pa.Table.from_batches([batch])).cast(schema))
+                rows += batch.num_rows
+        return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Translate the column names and values of CVR parquet files to English')
+    parser.add_argument('files', nargs='+', help='Parquet files to translate')
+    parser.add_argument('--out-dir', required=True, help='Folder of the translated files (same file names)')
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    translator = Translator()
+    for path in args.files:
+        out_path = os.path.join(args.out_dir, os.path.basename(path))
+        rows = translator.translate_file(path, out_path)
+        print(f"Translated {rows} rows: {path} -> {out_path}")
@@ -1,11 +1,20 @@
 import os
+import sys
 import json
 import base64
-import logging
+import shutil
 import requests
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from functools import partial
 from dotenv import load_dotenv
-from funcy import print_durations
+from run_metrics import RunMetrics, PROFILERS
+from translate import Translator
+from cvr_index import sort_by_cvr, row_group_size
+from dataset_writer import write_partition
+from dry_run import estimate, print_estimate, write_estimate
+from schemas import SCHEMAS, panel_schema, schema_for, table_schema, conform, to_frame, records_to_frame
 
 load_dotenv()
 
@@ -18,14 +27,22 @@ OUTPUT_FILENAME = "virksomhed"
 # API ENDPOINT
 # Note: API uses HTTP (not HTTPS) as per documentation
 COMPANY_DATA_API_ENDPOINT = "http://distribution.virk.dk/cvr-permanent/virksomhed/_search"
+SCROLL_API_ENDPOINT = "http://distribution.virk.dk/_search/scroll"
 
 
-def create_main_dataframe(json_data):
+def create_main_dataframe(json_data, verbose=True, list_columns=None):
     """
     Create main company dataframe with non-temporal fields only.
     This excludes list-based temporal fields.
+
+    Args:
+        list_columns: Optional set shared by the pages of a run. Columns holding lists in this
+            page are added to it and every column in it is left out, so a field that is a list
+            anywhere in the run is not kept even in pages where it is null (PanelBuilder drops
+            it from the pages before the first list was seen)
     """
-    print("Creating main company dataframe with simple fields...")
+    if verbose:
+        print("Creating main company dataframe with simple fields...")
 
     # Extract the _source field from each record
     sources = [record.get("_source", {}) for record in json_data]
@@ -34,11 +51,11 @@ def create_main_dataframe(json_data):
     df_flat = pd.json_normalize(sources, sep='_')
 
     # Select only non-list columns (simple fields)
-    simple_cols = []
-    for col in df_flat.columns:
-        # Check if the column contains lists
-        if not df_flat[col].apply(lambda x: isinstance(x, list)).any():
-            simple_cols.append(col)
+    list_cols = {col for col in df_flat.columns if df_flat[col].apply(lambda x: isinstance(x, list)).any()}
+    if list_columns is not None:
+        list_columns.update(list_cols)
+        list_cols = list_columns
+    simple_cols = [col for col in df_flat.columns if col not in list_cols]
 
     df_main = df_flat[simple_cols].copy()
 
@@ -50,10 +67,11 @@ def create_main_dataframe(json_data):
         for col in metadata_cols:
             df_main.insert(0, col, metadata_df[col].values)
 
-    return df_main
+    return to_frame(conform(df_main, schema_for(df_main.columns)))
 
 
-def explode_temporal_field(json_data, field_name, value_cols):
+def explode_temporal_field(json_data, field_name, value_cols, verbose=True,
+                           entity='Vrvirksomhed', key='cvrNummer'):
     """
     Explode a temporal field from nested lists into panel format.
 
@@ -61,26 +79,33 @@ def explode_temporal_field(json_data, field_name, value_cols):
         json_data: List of records from API
         field_name: Name of the field in Vrvirksomhed to explode (e.g., 'navne', 'binavne')
         value_cols: List of column names to extract from each record (e.g., ['navn'])
+        entity: Document object holding the unit (Vrvirksomhed, or VrproduktionsEnhed for P-units);
+            explode_addresses, explode_branches, explode_employment and explode_livsforloeb, which the
+            P-units share, take the same entity and key arguments (explode_virksomhedsform,
+            explode_deltager_relation and explode_attributter are for companies only)
+        key: Unit number field, written as the first column (cvrNummer, or pNummer for P-units)
 
     Returns:
-        DataFrame with one row per temporal record
+        DataFrame with one row per temporal record, with the columns and dtypes of
+        its table in the schema registry (schemas.panel_schema)
     """
-    print(f"Exploding temporal field: {field_name}...")
+    if verbose:
+        print(f"Exploding temporal field: {field_name}...")
 
     records = []
 
     for record in json_data:
         source = record.get("_source", {})
-        vrvirksomhed = source.get("Vrvirksomhed", {})
+        unit = source.get(entity, {})
 
-        cvr_nummer = vrvirksomhed.get('cvrNummer')
-        enheds_nummer = vrvirksomhed.get('enhedsNummer')
-        temporal_data = vrvirksomhed.get(field_name, [])
+        unit_nummer = unit.get(key)
+        enheds_nummer = unit.get('enhedsNummer')
+        temporal_data = unit.get(field_name, [])
 
         if isinstance(temporal_data, list) and len(temporal_data) > 0:
             for item in temporal_data:
                 record_data = {
-                    'cvrNummer': cvr_nummer,
+                    key: unit_nummer,
                     'enhedsNummer': enheds_nummer
                 }
 
@@ -96,24 +121,26 @@ def explode_temporal_field(json_data, field_name, value_cols):
 
                 records.append(record_data)
 
-    return pd.DataFrame(records)
+    return records_to_frame(records, panel_schema(field_name, key))
 
 
-def explode_addresses(json_data, address_field='beliggenhedsadresse'):
+def explode_addresses(json_data, address_field='beliggenhedsadresse', verbose=True,
+                      entity='Vrvirksomhed', key='cvrNummer'):
     """
     Explode address fields (beliggenhedsadresse or postadresse) which have a more complex structure.
     """
-    print(f"Exploding {address_field}...")
+    if verbose:
+        print(f"Exploding {address_field}...")
 
     records = []
 
     for record in json_data:
         source = record.get("_source", {})
-        vrvirksomhed = source.get("Vrvirksomhed", {})
+        unit = source.get(entity, {})
 
-        cvr_nummer = vrvirksomhed.get('cvrNummer')
-        enheds_nummer = vrvirksomhed.get('enhedsNummer')
-        addresses = vrvirksomhed.get(address_field, [])
+        unit_nummer = unit.get(key)
+        enheds_nummer = unit.get('enhedsNummer')
+        addresses = unit.get(address_field, [])
 
         if isinstance(addresses, list) and len(addresses) > 0:
             for addr in addresses:
@@ -131,7 +158,7 @@ def explode_addresses(json_data, address_field='beliggenhedsadresse'):
                     kommune_periode_til = None
 
                 addr_record = {
-                    'cvrNummer': cvr_nummer,
+                    key: unit_nummer,
                     'enhedsNummer': enheds_nummer,
                     'landekode': addr.get('landekode'),
                     'fritekst': addr.get('fritekst'),
@@ -158,29 +185,31 @@ def explode_addresses(json_data, address_field='beliggenhedsadresse'):
                 }
                 records.append(addr_record)
 
-    return pd.DataFrame(records)
+    return records_to_frame(records, panel_schema(address_field, key))
 
 
-def explode_branches(json_data, branch_field):
+def explode_branches(json_data, branch_field, verbose=True,
+                     entity='Vrvirksomhed', key='cvrNummer'):
     """
     Explode branch (branche) fields: hovedbranche, bibranche1, bibranche2, bibranche3.
     """
-    print(f"Exploding {branch_field}...")
+    if verbose:
+        print(f"Exploding {branch_field}...")
 
     records = []
 
     for record in json_data:
         source = record.get("_source", {})
-        vrvirksomhed = source.get("Vrvirksomhed", {})
+        unit = source.get(entity, {})
 
-        cvr_nummer = vrvirksomhed.get('cvrNummer')
-        enheds_nummer = vrvirksomhed.get('enhedsNummer')
-        branches = vrvirksomhed.get(branch_field, [])
+        unit_nummer = unit.get(key)
+        enheds_nummer = unit.get('enhedsNummer')
+        branches = unit.get(branch_field, [])
 
         if isinstance(branches, list) and len(branches) > 0:
             for branch in branches:
                 branch_record = {
-                    'cvrNummer': cvr_nummer,
+                    key: unit_nummer,
                     'enhedsNummer': enheds_nummer,
                     'branchekode': branch.get('branchekode'),
                     'branchetekst': branch.get('branchetekst'),
@@ -190,29 +219,31 @@ def explode_branches(json_data, branch_field):
                 }
                 records.append(branch_record)
 
-    return pd.DataFrame(records)
+    return records_to_frame(records, panel_schema(branch_field, key))
 
 
-def explode_employment(json_data, employment_field):
+def explode_employment(json_data, employment_field, verbose=True,
+                       entity='Vrvirksomhed', key='cvrNummer'):
     """
     Explode employment (beskaeftigelse) fields: aarsbeskaeftigelse, kvartalsbeskaeftigelse, maanedsbeskaeftigelse.
     """
-    print(f"Exploding {employment_field}...")
+    if verbose:
+        print(f"Exploding {employment_field}...")
 
     records = []
 
     for record in json_data:
         source = record.get("_source", {})
-        vrvirksomhed = source.get("Vrvirksomhed", {})
+        unit = source.get(entity, {})
 
-        cvr_nummer = vrvirksomhed.get('cvrNummer')
-        enheds_nummer = vrvirksomhed.get('enhedsNummer')
-        employment_data = vrvirksomhed.get(employment_field, [])
+        unit_nummer = unit.get(key)
+        enheds_nummer = unit.get('enhedsNummer')
+        employment_data = unit.get(employment_field, [])
 
         if isinstance(employment_data, list) and len(employment_data) > 0:
             for emp in employment_data:
                 emp_record = {
-                    'cvrNummer': cvr_nummer,
+                    key: unit_nummer,
                     'enhedsNummer': enheds_nummer,
                     'aar': emp.get('aar'),
                     'kvartal': emp.get('kvartal'),
@@ -227,14 +258,15 @@ def explode_employment(json_data, employment_field):
                 }
                 records.append(emp_record)
 
-    return pd.DataFrame(records)
+    return records_to_frame(records, panel_schema(employment_field, key))
 
 
-def explode_virksomhedsform(json_data):
+def explode_virksomhedsform(json_data, verbose=True):
     """
     Explode the virksomhedsform (company legal form) field.
     """
-    print("Exploding virksomhedsform...")
+    if verbose:
+        print("Exploding virksomhedsform...")
 
     records = []
 
@@ -260,29 +292,31 @@ def explode_virksomhedsform(json_data):
                 }
                 records.append(form_record)
 
-    return pd.DataFrame(records)
+    return records_to_frame(records, panel_schema('virksomhedsform'))
 
 
-def explode_livsforloeb(json_data):
+def explode_livsforloeb(json_data, verbose=True,
+                        entity='Vrvirksomhed', key='cvrNummer'):
     """
     Explode the livsforloeb (lifecycle) field which tracks company start/end dates.
     """
-    print("Exploding livsforloeb...")
+    if verbose:
+        print("Exploding livsforloeb...")
 
     records = []
 
     for record in json_data:
         source = record.get("_source", {})
-        vrvirksomhed = source.get("Vrvirksomhed", {})
+        unit = source.get(entity, {})
 
-        cvr_nummer = vrvirksomhed.get('cvrNummer')
-        enheds_nummer = vrvirksomhed.get('enhedsNummer')
-        lifecycle = vrvirksomhed.get('livsforloeb', [])
+        unit_nummer = unit.get(key)
+        enheds_nummer = unit.get('enhedsNummer')
+        lifecycle = unit.get('livsforloeb', [])
 
         if isinstance(lifecycle, list) and len(lifecycle) > 0:
             for period in lifecycle:
                 period_record = {
-                    'cvrNummer': cvr_nummer,
+                    key: unit_nummer,
                     'enhedsNummer': enheds_nummer,
                     'gyldigFra': period.get('periode', {}).get('gyldigFra'),
                     'gyldigTil': period.get('periode', {}).get('gyldigTil'),
@@ -290,15 +324,16 @@ def explode_livsforloeb(json_data):
                 }
                 records.append(period_record)
 
-    return pd.DataFrame(records)
+    return records_to_frame(records, panel_schema('livsforloeb', key))
 
 
-def explode_deltager_relation(json_data):
+def explode_deltager_relation(json_data, verbose=True):
     """
     Explode the deltagerRelation (participant relations) field.
     This is a complex nested structure containing relations to owners, board members, etc.
     """
-    print("Exploding deltagerRelation...")
+    if verbose:
+        print("Exploding deltagerRelation...")
 
     records = []
 
@@ -370,15 +405,103 @@ def explode_deltager_relation(json_data):
                         }
                         records.append(rel_record)
 
-    return pd.DataFrame(records)
+    return records_to_frame(records, panel_schema('deltagerRelation'))
 
 
-def explode_attributter(json_data):
+class DeltagerRelationNormalizer:
+    """
+    Normalized alternative to explode_deltager_relation, built in one pass over each page.
+
+    Instead of repeating the participant and organisation on every attribute row, it
+    produces three tables linked by int32 keys:
+
+    - deltagerRelation_deltager: participant dimension (deltagerKey, deltagerEnhedsNummer,
+      deltagerEnhedstype, deltagerForretningsnoegle), one row per distinct participant
+    - deltagerRelation_organisation: one row per company x participant x organisation
+      (organisationKey, cvrNummer, enhedsNummer, deltagerKey, organisationHovedtype,
+      organisationNavn, gyldigFra, gyldigTil, sidstOpdateret)
+    - deltagerRelation_attribut: slim fact table of the medlemsData attributes
+      (organisationKey, attributType, attributVapitype, attributSekvensnr, attributVaerdi,
+      gyldigFra, gyldigTil, sidstOpdateret)
+
+    Keys are assigned across pages, so one instance must see every page of a run.
+    Call it like an explode function; participant_table() returns the dimension at the end.
+    """
+
+    def __init__(self):
+        self.participants = {}
+        self.next_organisation_key = 0
+
+    def __call__(self, json_data, verbose=True):
+        if verbose:
+            print("Normalizing deltagerRelation...")
+
+        organisations = []
+        attributes = []
+
+        for record in json_data:
+            source = record.get("_source", {})
+            vrvirksomhed = source.get("Vrvirksomhed", {})
+
+            cvr_nummer = vrvirksomhed.get('cvrNummer')
+            enheds_nummer = vrvirksomhed.get('enhedsNummer')
+            relations = vrvirksomhed.get('deltagerRelation', [])
+
+            if isinstance(relations, list) and len(relations) > 0:
+                for rel in relations:
+                    deltager = rel.get('deltager') or {}
+                    participant = (deltager.get('enhedsNummer'), deltager.get('enhedstype'),
+                                   deltager.get('forretningsnoegle'))
+                    deltager_key = self.participants.setdefault(participant, len(self.participants))
+
+                    for org in rel.get('organisationer', []):
+                        organisation_key = self.next_organisation_key
+                        self.next_organisation_key += 1
+                        org_navne = org.get('organisationsNavn', [])
+                        organisations.append({
+                            'organisationKey': organisation_key,
+                            'cvrNummer': cvr_nummer,
+                            'enhedsNummer': enheds_nummer,
+                            'deltagerKey': deltager_key,
+                            'organisationHovedtype': org.get('hovedtype'),
+                            'organisationNavn': org_navne[0].get('navn') if org_navne else None,
+                            'gyldigFra': (org.get('periode') or {}).get('gyldigFra'),
+                            'gyldigTil': (org.get('periode') or {}).get('gyldigTil'),
+                            'sidstOpdateret': org.get('sidstOpdateret')
+                        })
+
+                        for medlem in org.get('medlemsData', []):
+                            for attr in medlem.get('attributter', []):
+                                attributes.append({
+                                    'organisationKey': organisation_key,
+                                    'attributType': attr.get('type'),
+                                    'attributVapitype': attr.get('vapitype'),
+                                    'attributSekvensnr': attr.get('sekvensnr'),
+                                    'attributVaerdi': attr.get('vaerdier', [{}])[0].get('vaerdi') if attr.get('vaerdier') else None,
+                                    'gyldigFra': attr.get('periode', {}).get('gyldigFra'),
+                                    'gyldigTil': attr.get('periode', {}).get('gyldigTil'),
+                                    'sidstOpdateret': attr.get('sidstOpdateret')
+                                })
+
+        return {'deltagerRelation_organisation':
+                records_to_frame(organisations, SCHEMAS['deltagerRelation_organisation']),
+                'deltagerRelation_attribut': records_to_frame(attributes, SCHEMAS['deltagerRelation_attribut'])}
+
+    def participant_table(self):
+        """Participant dimension for every participant seen so far."""
+        schema = SCHEMAS['deltagerRelation_deltager']
+        records = [dict(zip(schema.names, (deltager_key, *participant)))
+                   for participant, deltager_key in self.participants.items()]
+        return records_to_frame(records, schema)
+
+
+def explode_attributter(json_data, verbose=True):
     """
     Explode the attributter (company attributes) field.
     Contains capital, purpose, accounting period, etc.
     """
-    print("Exploding attributter...")
+    if verbose:
+        print("Exploding attributter...")
 
     records = []
 
@@ -424,7 +547,7 @@ def explode_attributter(json_data):
                     }
                     records.append(attr_record)
 
-    return pd.DataFrame(records)
+    return records_to_frame(records, panel_schema('attributter'))
 
 
 def flatten_permanent_data_wide(json_data):
@@ -461,24 +584,302 @@ def flatten_permanent_data_wide(json_data):
     else:
         df_combined = df_flattened
 
-    return df_combined
+    return to_frame(conform(df_combined, schema_for(df_combined.columns)))
+
+
+def hits_to_nested_table(hits):
+    """
+    Convert a page of hits into an Arrow table that keeps the nested structure.
+
+    Every Vrvirksomhed field becomes a column named like its wide counterpart
+    (Vrvirksomhed_navne, ...): history lists are native list<struct<...>> columns and
+    objects are struct columns, instead of JSON strings.
+
+    Returns:
+        pyarrow.Table with one row per hit
+    """
+    records = []
+    for hit in hits:
+        record = {key: value for key, value in hit.items() if key.startswith('_') and key != '_source'}
+        for key, value in hit.get("_source", {}).items():
+            if isinstance(value, dict):
+                for field, field_value in value.items():
+                    # Parquet cannot store structs without fields
+                    record[f"{key}_{field}"] = None if field_value == {} else field_value
+            else:
+                record[key] = value
+        records.append(record)
+    return pa.Table.from_pylist(records)
+
+
+def combine_nested_tables(tables):
+    """
+    Concatenate per-page nested tables.
+
+    Types are inferred per page, so a page may lack a struct field or have an
+    all-null list; permissive promotion merges them into one schema.
+    """
+    if not tables:
+        return pa.table({})
+    return pa.concat_tables(tables, promote_options="permissive")
+
+
+# Panel tables: output name -> explode function taking the list of hits
+PANEL_TABLES = {
+    'main': create_main_dataframe,
+    'navne': partial(explode_temporal_field, field_name='navne', value_cols=['navn']),
+    'binavne': partial(explode_temporal_field, field_name='binavne', value_cols=['navn']),
+    'beliggenhedsadresse': partial(explode_addresses, address_field='beliggenhedsadresse'),
+    'postadresse': partial(explode_addresses, address_field='postadresse'),
+    'hovedbranche': partial(explode_branches, branch_field='hovedbranche'),
+    'bibranche1': partial(explode_branches, branch_field='bibranche1'),
+    'bibranche2': partial(explode_branches, branch_field='bibranche2'),
+    'bibranche3': partial(explode_branches, branch_field='bibranche3'),
+    'aarsbeskaeftigelse': partial(explode_employment, employment_field='aarsbeskaeftigelse'),
+    'kvartalsbeskaeftigelse': partial(explode_employment, employment_field='kvartalsbeskaeftigelse'),
+    'maanedsbeskaeftigelse': partial(explode_employment, employment_field='maanedsbeskaeftigelse'),
+    'virksomhedsstatus': partial(explode_temporal_field, field_name='virksomhedsstatus', value_cols=['status']),
+    # Contact information
+    'telefonNummer': partial(explode_temporal_field, field_name='telefonNummer', value_cols=['kontaktoplysning']),
+    'telefaxNummer': partial(explode_temporal_field, field_name='telefaxNummer', value_cols=['kontaktoplysning']),
+    'elektroniskPost': partial(explode_temporal_field, field_name='elektroniskPost', value_cols=['kontaktoplysning']),
+    'hjemmeside': partial(explode_temporal_field, field_name='hjemmeside', value_cols=['kontaktoplysning']),
+    # Company form and registration
+    'virksomhedsform': explode_virksomhedsform,
+    'regNummer': partial(explode_temporal_field, field_name='regNummer', value_cols=['regnummer']),
+    'livsforloeb': explode_livsforloeb,
+    # Complex nested fields
+    'deltagerRelation': explode_deltager_relation,
+    'attributter': explode_attributter,
+}
+
+
+def assemble_parts(part_paths, file_path, transform=None):
+    """
+    Stream parquet part files into a single parquet file, one part at a time.
+
+    Parts written from different pages can disagree on column types (a column that
+    is all null in one part), so the schemas are unified first and every part is
+    cast to the unified schema.
+
+    Args:
+        transform: Optional function applied to every part table before it is written
+            (e.g. a Translator); it must map equal schemas to equal schemas
+
+    Returns:
+        Number of rows written
+    """
+    schema = pa.unify_schemas([pq.read_schema(path) for path in part_paths],
+                              promote_options="permissive").remove_metadata()
+    out_schema = transform(schema.empty_table()).schema if transform else schema
+    rows = 0
+    with pq.ParquetWriter(file_path, out_schema) as writer:
+        for path in part_paths:
+            table = pq.read_table(path).replace_schema_metadata(None)
+            for field in schema:
+                if field.name not in table.column_names:
+                    table = table.append_column(field.name, pa.nulls(len(table), field.type))
+            table = table.select(schema.names).cast(schema)
+            table = transform(table) if transform else table
+            writer.write_table(table, row_group_size=row_group_size(table))
+            rows += len(table)
+    return rows
+
+
+class PanelBuilder:
+    """
+    Explodes scroll pages into the panel tables and collects the per-page tables.
+
+    Tables are given as a dictionary of name -> explode function (default: PANEL_TABLES).
+    An explode function may also return a dictionary of sub-table name -> DataFrame,
+    for tables built together in one pass.
+
+    Every page is kept as a pyarrow Table conformed to the table's registered schema
+    (see schemas.table_schema; key is the unit number column), so the pages concatenate
+    without casts and empty tables are written with their columns.
+
+    The list fields left out of the main table (create_main_dataframe) are collected over
+    all pages, and a field found to be a list in a later page is dropped from the earlier
+    pages and spilled parts too, so the main columns do not depend on where pages split.
+
+    With a memory budget (MB), the in-memory tables of all tables are tracked and,
+    once they exceed the budget, the largest tables are spilled to parquet part
+    files ({base_path}_{table}_parts/) until half the budget is free again.
+    finish() streams the parts of spilled tables into the final file.
+
+    Tables are written sorted by CVR number in small row groups (about 1 MB, see
+    cvr_index.row_group_size); a spilled table is sorted within each part.
+
+    An optional translator (see translate.Translator) is applied to every table as
+    it is written; spilled parts stay untranslated and are translated part by part.
+    """
+
+    def __init__(self, base_path, metrics, memory_budget=None, tables=None, translator=None,
+                 key='cvrNummer'):
+        self.base_path = base_path
+        self.key = key
+        self.metrics = metrics
+        self.translator = translator
+        self.budget = memory_budget * 1024 * 1024 if memory_budget else None
+        self.list_columns = set()
+        self.main_tables = set()
+        self.tables = {}
+        for name, explode in (tables or PANEL_TABLES).items():
+            if explode is create_main_dataframe:
+                self.main_tables.add(name)
+                explode = partial(explode, list_columns=self.list_columns)
+            self.tables[name] = explode
+        self.frames = {}
+        self.schemas = {}
+        self.nbytes = {}
+        self.parts = {}
+
+    def add_page(self, hits):
+        for name, explode in self.tables.items():
+            with self.metrics.stage(f"explode/{name}") as stage:
+                result = explode(hits, verbose=False)
+                frames = result if isinstance(result, dict) else {name: result}
+                stage["rows"] = sum(len(df) for df in frames.values())
+            for table_name, df in frames.items():
+                self.add_frame(table_name, df)
+
+        if self.budget and sum(self.nbytes.values()) > self.budget:
+            for name in sorted(self.nbytes, key=self.nbytes.get, reverse=True):
+                if sum(self.nbytes.values()) <= self.budget / 2:
+                    break
+                self.spill(name)
+
+    def add_frame(self, name, df):
+        """Add rows to a table (tables without any rows are still written, empty)."""
+        table = conform(df, table_schema(name, df.columns, self.key))
+        self.frames.setdefault(name, [])
+        self.schemas.setdefault(name, table.schema)
+        self.nbytes.setdefault(name, 0)
+        self.parts.setdefault(name, [])
+        if len(table):
+            self.frames[name].append(table)
+            self.nbytes[name] += table.nbytes
+
+    def concat(self, name):
+        """
+        Concatenate the in-memory tables of a table, sorted by CVR number.
+
+        Pages of an open table (main) may lack columns, which are filled with nulls.
+        """
+        tables = self.frames[name] or [self.schemas[name].empty_table()]
+        return self.drop_list_columns(name, sort_by_cvr(pa.concat_tables(tables, promote_options="default")))
+
+    def drop_list_columns(self, name, table):
+        """Drop the columns of a main table that held lists in any page so far."""
+        if name not in self.main_tables:
+            return table
+        return table.drop_columns([column for column in table.column_names if column in self.list_columns])
+
+    def spill(self, name):
+        """Write the in-memory frames of a table to a new part file."""
+        if not self.frames[name]:
+            return
+        parts_dir = f"{self.base_path}_{name}_parts"
+        if not self.parts[name]:
+            # Parts left by an earlier run that failed
+            shutil.rmtree(parts_dir, ignore_errors=True)
+        os.makedirs(parts_dir, exist_ok=True)
+        part_path = os.path.join(parts_dir, f"part-{len(self.parts[name]):05d}.parquet")
+        table = self.concat(name)
+        self.frames[name] = []
+        self.nbytes[name] = 0
+        with self.metrics.stage(f"spill/{name}", rows=len(table)) as stage:
+            pq.write_table(table, part_path)
+            stage["bytes"] = os.path.getsize(part_path)
+        self.parts[name].append(part_path)
+
+    def discard(self):
+        """Drop the rows held and remove the part files of spilled tables (after a failed download)."""
+        for name, parts in self.parts.items():
+            if parts:
+                shutil.rmtree(f"{self.base_path}_{name}_parts", ignore_errors=True)
+        self.frames, self.nbytes, self.parts = {}, {}, {}
+
+    def finish(self, write=True):
+        """
+        Concatenate (and optionally write) every table.
+
+        Args:
+            write: Write {base_path}_{table}.parquet for every table
+
+        Returns:
+            Dictionary of table name -> DataFrame, or table name -> parquet path when a
+            memory budget is set (tables are then not loaded back into memory)
+        """
+        tables = {}
+        for name in list(self.parts):
+            file_path = f"{self.base_path}_{name}.parquet"
+            if self.parts[name]:
+                self.spill(name)
+                with self.metrics.stage(f"write/{name}") as stage:
+                    def transform(table, name=name):
+                        table = self.drop_list_columns(name, table)
+                        return self.translator(table) if self.translator is not None else table
+                    stage["rows"] = assemble_parts(self.parts[name], file_path, transform=transform)
+                    stage["bytes"] = os.path.getsize(file_path)
+                shutil.rmtree(f"{self.base_path}_{name}_parts")
+                tables[name] = file_path
+                continue
+
+            table = self.concat(name)
+            del self.frames[name]
+            if write:
+                with self.metrics.stage(f"write/{name}", rows=len(table)) as stage:
+                    if self.translator is not None:
+                        table = self.translator(table)
+                    pq.write_table(table, file_path, row_group_size=row_group_size(table))
+                    stage["bytes"] = os.path.getsize(file_path)
+            tables[name] = file_path if self.budget and write else to_frame(table)
+        return tables
 
 
-@print_durations()
 def main(virk_username=VIRK_USERNAME,
          virk_password=VIRK_PASSWORD,
          company_data_api_endpoint=COMPANY_DATA_API_ENDPOINT,
+         scroll_api_endpoint=SCROLL_API_ENDPOINT,
          company_data_folder_path=COMPANY_DATA_FOLDER_PATH,
          output_filename=OUTPUT_FILENAME,
          size=3000,
          year=None,
          save_format="parquet",
-         output_mode="panel"):
+         output_mode="panel",
+         metrics_path=None,
+         prometheus_path=None,
+         profile=None,
+         profile_dir=None,
+         memory_budget=None,
+         normalize_relations=False,
+         translate=False,
+         dataset_root=None,
+         dry_run=False):
     """
     Download CVR permanent data from Virk API.
 
+    Returns None, without writing any output or run report, if a request fails (also in the
+    middle of the scroll).
+
     Args:
         output_mode: "panel" for multiple dataframes (recommended), "wide" for single wide dataframe
+            with JSON strings, "nested" for a single file with native Arrow list/struct columns
+        memory_budget: Panel mode only: MB of exploded rows to hold in memory before the largest
+            tables are spilled to parquet part files. main() then returns file paths instead of DataFrames
+        normalize_relations: Panel mode only: replace deltagerRelation with the normalized
+            deltagerRelation_deltager / _organisation / _attribut tables (see DeltagerRelationNormalizer)
+        translate: Panel mode only: write the tables with English column names and values
+            (utils/translations.py, see translate.Translator)
+        dataset_root: Also write the parquet outputs into this hive-partitioned dataset as
+            virksomhed_{table}/year={year} (see dataset_writer.py; requires a year)
+        dry_run: Only estimate the documents, transfer, rows per table, peak memory and wall time
+            of the run from a few sample pages (see dry_run.py); returns the estimate
+        metrics_path: Path of the JSON run report (default: {output_filename}_run_report.json in the output folder)
+        prometheus_path: Optional path of a Prometheus textfile with the run metrics
+        profile: None, "cprofile" or "pyinstrument" to profile every stage
+        profile_dir: Folder for the per-stage profiles (default: the output folder)
     """
 
     # Use a scroll with a reasonable keep-alive; can be tuned if needed
@@ -529,9 +930,31 @@ def main(virk_username=VIRK_USERNAME,
         }
         print("Retrieving all CVR permanent data...")
 
+    if dry_run:
+        if output_mode == "panel":
+            explode_tables = {name: partial(explode, verbose=False) for name, explode in PANEL_TABLES.items()}
+            if normalize_relations:
+                explode_tables['deltagerRelation'] = partial(DeltagerRelationNormalizer(), verbose=False)
+        elif output_mode == "nested":
+            explode_tables = {'nested': hits_to_nested_table}
+        else:
+            explode_tables = {'wide': flatten_permanent_data_wide}
+        parquet_panel = output_mode == "panel" and save_format.lower() == "parquet"
+        report = estimate(company_data_api_endpoint, scroll_api_endpoint, query, headers, explode_tables, size,
+                          memory_budget=memory_budget if parquet_panel else None,
+                          keep_raw=output_mode == "wide" or save_format.lower() != "parquet")
+        print_estimate(report)
+        write_estimate(report, os.path.join(company_data_folder_path, f"{output_filename}_dry_run.json"))
+        return report
+
+    metrics = RunMetrics(output_filename, profile=profile, profile_dir=profile_dir or company_data_folder_path,
+                         params={"year": year, "size": size, "output_mode": output_mode, "save_format": save_format})
+
     # Initial request with timeout handling
     try:
-        response = requests.post(url, json=query, headers=headers, timeout=(timeout_connect, timeout_read))
+        with metrics.stage("request") as stage:
+            response = requests.post(url, json=query, headers=headers, timeout=(timeout_connect, timeout_read))
+            stage["bytes"] = len(response.content)
     except requests.exceptions.Timeout:
         print("Request timed out. The server may be slow or unresponsive.")
         return None
@@ -546,7 +969,9 @@ def main(virk_username=VIRK_USERNAME,
     else:
         print("Starting data retrieval...")
 
-    response_data = response.json()
+    with metrics.stage("decode") as stage:
+        response_data = response.json()
+        stage["rows"] = len(response_data.get("hits", {}).get("hits", []))
 
     # Scroll to get all data
     if '_scroll_id' not in response_data:
@@ -555,7 +980,47 @@ def main(virk_username=VIRK_USERNAME,
 
     scroll_id = response_data['_scroll_id']
     hits = response_data['hits']['hits']
-    all_results = hits
+
+    # Panel tables are exploded page by page; the raw hits are only kept for the wide and JSON outputs
+    write_parquet = save_format.lower() == "parquet"
+    keep_raw = output_mode == "wide" or not write_parquet
+    panel = None
+    if output_mode == "panel":
+        if memory_budget and not write_parquet:
+            print("The memory budget only applies to parquet output; ignoring it.")
+            memory_budget = None
+        panel_tables = PANEL_TABLES
+        if normalize_relations:
+            relation_normalizer = DeltagerRelationNormalizer()
+            panel_tables = {name: relation_normalizer if name == 'deltagerRelation' else explode
+                            for name, explode in PANEL_TABLES.items()}
+        panel = PanelBuilder(os.path.join(company_data_folder_path, output_filename), metrics, memory_budget,
+                             tables=panel_tables, translator=Translator() if translate else None)
+    all_results = []
+    nested_pages = []
+    n_retrieved = 0
+
+    if dataset_root and (year is None or not write_parquet):
+        print("Publishing to the dataset needs a year and parquet output; skipping it.")
+        dataset_root = None
+
+    def publish(file_path, table):
+        """Write an output file into the hive-partitioned dataset."""
+        with metrics.stage(f"publish/{table}") as stage:
+            stage["rows"] = write_partition(file_path, dataset_root, f"{OUTPUT_FILENAME}_{table}", year)
+
+    def process_page(page_hits):
+        nonlocal n_retrieved
+        n_retrieved += len(page_hits)
+        if panel is not None:
+            panel.add_page(page_hits)
+        elif output_mode == "nested" and write_parquet:
+            with metrics.stage("explode/nested", rows=len(page_hits)):
+                nested_pages.append(hits_to_nested_table(page_hits))
+        if keep_raw:
+            all_results.extend(page_hits)
+
+    process_page(hits)
 
     # Log total hits if provided (can be "value" or dict depending on ES version)
     total_hits = response_data.get("hits", {}).get("total")
@@ -566,9 +1031,10 @@ def main(virk_username=VIRK_USERNAME,
     if total_hits_value is not None:
         print(f"Total hits reported by server: {total_hits_value}")
 
+    scroll_failed = False
     try:
         while len(hits) > 0:
-            scroll_url = "http://distribution.virk.dk/_search/scroll"
+            scroll_url = scroll_api_endpoint
             scroll_query = {
                 "scroll": scroll_keepalive,
                 "scroll_id": scroll_id
@@ -581,12 +1047,14 @@ def main(virk_username=VIRK_USERNAME,
             
             while retry_count < max_retries:
                 try:
-                    scroll_response = requests.post(
-                        scroll_url, 
-                        json=scroll_query, 
-                        headers=headers,
-                        timeout=(timeout_connect, timeout_read)
-                    )
+                    with metrics.stage("request") as stage:
+                        scroll_response = requests.post(
+                            scroll_url,
+                            json=scroll_query,
+                            headers=headers,
+                            timeout=(timeout_connect, timeout_read)
+                        )
+                        stage["bytes"] = len(scroll_response.content)
                     break  # Success, exit retry loop
                 except requests.exceptions.Timeout:
                     retry_count += 1
@@ -604,28 +1072,32 @@ def main(virk_username=VIRK_USERNAME,
                         break
             
             if scroll_response is None or scroll_response.status_code != 200:
-                if scroll_response:
+                if scroll_response is not None:
                     print(f"Scroll request failed with status code: {scroll_response.status_code}")
                     print(scroll_response.text)
+                scroll_failed = True
                 break
 
-            scroll_data = scroll_response.json()
+            with metrics.stage("decode") as stage:
+                scroll_data = scroll_response.json()
+                stage["rows"] = len(scroll_data.get("hits", {}).get("hits", []))
 
             if '_scroll_id' not in scroll_data:
                 print("No scroll ID found in the scroll response.")
+                scroll_failed = True
                 break
 
             scroll_id = scroll_data['_scroll_id']
             hits = scroll_data['hits']['hits']
-            all_results.extend(hits)
+            process_page(hits)
 
             # Print progress
-            print(f"Retrieved {len(all_results)} records so far...")
+            print(f"Retrieved {n_retrieved} records so far...")
     finally:
         # Best-effort scroll cleanup to release server-side resources
         if scroll_id is not None:
             try:
-                cleanup_url = "http://distribution.virk.dk/_search/scroll"
+                cleanup_url = scroll_api_endpoint
                 cleanup_body = {"scroll_id": [scroll_id]}
                 cleanup_response = requests.delete(
                     cleanup_url, 
@@ -638,127 +1110,66 @@ def main(virk_username=VIRK_USERNAME,
             except Exception as e:
                 print(f"Exception during scroll cleanup: {e}")
 
-    print(f"API call completed. Total records retrieved: {len(all_results)}")
+    if scroll_failed:
+        # A partial pull must not pass for a complete one: no output files and no run report
+        print(f"Scroll stopped after {n_retrieved} records; nothing was saved.")
+        if panel is not None:
+            panel.discard()
+        return None
+
+    print(f"API call completed. Total records retrieved: {n_retrieved}")
+
+    if metrics_path is None:
+        metrics_path = os.path.join(company_data_folder_path, f"{output_filename}_run_report.json")
 
     # Process data based on output mode
     if output_mode == "panel":
-        print("\nCreating multiple panel dataframes...")
-
-        # Create main dataframe
-        df_main = create_main_dataframe(all_results)
-        print(f"Main dataframe shape: {df_main.shape}")
-
-        # Create panel dataframes for temporal fields
-        df_navne = explode_temporal_field(all_results, 'navne', ['navn'])
-        df_binavne = explode_temporal_field(all_results, 'binavne', ['navn'])
-        df_beliggenhedsadresse = explode_addresses(all_results, 'beliggenhedsadresse')
-        df_postadresse = explode_addresses(all_results, 'postadresse')
-        df_hovedbranche = explode_branches(all_results, 'hovedbranche')
-        df_bibranche1 = explode_branches(all_results, 'bibranche1')
-        df_bibranche2 = explode_branches(all_results, 'bibranche2')
-        df_bibranche3 = explode_branches(all_results, 'bibranche3')
-        df_aarsbeskaeftigelse = explode_employment(all_results, 'aarsbeskaeftigelse')
-        df_kvartalsbeskaeftigelse = explode_employment(all_results, 'kvartalsbeskaeftigelse')
-        df_maanedsbeskaeftigelse = explode_employment(all_results, 'maanedsbeskaeftigelse')
-        df_virksomhedsstatus = explode_temporal_field(all_results, 'virksomhedsstatus', ['status'])
-
-        # Contact information
-        df_telefonNummer = explode_temporal_field(all_results, 'telefonNummer', ['kontaktoplysning'])
-        df_telefaxNummer = explode_temporal_field(all_results, 'telefaxNummer', ['kontaktoplysning'])
-        df_elektroniskPost = explode_temporal_field(all_results, 'elektroniskPost', ['kontaktoplysning'])
-        df_hjemmeside = explode_temporal_field(all_results, 'hjemmeside', ['kontaktoplysning'])
-
-        # Company form and registration
-        df_virksomhedsform = explode_virksomhedsform(all_results)
-        df_regNummer = explode_temporal_field(all_results, 'regNummer', ['regnummer'])
-        df_livsforloeb = explode_livsforloeb(all_results)
-
-        # Complex nested fields
-        df_deltagerRelation = explode_deltager_relation(all_results)
-        df_attributter = explode_attributter(all_results)
-
-        # Save all dataframes
-        if save_format.lower() == "parquet":
-            base_path = os.path.join(company_data_folder_path, output_filename)
-
-            df_main.to_parquet(f"{base_path}_main.parquet", index=False)
-            df_navne.to_parquet(f"{base_path}_navne.parquet", index=False)
-            df_binavne.to_parquet(f"{base_path}_binavne.parquet", index=False)
-            df_beliggenhedsadresse.to_parquet(f"{base_path}_beliggenhedsadresse.parquet", index=False)
-            df_postadresse.to_parquet(f"{base_path}_postadresse.parquet", index=False)
-            df_hovedbranche.to_parquet(f"{base_path}_hovedbranche.parquet", index=False)
-            df_bibranche1.to_parquet(f"{base_path}_bibranche1.parquet", index=False)
-            df_bibranche2.to_parquet(f"{base_path}_bibranche2.parquet", index=False)
-            df_bibranche3.to_parquet(f"{base_path}_bibranche3.parquet", index=False)
-            df_aarsbeskaeftigelse.to_parquet(f"{base_path}_aarsbeskaeftigelse.parquet", index=False)
-            df_kvartalsbeskaeftigelse.to_parquet(f"{base_path}_kvartalsbeskaeftigelse.parquet", index=False)
-            df_maanedsbeskaeftigelse.to_parquet(f"{base_path}_maanedsbeskaeftigelse.parquet", index=False)
-            df_virksomhedsstatus.to_parquet(f"{base_path}_virksomhedsstatus.parquet", index=False)
-            df_telefonNummer.to_parquet(f"{base_path}_telefonNummer.parquet", index=False)
-            df_telefaxNummer.to_parquet(f"{base_path}_telefaxNummer.parquet", index=False)
-            df_elektroniskPost.to_parquet(f"{base_path}_elektroniskPost.parquet", index=False)
-            df_hjemmeside.to_parquet(f"{base_path}_hjemmeside.parquet", index=False)
-            df_virksomhedsform.to_parquet(f"{base_path}_virksomhedsform.parquet", index=False)
-            df_regNummer.to_parquet(f"{base_path}_regNummer.parquet", index=False)
-            df_livsforloeb.to_parquet(f"{base_path}_livsforloeb.parquet", index=False)
-            df_deltagerRelation.to_parquet(f"{base_path}_deltagerRelation.parquet", index=False)
-            df_attributter.to_parquet(f"{base_path}_attributter.parquet", index=False)
-
-            print(f"\nSaved {22} parquet files to {company_data_folder_path}")
+        if normalize_relations:
+            panel.add_frame('deltagerRelation_deltager', relation_normalizer.participant_table())
+        tables = panel.finish(write=write_parquet)
+
+        if write_parquet:
+            print(f"\nSaved {len(tables)} parquet files to {company_data_folder_path}")
+            if dataset_root:
+                for name in tables:
+                    publish(os.path.join(company_data_folder_path, f"{output_filename}_{name}.parquet"), name)
+                print(f"Published {len(tables)} tables to {dataset_root}")
         else:
             # Save as JSON
             file_path = os.path.join(company_data_folder_path, f"{output_filename}_raw.json")
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(all_results, f, ensure_ascii=False, indent=4)
+            with metrics.stage("write/raw_json", rows=len(all_results)):
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(all_results, f, ensure_ascii=False, indent=4)
             print(f"Saved raw JSON to {file_path}")
 
-        print("\nPanel dataframes created:")
-        print(f"  - Main: {df_main.shape}")
-        print(f"  - Names (navne): {df_navne.shape}")
-        print(f"  - Secondary names (binavne): {df_binavne.shape}")
-        print(f"  - Business address (beliggenhedsadresse): {df_beliggenhedsadresse.shape}")
-        print(f"  - Postal address (postadresse): {df_postadresse.shape}")
-        print(f"  - Main branch: {df_hovedbranche.shape}")
-        print(f"  - Secondary branches (1-3): {df_bibranche1.shape}, {df_bibranche2.shape}, {df_bibranche3.shape}")
-        print(f"  - Employment (year/quarter/month): {df_aarsbeskaeftigelse.shape}, {df_kvartalsbeskaeftigelse.shape}, {df_maanedsbeskaeftigelse.shape}")
-        print(f"  - Company status (virksomhedsstatus): {df_virksomhedsstatus.shape}")
-        print(f"  - Phone (telefonNummer): {df_telefonNummer.shape}")
-        print(f"  - Fax (telefaxNummer): {df_telefaxNummer.shape}")
-        print(f"  - Email (elektroniskPost): {df_elektroniskPost.shape}")
-        print(f"  - Website (hjemmeside): {df_hjemmeside.shape}")
-        print(f"  - Company form (virksomhedsform): {df_virksomhedsform.shape}")
-        print(f"  - Registration number (regNummer): {df_regNummer.shape}")
-        print(f"  - Lifecycle (livsforloeb): {df_livsforloeb.shape}")
-        print(f"  - Participant relations (deltagerRelation): {df_deltagerRelation.shape}")
-        print(f"  - Attributes (attributter): {df_attributter.shape}")
-
-        return {
-            'main': df_main,
-            'navne': df_navne,
-            'binavne': df_binavne,
-            'beliggenhedsadresse': df_beliggenhedsadresse,
-            'postadresse': df_postadresse,
-            'hovedbranche': df_hovedbranche,
-            'bibranche1': df_bibranche1,
-            'bibranche2': df_bibranche2,
-            'bibranche3': df_bibranche3,
-            'aarsbeskaeftigelse': df_aarsbeskaeftigelse,
-            'kvartalsbeskaeftigelse': df_kvartalsbeskaeftigelse,
-            'maanedsbeskaeftigelse': df_maanedsbeskaeftigelse,
-            'virksomhedsstatus': df_virksomhedsstatus,
-            'telefonNummer': df_telefonNummer,
-            'telefaxNummer': df_telefaxNummer,
-            'elektroniskPost': df_elektroniskPost,
-            'hjemmeside': df_hjemmeside,
-            'virksomhedsform': df_virksomhedsform,
-            'regNummer': df_regNummer,
-            'livsforloeb': df_livsforloeb,
-            'deltagerRelation': df_deltagerRelation,
-            'attributter': df_attributter
-        }
+        print("\nPanel tables created:")
+        for name, table in tables.items():
+            print(f"  - {name}: {table if isinstance(table, str) else table.shape}")
+
+        metrics.finish(metrics_path, prometheus_path)
+        return tables
+
+    elif output_mode == "nested" and write_parquet:
+        file_path = os.path.join(company_data_folder_path, f"{output_filename}_nested.parquet")
+        print(f"Saving nested data as parquet to {file_path}...")
+        with metrics.stage("write/nested") as stage:
+            table = combine_nested_tables(nested_pages)
+            nested_pages.clear()
+            pq.write_table(table, file_path)
+            stage["rows"] = table.num_rows
+            stage["bytes"] = os.path.getsize(file_path)
+        print(f"Nested table shape: ({table.num_rows}, {table.num_columns})")
+        if dataset_root:
+            publish(file_path, "nested")
+
+        print("Data saved successfully!")
+        metrics.finish(metrics_path, prometheus_path)
+        return table
 
-    else:  # wide format
-        df_flattened = flatten_permanent_data_wide(all_results)
+    else:  # wide format (or nested format saved as JSON)
+        with metrics.stage("explode/wide") as stage:
+            df_flattened = flatten_permanent_data_wide(all_results)
+            stage["rows"] = len(df_flattened)
         print(f"Flattened DataFrame shape: {df_flattened.shape}")
         print(f"Columns: {len(df_flattened.columns)}")
 
@@ -766,15 +1177,21 @@ def main(virk_username=VIRK_USERNAME,
         if save_format.lower() == "parquet":
             file_path = os.path.join(company_data_folder_path, f"{output_filename}_wide.parquet")
             print(f"Saving data as parquet to {file_path}...")
-            df_flattened.to_parquet(file_path, index=False)
+            with metrics.stage("write/wide", rows=len(df_flattened)) as stage:
+                pq.write_table(conform(df_flattened, schema_for(df_flattened.columns)), file_path)
+                stage["bytes"] = os.path.getsize(file_path)
+            if dataset_root:
+                publish(file_path, "wide")
         else:
             # Fallback to JSON
             file_path = os.path.join(company_data_folder_path, f"{output_filename}_raw.json")
             print(f"Saving data as JSON to {file_path}...")
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(all_results, f, ensure_ascii=False, indent=4)
+            with metrics.stage("write/raw_json", rows=len(all_results)):
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(all_results, f, ensure_ascii=False, indent=4)
 
         print("Data saved successfully!")
+        metrics.finish(metrics_path, prometheus_path)
         return df_flattened
 
 
@@ -785,8 +1202,28 @@ if __name__ == "__main__":
     parser.add_argument('--year', type=int, help='Filter data by specific year')
     parser.add_argument('--format', choices=['parquet', 'json'], default='parquet',
                         help='Output format (default: parquet)')
-    parser.add_argument('--mode', choices=['panel', 'wide'], default='panel',
-                        help='Output mode: panel (multiple files with temporal data) or wide (single flat file). Default: panel')
+    parser.add_argument('--mode', choices=['panel', 'wide', 'nested'], default='panel',
+                        help='Output mode: panel (multiple files with temporal data), wide (single flat file with JSON strings) '
+                             'or nested (single file with native list/struct columns). Default: panel')
+    parser.add_argument('--memory-budget', type=int,
+                        help='Panel mode: MB of exploded rows to keep in memory before spilling the largest tables to disk')
+    parser.add_argument('--normalize-relations', action='store_true',
+                        help='Panel mode: write deltagerRelation as participant, organisation and attribute tables with integer keys')
+    parser.add_argument('--translate', action='store_true',
+                        help='Panel mode: write English column names and values (utils/translations.py)')
+    parser.add_argument('--dataset-root', help='Also write the outputs into this hive-partitioned dataset (needs --year)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only estimate the size, peak memory and wall time of the run from a few sample pages')
+    parser.add_argument('--metrics-json', help='Path of the JSON run report (default: next to the output files)')
+    parser.add_argument('--prometheus-textfile', help='Also write the run metrics as a Prometheus textfile')
+    parser.add_argument('--profile', choices=PROFILERS, help='Profile every stage with cProfile or pyinstrument')
+    parser.add_argument('--profile-dir', help='Folder for the per-stage profiles (default: the output folder)')
     args = parser.parse_args()
 
-    main(year=args.year, save_format=args.format, output_mode=args.mode)
+    result = main(year=args.year, save_format=args.format, output_mode=args.mode,
+                  metrics_path=args.metrics_json, prometheus_path=args.prometheus_textfile,
+                  profile=args.profile, profile_dir=args.profile_dir, memory_budget=args.memory_budget,
+                  normalize_relations=args.normalize_relations, translate=args.translate,
+                  dataset_root=args.dataset_root, dry_run=args.dry_run)
+    if result is None:
+        sys.exit(1)